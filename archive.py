@@ -0,0 +1,371 @@
+import glob
+import json
+import os
+import sqlite3
+import threading
+from time import time
+
+from block import Block
+from key_dictionary import KeyDictionary
+from storage.base import Storage
+from tally import Tally
+from vote_columns import VoteColumns, analytics
+from utility.hash_util import hash_block
+from utility.merkle import hash_vote, merkle_proof, merkle_root
+from blockchain import parse_cursor
+
+# The votes of an archive (mining rewards excluded), indexed for the
+# queries by signature, voter and candidate
+INDEX_SCHEMA = """
+CREATE TABLE votes (
+    height INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    voter TEXT NOT NULL,
+    candidate TEXT NOT NULL,
+    signature TEXT NOT NULL,
+    PRIMARY KEY (height, position)
+);
+CREATE INDEX votes_signature ON votes (signature);
+CREATE INDEX votes_voter ON votes (voter);
+CREATE INDEX votes_candidate ON votes (candidate, height, position);
+"""
+
+
+class ElectionArchive:
+    """The read-only archive of a finalized election. It holds the final
+    tally and the hash and merkle root of every block, so queries are
+    answered without the chain. The blocks are kept in a separate file, one
+    per line, and read one at a time (located by their offsets) for the
+    queries which need them. The votes are found through an SQLite index
+    on disk, so the voters and signatures are not held in memory.
+
+    Nothing in an archive changes after it was loaded, so it is shared by
+    all requests; only the connection to the index is guarded by a lock.
+
+    Attributes:
+        :node_id: The node (port) the election is running on.
+        :election_id: The finalized election.
+        :public_key: The key of the node (for balance queries).
+        :settings: The settings the election ran with.
+        :height: The number of blocks the election was sealed with.
+        :finalized: When the election was finalized.
+        :tally: The final tally.
+        :block_hashes: The hash of every block.
+        :merkle_roots: The merkle root of every block (None without votes),
+        computed for blocks which were created without one as well.
+    """
+    # Finalized elections neither keep open votes nor gossip
+    seen = frozenset()
+    resolve_conflicts = False
+
+    def __init__(self, node_id, election_id, data, public_key=None):
+        self.node_id = node_id
+        self.election_id = election_id
+        self.public_key = public_key
+        self.settings = data['settings']
+        self.height = data['height']
+        self.finalized = data['finalized']
+        self.tally = Tally.from_dict(data['tally'])
+        self.block_hashes = data['block_hashes']
+        self.merkle_roots = data['merkle_roots']
+        self.__offsets = data['offsets']
+        self.__lock = threading.Lock()
+        self.__index = sqlite3.connect(
+            self.index_filename(node_id, election_id),
+            check_same_thread=False)
+        self.__columns = None
+
+    @staticmethod
+    def filename(node_id, election_id):
+        return 'archive-{}-{}.json'.format(node_id, election_id)
+
+    @staticmethod
+    def blocks_filename(node_id, election_id):
+        return 'archive-{}-{}.blocks'.format(node_id, election_id)
+
+    @staticmethod
+    def index_filename(node_id, election_id):
+        return 'archive-{}-{}.index'.format(node_id, election_id)
+
+    @classmethod
+    def exists(cls, node_id, election_id):
+        return os.path.exists(cls.filename(node_id, election_id))
+
+    @staticmethod
+    def discover(node_id):
+        """Return the ids of all elections archived by a node."""
+        prefix = 'archive-{}-'.format(node_id)
+        return Storage.parse_election_ids(
+            glob.glob(glob.escape(prefix) + '*.json'), prefix, '.json')
+
+    @classmethod
+    def load(cls, node_id, election_id, public_key=None):
+        """Load the archive of a finalized election.
+
+        Arguments:
+            :node_id: The node (port) the election is running on.
+            :election_id: The finalized election.
+            :public_key: The key of the node.
+        """
+        with open(cls.filename(node_id, election_id), mode='r') as f:
+            data = json.load(f)
+        if 'voters' in data:
+            # Older archives hold the voters (and either the blocks or the
+            # signatures) in the archive file, they are rewritten once
+            del data['voters']
+            if 'chain' in data:
+                packed = data.pop('chain')
+            else:
+                with open(cls.blocks_filename(node_id, election_id),
+                          mode='rb') as f:
+                    packed = {'keys': data.pop('keys'),
+                              'chain': [json.loads(line) for line in f]}
+                del data['signatures'], data['offsets']
+            packer = KeyDictionary(packed['keys'])
+            data = cls.write(
+                node_id, election_id, data,
+                [Block.from_dict(block, packer) for block in packed['chain']])
+        return cls(node_id, election_id, data, public_key)
+
+    @classmethod
+    def write(cls, node_id, election_id, data, chain):
+        """Write the blocks file, the vote index and the archive file and
+        return the data of the archive (with the offsets of the blocks).
+
+        Arguments:
+            :node_id: The node (port) the election is running on.
+            :election_id: The finalized election.
+            :data: The tally, hashes and settings of the archive.
+            :chain: The blocks of the archive.
+        """
+        offsets = []
+        blocks_filename = cls.blocks_filename(node_id, election_id)
+        with open(blocks_filename + '.tmp', mode='wb') as f:
+            for block in chain:
+                offsets.append(f.tell())
+                f.write(json.dumps(block.to_dict()).encode() + b'\n')
+        os.replace(blocks_filename + '.tmp', blocks_filename)
+        index_filename = cls.index_filename(node_id, election_id)
+        if os.path.exists(index_filename + '.tmp'):
+            os.remove(index_filename + '.tmp')
+        connection = sqlite3.connect(index_filename + '.tmp')
+        try:
+            with connection:
+                connection.executescript(INDEX_SCHEMA)
+                connection.executemany(
+                    'INSERT INTO votes VALUES (?, ?, ?, ?, ?)',
+                    ((block.index, position, vt.voter, vt.candidate,
+                      vt.signature)
+                     for block in chain
+                     for position, vt in enumerate(block.votes)
+                     if vt.voter != 'MINING'))
+        finally:
+            connection.close()
+        os.replace(index_filename + '.tmp', index_filename)
+        data = dict(data, offsets=offsets)
+        # The archive file is replaced last, it is only used once the
+        # blocks and the index it refers to were written completely
+        filename = cls.filename(node_id, election_id)
+        with open(filename + '.tmp', mode='w') as f:
+            json.dump(data, f)
+        os.replace(filename + '.tmp', filename)
+        return data
+
+    @classmethod
+    def seal(cls, blockchain, height=None):
+        """Compact the first blocks of an election into an archive and
+        return the loaded archive. Open votes and later blocks are left
+        out. Raises a ValueError for heights the chain does not have.
+
+        Arguments:
+            :blockchain: The election which is finalized.
+            :height: The number of blocks the election is sealed with
+            (default: all).
+        """
+        if height is None:
+            height = blockchain.get_height()
+        if not 1 <= height <= blockchain.get_height():
+            raise ValueError('The chain has no block at this height')
+        chain = blockchain.chain[:height]
+        tally = Tally()
+        block_hashes, merkle_roots = [], []
+        for block in chain:
+            tally.apply_block(block)
+            block_hashes.append(hash_block(block))
+            merkle_roots.append(merkle_root(block.votes))
+        data = {
+            'settings': blockchain.settings,
+            'height': len(block_hashes),
+            'finalized': time(),
+            'tally': tally.to_dict(),
+            'block_hashes': block_hashes,
+            'merkle_roots': merkle_roots
+        }
+        data = cls.write(
+            blockchain.node_id, blockchain.election_id, data, chain)
+        return cls(blockchain.node_id, blockchain.election_id, data,
+                   blockchain.public_key)
+
+    def __query(self, sql, parameters):
+        with self.__lock:
+            return self.__index.execute(sql, parameters).fetchall()
+
+    def __read_blocks(self, start=0):
+        """Read the blocks from the given index on."""
+        if start >= self.height:
+            return []
+        with open(self.blocks_filename(self.node_id, self.election_id),
+                  mode='rb') as f:
+            f.seek(self.__offsets[start])
+            return [Block.from_dict(json.loads(line)) for line in f]
+
+    def read_block(self, index):
+        """Read a single block from the blocks file."""
+        with open(self.blocks_filename(self.node_id, self.election_id),
+                  mode='rb') as f:
+            f.seek(self.__offsets[index])
+            return Block.from_dict(json.loads(f.readline()))
+
+    def read_chain(self):
+        """Read all blocks from the blocks file."""
+        return self.__read_blocks()
+
+    @property
+    def chain(self):
+        return self.read_chain()
+
+    def pack_chain(self, start=0):
+        packer = KeyDictionary()
+        chain = [block.to_dict(packer) for block in self.__read_blocks(start)]
+        return {'keys': packer.keys, 'chain': chain}
+
+    def get_block_hashes(self):
+        return self.block_hashes[:]
+
+    def get_tip_hash(self):
+        return self.block_hashes[-1]
+
+    def get_height(self):
+        return self.height
+
+    def get_version(self):
+        return 'archive-{}'.format(self.get_tip_hash())
+
+    def get_unverified_votes(self):
+        return []
+
+    def get_peer_nodes(self):
+        return []
+
+    def get_peer_health(self):
+        return []
+
+    def wants(self, item_type, digest):
+        return False
+
+    def get_balance(self, voter=None):
+        participant = voter if voter is not None else self.public_key
+        if participant is None:
+            return None
+        return (self.tally.get_received(participant) -
+                self.tally.get_sent(participant))
+
+    def get_totalmines(self, voter=None):
+        participant = voter if voter is not None else self.public_key
+        if participant is None:
+            return None
+        return self.tally.mined.get(participant, 0)
+
+    def get_is_vote(self, voter=None):
+        participant = voter if voter is not None else self.public_key
+        if participant is None:
+            return None
+        return self.tally.get_sent(participant) >= 1
+
+    def get_results(self, candidate):
+        if candidate is None:
+            return None
+        return self.tally.get_results(candidate)
+
+    def get_all_results(self):
+        return dict(self.tally.results)
+
+    def get_results_count(self, candidate):
+        if candidate is None:
+            return None
+        return self.tally.get_count(candidate)
+
+    def get_results_voters(self, candidate):
+        if candidate is None:
+            return None
+        grouped = [[] for _ in range(self.height)]
+        for index, voter in self.__query(
+                'SELECT height, voter FROM votes WHERE candidate = ? '
+                'ORDER BY height, position', (candidate,)):
+            grouped[index].append(voter)
+        return grouped
+
+    def get_results_voters_page(self, candidate, cursor=None, limit=100):
+        """See Blockchain.get_results_voters_page."""
+        if candidate is None:
+            return None
+        if limit < 1:
+            raise ValueError('The page limit must be positive')
+        height, position = parse_cursor(cursor)
+        page = self.__query(
+            'SELECT height, position, voter FROM votes '
+            'WHERE candidate = ? AND (height > ? OR '
+            '(height = ? AND position > ?)) '
+            'ORDER BY height, position LIMIT ?',
+            (candidate, height, height, position, limit + 1))
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = '{}.{}'.format(page[-1][0], page[-1][1])
+        return [voter for _, _, voter in page], next_cursor
+
+    def get_vote_history(self, voter):
+        if voter is None:
+            return None
+        history = []
+        block = None
+        for index, position in self.__query(
+                'SELECT height, position FROM votes WHERE voter = ? '
+                'ORDER BY height, position', (voter,)):
+            if block is None or block.index != index:
+                block = self.read_block(index)
+            history.append((index, block.votes[position]))
+        return history
+
+    def get_vote_proof(self, signature):
+        """See Blockchain.get_vote_proof. Blocks which were created without
+        a merkle root are proven against the root computed at sealing; the
+        header is returned as it was hashed."""
+        if not signature:
+            return None
+        # A signature which occurs twice is proven in its last block
+        rows = self.__query(
+            'SELECT height, position FROM votes WHERE signature = ? '
+            'ORDER BY height DESC, position DESC LIMIT 1', (signature,))
+        if not rows:
+            return None
+        index, position = rows[0]
+        block = self.read_block(index)
+        vt = block.votes[position]
+        header = block.__dict__.copy()
+        del header['votes']
+        return {
+            'block': header,
+            'hash': self.block_hashes[index],
+            'merkle_root': self.merkle_roots[index],
+            'vote': vt.__dict__,
+            'leaf': hash_vote(vt),
+            'proof': merkle_proof(block.votes, position)
+        }
+
+    def get_analytics(self, bucket, candidate=None):
+        """See Blockchain.get_analytics."""
+        if self.__columns is None:
+            self.__columns = VoteColumns.from_chain(
+                self.read_chain(), KeyDictionary())
+        return analytics(self.__columns, bucket, candidate)
@@ -0,0 +1,329 @@
+"""Serves the node from an asyncio event loop.
+
+The event loop accepts the connections and reads the requests (HTTP/1.1
+with keep-alive), so idle and slow clients only cost a coroutine instead of
+a thread, and thousands of them can be connected at once. Every complete
+request is passed to an ASGI application. WsgiToAsgi runs the Flask
+application behind that interface in a pool of handler threads, so the
+routes stay the same in both server modes.
+
+The handler threads bound how many requests are processed at the same
+time (--handler-threads). Requests to peers are sent from the event loop:
+gossip does not wait for them at all, and resolving conflicts asks all
+peers at once, but its handler keeps its thread until the peers answered.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from http import HTTPStatus
+import io
+import signal
+import sys
+from urllib.parse import unquote
+
+from utility.async_http import read_body, read_headers
+from utility.compression import MAX_BODY_SIZE, BodyTooLarge
+from utility.logger import get_logger
+
+# How long an idle keep-alive connection is kept open (seconds)
+KEEP_ALIVE_TIMEOUT = 15
+# How long a client may take to send a request once it started (seconds)
+REQUEST_TIMEOUT = 30
+# Connections the operating system queues before they are accepted
+LISTEN_BACKLOG = 2048
+
+logger = get_logger(__name__)
+
+
+def build_environ(scope, body):
+    """Return the WSGI environ of an ASGI http scope."""
+    server = scope.get('server') or ('localhost', None)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        # WSGI passes the path as bytes decoded as latin-1
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 0),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        if name in environ:
+            value = environ[name] + ',' + value
+        environ[name] = value
+    # The body was read completely (chunked bodies are decoded already)
+    environ['CONTENT_LENGTH'] = str(len(body))
+    environ.pop('HTTP_TRANSFER_ENCODING', None)
+    return environ
+
+
+def call_wsgi(app, environ):
+    """Call a WSGI application and return (status, headers, body) of its
+    response."""
+    response = []
+
+    def start_response(status, headers, exc_info=None):
+        response[:] = [int(status.split(' ')[0]), headers]
+
+    result = app(environ, start_response)
+    try:
+        body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return response[0], response[1], body
+
+
+class WsgiToAsgi:
+    """An ASGI application which runs a WSGI application in a pool of
+    threads, so a handler blocking on storage or locks does not stall the
+    event loop.
+
+    Attributes:
+        :app: The WSGI application.
+    """
+
+    def __init__(self, app, threads=32, on_start=None):
+        """
+        Arguments:
+            :app: The WSGI application.
+            :threads: The number of requests handled at the same time.
+            :on_start: Called with the event loop when the server starts.
+        """
+        self.app = app
+        self.__executor = ThreadPoolExecutor(
+            threads, thread_name_prefix='handler')
+        self.__on_start = on_start
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        body = b''
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get('body', b'')
+            more_body = message.get('more_body', False)
+        status, headers, content = await asyncio.get_running_loop(
+            ).run_in_executor(self.__executor, call_wsgi, self.app,
+                              build_environ(scope, body))
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(name.lower().encode('latin-1'),
+                         value.encode('latin-1'))
+                        for name, value in headers]
+        })
+        await send({'type': 'http.response.body', 'body': content})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if self.__on_start is not None:
+                    self.__on_start(asyncio.get_running_loop())
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.__executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def encode_response(status, headers, body, keep_alive):
+    """Return the bytes of an HTTP/1.1 response."""
+    try:
+        reason = HTTPStatus(status).phrase
+    except ValueError:
+        reason = ''
+    lines = ['HTTP/1.1 {} {}'.format(status, reason),
+             'Date: ' + formatdate(usegmt=True),
+             'Content-Length: {}'.format(len(body))]
+    if not keep_alive:
+        lines.append('Connection: close')
+    lines += ['{}: {}'.format(name.decode('latin-1'), value.decode('latin-1'))
+              for name, value in headers
+              if name not in (b'content-length', b'connection')]
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+
+async def read_request(request_line, reader, writer, max_body_size):
+    """Read the rest of a request and return (method, target, version,
+    headers, body). Raises a BodyTooLarge error for bodies larger than
+    max_body_size."""
+    method, target, version = request_line.decode('latin-1').split()
+    headers = await read_headers(reader)
+    if headers.get('expect', '').lower() == '100-continue':
+        writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+    # Requests without a length have no body (they are not read to EOF)
+    if ('content-length' in headers or
+            headers.get('transfer-encoding', '').lower() == 'chunked'):
+        body = await read_body(reader, headers, max_body_size)
+    else:
+        body = b''
+    return method, target, version, headers, body
+
+
+async def handle_connection(app, reader, writer, server,
+                            max_body_size=MAX_BODY_SIZE):
+    """Serve the requests of one connection until it is closed."""
+    peer = writer.get_extra_info('peername')
+    # Unix sockets have no address of the client
+    client = peer[:2] if isinstance(peer, tuple) else ('', 0)
+    try:
+        while True:
+            try:
+                request_line = await asyncio.wait_for(
+                    reader.readline(), KEEP_ALIVE_TIMEOUT)
+                if not request_line.strip():
+                    return
+                request = await asyncio.wait_for(
+                    read_request(request_line, reader, writer, max_body_size),
+                    REQUEST_TIMEOUT)
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+                return
+            except BodyTooLarge:
+                # The rest of the body is not read, the connection closes
+                writer.write(encode_response(413, [], b'', False))
+                return
+            except ValueError:
+                writer.write(encode_response(400, [], b'', False))
+                return
+            method, target, version, headers, body = request
+            connection = headers.get('connection', '').lower()
+            keep_alive = (connection != 'close' if version == 'HTTP/1.1'
+                          else connection == 'keep-alive')
+            path, _, query = target.partition('?')
+            scope = {
+                'type': 'http',
+                'asgi': {'version': '3.0'},
+                'http_version': version.split('/')[-1],
+                'method': method,
+                'scheme': 'http',
+                'path': unquote(path),
+                'raw_path': path.encode('latin-1'),
+                'query_string': query.encode('latin-1'),
+                'root_path': '',
+                'headers': [(name.encode('latin-1'), value.encode('latin-1'))
+                            for name, value in headers.items()],
+                'client': client,
+                'server': server
+            }
+            response = {}
+
+            async def receive():
+                return {'type': 'http.request', 'body': body,
+                        'more_body': False}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    response['status'] = message['status']
+                    response['headers'] = message.get('headers', [])
+                    response['body'] = b''
+                else:
+                    response['body'] += message.get('body', b'')
+
+            try:
+                await app(scope, receive, send)
+            except Exception:
+                logger.exception('Request %s %s failed', method, path)
+                response = {'status': 500, 'headers': [], 'body': b''}
+                keep_alive = False
+            writer.write(encode_response(
+                response['status'], response['headers'], response['body'],
+                keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                return
+    except (ConnectionError, asyncio.CancelledError):
+        # The client went away or the server is shutting down
+        return
+    finally:
+        writer.close()
+
+
+async def start_lifespan(app):
+    """Run the startup of an ASGI application and return a coroutine
+    function which shuts it down."""
+    queue = asyncio.Queue()
+    await queue.put({'type': 'lifespan.startup'})
+    started = asyncio.Event()
+    stopped = asyncio.Event()
+
+    async def send(message):
+        if message['type'] == 'lifespan.startup.complete':
+            started.set()
+        elif message['type'] == 'lifespan.shutdown.complete':
+            stopped.set()
+
+    task = asyncio.ensure_future(
+        app({'type': 'lifespan', 'asgi': {'version': '3.0'}}, queue.get,
+            send))
+    await started.wait()
+
+    async def shutdown():
+        await queue.put({'type': 'lifespan.shutdown'})
+        await stopped.wait()
+        await task
+
+    return shutdown
+
+
+async def run_server(app, host, port, socket_path, max_body_size):
+    shutdown = await start_lifespan(app)
+    if socket_path is not None:
+        server_address = (socket_path, None)
+        server = await asyncio.start_unix_server(
+            lambda reader, writer: handle_connection(
+                app, reader, writer, server_address, max_body_size),
+            socket_path, backlog=LISTEN_BACKLOG)
+    else:
+        server_address = (host, port)
+        server = await asyncio.start_server(
+            lambda reader, writer: handle_connection(
+                app, reader, writer, server_address, max_body_size),
+            host, port, backlog=LISTEN_BACKLOG)
+    logger.info('Serving on %s', socket_path or '{}:{}'.format(host, port))
+    serving = asyncio.ensure_future(server.serve_forever())
+    # Stop accepting and shut the application down on SIGINT and SIGTERM
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, serving.cancel)
+    try:
+        await serving
+    except asyncio.CancelledError:
+        pass
+    finally:
+        server.close()
+        await shutdown()
+
+
+def serve(app, host='0.0.0.0', port=8900, socket_path=None,
+          max_body_size=MAX_BODY_SIZE):
+    """Serve an ASGI application until the process is interrupted.
+
+    Arguments:
+        :app: The ASGI application (e.g. a WsgiToAsgi).
+        :host: The address to listen on.
+        :port: The port to listen on.
+        :socket_path: A Unix socket to listen on instead of the port.
+        :max_body_size: The largest request body which is read (larger
+        ones are answered with 413).
+    """
+    asyncio.run(run_server(app, host, port, socket_path, max_body_size))
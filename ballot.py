@@ -1,9 +1,39 @@
-from Crypto.PublicKey import RSA
-from Crypto.Signature import PKCS1_v1_5
+from functools import lru_cache
+from Crypto.PublicKey import ECC, RSA
+from Crypto.Signature import PKCS1_v1_5, eddsa
 from Crypto.Hash import SHA256
 import Crypto.Random
 import binascii
 
+from utility.metrics import SIGNATURE_VERIFICATIONS
+from utility.logger import get_logger
+from utility import offload
+from utility.tracing import tracer
+
+logger = get_logger(__name__)
+
+# The signature schemes a vote can be signed with. RSA is the original
+# scheme, Ed25519 keys and signatures are much shorter and faster to verify.
+SCHEMES = ('rsa', 'ed25519')
+
+
+@lru_cache(maxsize=4096)
+def import_public_key(scheme, public_key):
+    """Import a hex encoded public key once and reuse it afterwards.
+
+    Arguments:
+        :scheme: The signature scheme of the key.
+        :public_key: The hex encoded public key.
+    """
+    if scheme == 'ed25519':
+        return eddsa.import_public_key(binascii.unhexlify(public_key))
+    return RSA.importKey(binascii.unhexlify(public_key))
+
+
+def vote_message(voter, candidate, amount):
+    """Return the bytes a vote signature is created for."""
+    return (str(voter) + str(candidate) + str(amount)).encode('utf8')
+
 
 class Ballot:
     """Creates, loads and holds private and public keys.
@@ -30,7 +60,8 @@ class Ballot:
                     f.write(self.private_key)
                 return True
             except (IOError, IndexError):
-                print('Saving ballot failed...')
+                logger.exception(
+                    'Saving the keys of node %s failed', self.node_id)
                 return False
 
     def load_keys(self):
@@ -44,11 +75,23 @@ class Ballot:
                 self.private_key = private_key
             return True
         except (IOError, IndexError):
-            print('Loading ballot failed...')
+            logger.warning('No keys stored for node %s', self.node_id)
             return False
 
-    def generate_keys(self):
-        """Generate a new pair of private and public key."""
+    def generate_keys(self, scheme='rsa'):
+        """Generate a new pair of private and public key.
+
+        Arguments:
+            :scheme: The signature scheme the keys are used with.
+        """
+        if scheme == 'ed25519':
+            private_key = ECC.generate(curve='Ed25519')
+            return (
+                binascii.hexlify(private_key.seed).decode('ascii'),
+                binascii
+                .hexlify(private_key.public_key().export_key(format='raw'))
+                .decode('ascii')
+            )
         private_key = RSA.generate(1024, Crypto.Random.new().read)
         public_key = private_key.publickey()
         return (
@@ -60,30 +103,108 @@ class Ballot:
             .decode('ascii')
         )
 
-    def sign_vote(self, voter, voter_private_key, candidate, amount=1):
+    def sign_vote(self, voter, voter_private_key, candidate, amount=1,
+                  scheme='rsa'):
         """Sign a vote and return the signature.
 
         Arguments:
             :voter: The voter of the vote.
             :candidate: The candidate of the vote.
             :amount: The amount of the vote.
+            :scheme: The signature scheme of the voter's keys.
         """
-        signer = PKCS1_v1_5.new(RSA.importKey(
-            binascii.unhexlify(voter_private_key)))
-        h = SHA256.new((str(voter) + str(candidate) +
-                       str(amount)).encode('utf8'))
-        signature = signer.sign(h)
-        return binascii.hexlify(signature).decode('ascii')
+        return Ballot.sign_message(
+            voter_private_key, vote_message(voter, candidate, amount), scheme)
 
     @staticmethod
+    @tracer.span('verify_vote')
     def verify_vote(vote):
         """Verify the signature of a vote.
 
         Arguments:
             :vote: The vote that should be verified.
         """
-        public_key = RSA.importKey(binascii.unhexlify(vote.voter))
-        verifier = PKCS1_v1_5.new(public_key)
-        h = SHA256.new((str(vote.voter) + str(vote.candidate) +
-                       str(vote.amount)).encode('utf8'))
-        return verifier.verify(h, binascii.unhexlify(vote.signature))
+        return Ballot.verify_message(
+            vote.voter,
+            vote_message(vote.voter, vote.candidate, vote.amount),
+            vote.signature,
+            vote.scheme)
+
+    @staticmethod
+    def check_votes(votes):
+        """Return whether the signature of each vote is valid, without
+        counting the checks (used in worker processes).
+
+        Arguments:
+            :votes: The votes that should be checked.
+        """
+        return [Ballot.check_message(
+            vote.voter,
+            vote_message(vote.voter, vote.candidate, vote.amount),
+            vote.signature,
+            vote.scheme) for vote in votes]
+
+    @staticmethod
+    @tracer.span('verify_vote')
+    def verify_votes(votes):
+        """Verify the signatures of a batch of votes, in a worker process
+        if one is configured (see utility.offload).
+
+        Arguments:
+            :votes: The votes that should be verified.
+        """
+        results = offload.run(Ballot.check_votes, votes)
+        for vote, valid in zip(votes, results):
+            SIGNATURE_VERIFICATIONS.inc(
+                scheme=vote.scheme, valid=str(valid).lower())
+        return results
+
+    @staticmethod
+    def sign_message(private_key, message, scheme='rsa'):
+        """Sign arbitrary bytes and return the hex encoded signature.
+
+        Arguments:
+            :private_key: The hex encoded private key.
+            :message: The bytes which should be signed.
+            :scheme: The signature scheme of the key.
+        """
+        if scheme == 'ed25519':
+            signer = eddsa.new(eddsa.import_private_key(
+                binascii.unhexlify(private_key)), 'rfc8032')
+            signature = signer.sign(message)
+        else:
+            signer = PKCS1_v1_5.new(RSA.importKey(
+                binascii.unhexlify(private_key)))
+            signature = signer.sign(SHA256.new(message))
+        return binascii.hexlify(signature).decode('ascii')
+
+    @staticmethod
+    def verify_message(public_key, message, signature, scheme='rsa'):
+        """Verify the signature of arbitrary bytes.
+
+        Arguments:
+            :public_key: The hex encoded public key of the signer.
+            :message: The bytes which were signed.
+            :signature: The hex encoded signature.
+            :scheme: The signature scheme of the key.
+        """
+        valid = Ballot.check_message(public_key, message, signature, scheme)
+        SIGNATURE_VERIFICATIONS.inc(scheme=scheme, valid=str(valid).lower())
+        return valid
+
+    @staticmethod
+    def check_message(public_key, message, signature, scheme='rsa'):
+        """Verify the signature of arbitrary bytes without counting the
+        check (see verify_message for the arguments)."""
+        try:
+            key = import_public_key(scheme, public_key)
+            signature = binascii.unhexlify(signature)
+            if scheme == 'ed25519':
+                eddsa.new(key, 'rfc8032').verify(message, signature)
+                valid = True
+            else:
+                verifier = PKCS1_v1_5.new(key)
+                valid = verifier.verify(SHA256.new(message), signature)
+        except (ValueError, TypeError, binascii.Error):
+            valid = False
+        return valid
@@ -0,0 +1,247 @@
+"""Times the hot paths of a node on synthetic elections.
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench --sizes 1000 10000 --output results.json
+    python -m benchmarks.bench --baseline results.json
+
+Every benchmark reports the best time per operation out of a few repeats.
+With --baseline the results are compared to an earlier run and the command
+exits with status 1 if a benchmark got slower than the threshold allows.
+"""
+
+from argparse import ArgumentParser
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+from time import perf_counter, time
+
+from ballot import Ballot, SCHEMES, import_public_key
+from blockchain import Blockchain
+from storage import BACKENDS
+from tally import Tally
+from utility.hash_util import hash_block
+from utility.verification import Verification
+from benchmarks.synthetic import CANDIDATES, load_election
+
+# The number of blocks a proof of work is searched for
+POW_BLOCKS = 10
+# Results queries are answered from the tally, so they are run in batches
+QUERY_ROUNDS = 1000
+
+
+def measure(function, operations, repeat):
+    """Run a benchmark a few times and return its best timing.
+
+    Arguments:
+        :function: Runs the benchmark once.
+        :operations: The number of operations one run performs.
+        :repeat: How often the benchmark is run.
+    """
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        function()
+        elapsed = perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return {
+        'seconds': best,
+        'operations': operations,
+        'per_op_us': best / operations * 1e6
+    }
+
+
+def bench_hashing(chain, repeat):
+    def run():
+        for block in chain:
+            hash_block(block)
+    return measure(run, len(chain), repeat)
+
+
+def bench_valid_proof(chain, repeat):
+    blocks = chain[1:]
+
+    def run():
+        for block in blocks:
+            Verification.valid_proof(
+                block.votes[:-1], block.previous_hash, block.proof)
+    return measure(run, len(blocks), repeat)
+
+
+def bench_proof_of_work(chain, repeat):
+    blocks = chain[1:POW_BLOCKS + 1]
+
+    def run():
+        for block in blocks:
+            proof = 0
+            while not Verification.valid_proof(
+                    block.votes[:-1], block.previous_hash, proof):
+                proof += 1
+    return measure(run, len(blocks), repeat)
+
+
+def bench_verify_vote(chain, repeat, sample):
+    votes = [vt for block in chain for vt in block.votes
+             if vt.voter != 'MINING'][:sample]
+
+    def run():
+        # Keys are imported again, like they are for new voters
+        import_public_key.cache_clear()
+        for vt in votes:
+            if not Ballot.verify_vote(vt):
+                raise ValueError('Synthetic vote did not verify')
+    return measure(run, len(votes), repeat)
+
+
+def bench_tally(chain, repeat):
+    votes = sum(len(block.votes) for block in chain)
+    return measure(lambda: Tally.from_chain(chain), votes, repeat)
+
+
+def bench_storage(chain, backend, repeat):
+    """Time saving, incrementally saving and loading a chain with a storage
+    backend and answering results queries from the loaded election."""
+    votes = sum(len(block.votes) for block in chain)
+    directory = tempfile.mkdtemp(prefix='ballot-bench-')
+    cwd = os.getcwd()
+    # The storage engines write to the working directory
+    os.chdir(directory)
+    try:
+        counter = [0]
+
+        def save():
+            counter[0] += 1
+            blockchain = Blockchain(
+                None, 'bench', counter[0], 'benchmark', backend)
+            blockchain.chain = chain
+            blockchain.save_data()
+        results = {'save_data': measure(save, votes, repeat)}
+
+        def load():
+            return Blockchain(None, 'bench', counter[0], None, backend)
+        results['load_data'] = measure(load, votes, repeat)
+
+        blockchain = load()
+        tip = chain[-1]
+
+        def save_block():
+            # Re-save the chain with its last block rewritten
+            blockchain.chain = chain[:-1]
+            blockchain.save_data()
+            blockchain.chain = chain[:-1] + [tip]
+            blockchain.save_data()
+        results['save_data_incremental'] = measure(
+            save_block, len(tip.votes), repeat)
+
+        def query():
+            for _ in range(QUERY_ROUNDS):
+                for candidate in CANDIDATES:
+                    blockchain.get_results(candidate)
+                blockchain.get_all_results()
+        results['get_results'] = measure(
+            query, QUERY_ROUNDS * (len(CANDIDATES) + 1), repeat)
+        return results
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def run_suite(size, args):
+    """Run all benchmarks on an election with the given number of votes."""
+    print('Preparing an election with {} votes...'.format(size))
+    chain = load_election(size, args.scheme, args.key_pool)
+    results = {
+        'hash_block': bench_hashing(chain, args.repeat),
+        'valid_proof': bench_valid_proof(chain, args.repeat),
+        'proof_of_work': bench_proof_of_work(chain, args.repeat),
+        'verify_vote': bench_verify_vote(
+            chain, args.repeat, args.verify_sample),
+        'tally_rebuild': bench_tally(chain, args.repeat)
+    }
+    for backend in args.backends:
+        for name, result in bench_storage(
+                chain, backend, args.repeat).items():
+            results['{}[{}]'.format(name, backend)] = result
+    return results
+
+
+def compare(current, baseline, threshold):
+    """Return the benchmarks which got slower than the threshold allows
+    as (size, name, ratio) tuples.
+
+    Arguments:
+        :current: The results of this run.
+        :baseline: The results of the run compared against.
+        :threshold: The tolerated slowdown (0.2 allows 20 %).
+    """
+    regressions = []
+    for size, benchmarks in current['results'].items():
+        for name, result in benchmarks.items():
+            try:
+                before = baseline['results'][size][name]['per_op_us']
+            except KeyError:
+                continue
+            ratio = result['per_op_us'] / before
+            print('{:>8} {:<32} {:>12.2f} us/op {:>7.2f}x'.format(
+                size, name, result['per_op_us'], ratio))
+            if ratio > 1 + threshold:
+                regressions.append((size, name, ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000],
+                        help='the numbers of votes of the elections '
+                        '(up to 1000000)')
+    parser.add_argument('--scheme', choices=SCHEMES, default='ed25519')
+    parser.add_argument('--key-pool', type=int, default=0,
+                        help='voter keys to cycle through (0 creates one '
+                        'per vote)')
+    parser.add_argument('--backends', nargs='+', choices=sorted(BACKENDS),
+                        default=sorted(BACKENDS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--verify-sample', type=int, default=1000,
+                        help='the number of votes whose signatures are '
+                        'verified')
+    parser.add_argument('--output', help='write the results to this file')
+    parser.add_argument('--baseline', help='compare against these results')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='the tolerated slowdown against the baseline')
+    args = parser.parse_args(argv)
+    current = {
+        'meta': {
+            'created': time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'scheme': args.scheme,
+            'key_pool': args.key_pool
+        },
+        'results': {}
+    }
+    for size in args.sizes:
+        current['results'][str(size)] = run_suite(size, args)
+    if args.output:
+        with open(args.output, mode='w') as f:
+            json.dump(current, f, indent=2)
+    if args.baseline is None:
+        for size, benchmarks in current['results'].items():
+            for name, result in benchmarks.items():
+                print('{:>8} {:<32} {:>12.2f} us/op'.format(
+                    size, name, result['per_op_us']))
+        return 0
+    with open(args.baseline, mode='r') as f:
+        baseline = json.load(f)
+    regressions = compare(current, baseline, args.threshold)
+    for size, name, ratio in regressions:
+        print('Regression: {} with {} votes is {:.2f}x slower'.format(
+            name, size, ratio))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
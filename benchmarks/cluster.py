@@ -0,0 +1,330 @@
+"""Runs a local cluster of nodes and reports end-to-end performance.
+
+Usage (from the repository root):
+
+    python -m benchmarks.cluster --nodes 4 --topology ring --votes 200
+
+The harness starts the nodes as separate processes on localhost, creates
+the same election on each and connects them. It then drives the workload
+and reports:
+
+- the vote throughput and the /vote latency
+- how long mined blocks take to reach every node
+- how long the cluster takes to agree on one chain after a partition heals
+"""
+
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from time import perf_counter, sleep
+
+import requests
+
+from ballot import Ballot, SCHEMES
+from storage import BACKENDS
+
+TOPOLOGIES = ('full', 'ring', 'line', 'star')
+ELECTION_ID = 1
+CANDIDATES = ('alice', 'bob', 'carol')
+# How long a node may take to start and a block to propagate (seconds)
+STARTUP_TIMEOUT = 30
+PROPAGATION_TIMEOUT = 30
+POLL_INTERVAL = 0.005
+NODE_SCRIPT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'node.py')
+
+
+def topology_edges(count, topology):
+    """Return the (from, to) node indexes of every peer connection. Every
+    connection is added in both directions.
+
+    Arguments:
+        :count: The number of nodes.
+        :topology: One of TOPOLOGIES.
+    """
+    if topology == 'full':
+        pairs = [(a, b) for a in range(count) for b in range(a + 1, count)]
+    elif topology == 'ring' and count > 2:
+        pairs = [(a, (a + 1) % count) for a in range(count)]
+    elif topology in ('ring', 'line'):
+        pairs = [(a, a + 1) for a in range(count - 1)]
+    else:
+        pairs = [(0, b) for b in range(1, count)]
+    edges = []
+    for a, b in pairs:
+        edges += [(a, b), (b, a)]
+    return edges
+
+
+def percentile(values, fraction):
+    """Return the nearest-rank percentile of a list of values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(
+        fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summary(values):
+    """Summarize durations (seconds) in milliseconds."""
+    if not values:
+        return None
+    return {
+        'p50': percentile(values, 0.5) * 1000,
+        'p99': percentile(values, 0.99) * 1000,
+        'max': max(values) * 1000,
+        'count': len(values)
+    }
+
+
+class Cluster:
+    """A set of node processes which share one election.
+
+    Attributes:
+        :urls: The base URLs of the nodes.
+        :directory: The working directory the nodes store their data in.
+    """
+
+    def __init__(self, count, base_port, storage, directory):
+        self.urls = ['http://127.0.0.1:{}'.format(base_port + index)
+                     for index in range(count)]
+        self.directory = directory
+        self.__processes = []
+        # The log files are closed once the nodes stopped
+        self.__logs = []
+        for index in range(count):
+            log = open(os.path.join(
+                directory, 'node-{}.log'.format(base_port + index)), 'w')
+            self.__logs.append(log)
+            self.__processes.append(subprocess.Popen(
+                [sys.executable, NODE_SCRIPT, '-p', str(base_port + index),
+                 '-s', storage],
+                cwd=directory, stdout=log, stderr=subprocess.STDOUT))
+        self.__etags = {}
+        self.__chains = {}
+
+    def wait_until_ready(self):
+        deadline = perf_counter() + STARTUP_TIMEOUT
+        for url in self.urls:
+            while True:
+                try:
+                    requests.get(url + '/', timeout=1)
+                    break
+                except requests.exceptions.RequestException:
+                    if perf_counter() > deadline:
+                        raise RuntimeError('{} did not start'.format(url))
+                    sleep(0.1)
+
+    def create_election(self, scheme):
+        for url in self.urls:
+            requests.post(url + '/ballot').raise_for_status()
+            requests.post(url + '/create-election', json={
+                'id': ELECTION_ID,
+                'description': 'cluster benchmark',
+                'scheme': scheme
+            }).raise_for_status()
+
+    def connect(self, a, b):
+        requests.post(self.urls[a] + '/node', json={
+            'election': ELECTION_ID, 'node': self.urls[b]
+        }).raise_for_status()
+
+    def disconnect(self, a, b):
+        requests.delete(self.urls[a] + '/node', params={
+            'election': ELECTION_ID, 'node_url': self.urls[b]
+        }).raise_for_status()
+
+    def vote(self, index, public_key, private_key, candidate):
+        """Cast a vote on a node and return (success, latency)."""
+        start = perf_counter()
+        response = requests.post(self.urls[index] + '/vote', json={
+            'election': ELECTION_ID,
+            'candidate': candidate,
+            'voter_public_key': public_key,
+            'voter_private_key': private_key
+        })
+        return response.status_code == 201, perf_counter() - start
+
+    def mine(self, index):
+        """Mine a block on a node and return its height (None if mining
+        failed)."""
+        response = requests.post(
+            self.urls[index] + '/mine', json={'election': ELECTION_ID})
+        if response.status_code != 201:
+            return None
+        return response.json()['block']['index'] + 1
+
+    def resolve(self, index):
+        requests.post(self.urls[index] + '/resolve-conflicts',
+                      json={'election': ELECTION_ID}).raise_for_status()
+
+    def chain(self, index):
+        """Return the chain of a node (revalidated with its ETag)."""
+        url = self.urls[index]
+        headers = {}
+        if url in self.__etags:
+            headers['If-None-Match'] = self.__etags[url]
+        response = requests.get(
+            url + '/chain',
+            params={'election': ELECTION_ID, 'format': 'packed'},
+            headers=headers)
+        if response.status_code != 304:
+            self.__chains[url] = response.json()['chain']
+            self.__etags[url] = response.headers.get('ETag')
+        return self.__chains[url]
+
+    def tip(self, index):
+        chain = self.chain(index)
+        return len(chain), json.dumps(chain[-1], sort_keys=True)
+
+    def stop(self):
+        for process in self.__processes:
+            process.terminate()
+        for process in self.__processes:
+            process.wait()
+        for log in self.__logs:
+            log.close()
+
+
+def run_votes(cluster, keys, concurrency):
+    """Cast one vote per key, spread over the nodes, and return the
+    latencies, the number of failed votes and the elapsed time."""
+    def cast(index):
+        private_key, public_key = keys[index]
+        return cluster.vote(index % len(cluster.urls), public_key,
+                            private_key, CANDIDATES[index % len(CANDIDATES)])
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(cast, range(len(keys))))
+    elapsed = perf_counter() - start
+    latencies = [latency for _, latency in outcomes]
+    failures = sum(1 for success, _ in outcomes if not success)
+    return latencies, failures, elapsed
+
+
+def propagation_time(cluster, height):
+    """Return how long it takes until every node reached a height."""
+    start = perf_counter()
+    pending = set(range(len(cluster.urls)))
+    while pending:
+        pending = {index for index in pending
+                   if cluster.tip(index)[0] < height}
+        if perf_counter() - start > PROPAGATION_TIMEOUT:
+            return None
+        if pending:
+            sleep(POLL_INTERVAL)
+    return perf_counter() - start
+
+
+def run_partition(cluster, edges, blocks):
+    """Cut the last node off, let both sides mine, heal the partition and
+    return (seconds, resolve rounds) until all nodes share one tip."""
+    isolated = len(cluster.urls) - 1
+    cut = [(a, b) for a, b in edges if isolated in (a, b)]
+    for a, b in cut:
+        cluster.disconnect(a, b)
+    # The isolated side mines the longer chain, so the others must reorg
+    for _ in range(blocks + 1):
+        cluster.mine(isolated)
+    for _ in range(blocks):
+        cluster.mine(0)
+    for a, b in cut:
+        cluster.connect(a, b)
+    start = perf_counter()
+    rounds = 0
+    while len({cluster.tip(index) for index in range(
+            len(cluster.urls))}) > 1:
+        if perf_counter() - start > PROPAGATION_TIMEOUT:
+            return None, rounds
+        rounds += 1
+        for index in range(len(cluster.urls)):
+            cluster.resolve(index)
+    return perf_counter() - start, rounds
+
+
+def main(argv=None):
+    parser = ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--nodes', type=int, default=3)
+    parser.add_argument('--topology', choices=TOPOLOGIES, default='full')
+    parser.add_argument('--votes', type=int, default=100,
+                        help='votes cast per mining round')
+    parser.add_argument('--rounds', type=int, default=3,
+                        help='vote and mining rounds')
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help='votes sent in parallel')
+    parser.add_argument('--partition-blocks', type=int, default=2,
+                        help='blocks mined on each side of a partition '
+                        '(0 skips the convergence measurement)')
+    parser.add_argument('--scheme', choices=SCHEMES, default='ed25519')
+    parser.add_argument('--storage', choices=sorted(BACKENDS),
+                        default='file')
+    parser.add_argument('--base-port', type=int, default=7100)
+    parser.add_argument('--keep', action='store_true',
+                        help='keep the node data and logs')
+    parser.add_argument('--output', help='write the report to this file')
+    args = parser.parse_args(argv)
+    if args.nodes < 2:
+        parser.error('a cluster needs at least two nodes')
+
+    directory = tempfile.mkdtemp(prefix='ballot-cluster-')
+    cluster = Cluster(args.nodes, args.base_port, args.storage, directory)
+    try:
+        cluster.wait_until_ready()
+        cluster.create_election(args.scheme)
+        edges = topology_edges(args.nodes, args.topology)
+        for a, b in edges:
+            cluster.connect(a, b)
+        ballot = Ballot(None)
+        latencies, propagation = [], []
+        failures = 0
+        voting_time = 0
+        for round_index in range(args.rounds):
+            keys = [ballot.generate_keys(args.scheme)
+                    for _ in range(args.votes)]
+            round_latencies, round_failures, elapsed = run_votes(
+                cluster, keys, args.concurrency)
+            latencies += round_latencies
+            failures += round_failures
+            voting_time += elapsed
+            height = cluster.mine(round_index % args.nodes)
+            if height is not None:
+                seconds = propagation_time(cluster, height)
+                if seconds is not None:
+                    propagation.append(seconds)
+        convergence, rounds = None, 0
+        if args.partition_blocks > 0:
+            convergence, rounds = run_partition(
+                cluster, edges, args.partition_blocks)
+        report = {
+            'config': vars(args),
+            'votes': len(latencies),
+            'failed_votes': failures,
+            'votes_per_sec': (len(latencies) - failures) / voting_time
+            if voting_time else None,
+            'vote_latency_ms': summary(latencies),
+            'block_propagation_ms': summary(propagation),
+            'convergence_ms': convergence * 1000
+            if convergence is not None else None,
+            'resolve_rounds': rounds
+        }
+    finally:
+        cluster.stop()
+        if args.keep:
+            print('Node data kept in {}'.format(directory))
+        else:
+            shutil.rmtree(directory, ignore_errors=True)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, mode='w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
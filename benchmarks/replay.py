@@ -0,0 +1,278 @@
+"""Replays a traffic capture against a node and compares the timings.
+
+Usage (from the repository root):
+
+    python node.py -p 5000 --capture election-night.jsonl
+    python -m benchmarks.replay election-night.jsonl --output build-a.json
+    python -m benchmarks.replay election-night.jsonl --speed 0 \\
+        --baseline build-a.json
+
+The requests are sent in their captured order. --speed 1 keeps the
+captured pacing, 2 replays twice as fast and 0 sends them as fast as the
+node answers. With --concurrency above 1 requests may overtake each other,
+e.g. a vote may arrive before its election was created. By default a fresh
+node is started for the replay, --target drives a running node instead.
+
+Private keys are redacted in captures, so every voter of a /vote request
+is replayed with a new key pair of the election's scheme. The new public
+key replaces the captured one wherever it appears in a request body.
+Bodies which are not JSON are not captured; they are replayed as filler
+of the captured size. The report holds the throughput and the latency per
+route, next to the timings which were captured (captured timings are taken
+inside the node, replayed ones at the client). With --baseline the replay
+is compared to an earlier report and the command exits with status 1 if a
+route got slower than the threshold allows.
+"""
+
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+import json
+import shutil
+import sys
+import tempfile
+import threading
+from time import perf_counter, sleep
+
+import requests
+
+from ballot import Ballot
+from storage import BACKENDS
+from utility.capture import REDACTED
+from benchmarks.cluster import Cluster, summary
+
+DEFAULT_SCHEME = 'rsa'
+# Public keys of this length are Ed25519 keys (hex encoded)
+ED25519_KEY_LENGTH = 64
+
+
+def load_capture(path):
+    """Return the captured requests ordered by their offset."""
+    with open(path, mode='r') as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    return sorted(entries, key=lambda entry: entry['offset'])
+
+
+def substitute(values, keys):
+    """Return a copy of a JSON body with the captured public keys replaced.
+
+    Arguments:
+        :values: The JSON body.
+        :keys: Maps captured public keys to (private key, public key).
+    """
+    if isinstance(values, dict):
+        return {key: substitute(value, keys) for key, value in values.items()}
+    if isinstance(values, list):
+        return [substitute(value, keys) for value in values]
+    if isinstance(values, str) and values in keys:
+        return keys[values][1]
+    return values
+
+
+class KeySubstitution:
+    """Generates the key pairs the voters of a capture are replayed with.
+
+    Attributes:
+        :keys: Maps captured public keys to (private key, public key).
+        :schemes: The signature scheme of every created election.
+    """
+
+    def __init__(self):
+        self.keys = {}
+        self.schemes = {}
+        self.__ballot = Ballot(None)
+
+    def scheme(self, election, public_key):
+        if election in self.schemes:
+            return self.schemes[election]
+        # The election was created before the capture started
+        if len(public_key) == ED25519_KEY_LENGTH:
+            return 'ed25519'
+        return DEFAULT_SCHEME
+
+    def prepare(self, entry):
+        """Return the body of a captured request as it is replayed."""
+        values = entry.get('json')
+        if values is None or not isinstance(values, dict):
+            return values
+        if entry.get('route') == '/create-election' and 'id' in values:
+            self.schemes[str(values['id'])] = values.get(
+                'scheme', DEFAULT_SCHEME)
+        if values.get('voter_private_key') == REDACTED:
+            voter = values.get('voter_public_key')
+            if voter not in self.keys:
+                self.keys[voter] = self.__ballot.generate_keys(
+                    self.scheme(str(values.get('election')), voter))
+            values = dict(values, voter_private_key=self.keys[voter][0])
+        return substitute(values, self.keys)
+
+
+def replay(url, entries, bodies, speed, concurrency):
+    """Send the captured requests to a node and return their (status,
+    latency) outcomes and the elapsed time.
+
+    Arguments:
+        :url: The base URL of the node.
+        :entries: The captured requests.
+        :bodies: The prepared JSON body of every request.
+        :speed: The pacing factor (0 sends without pauses).
+        :concurrency: The number of requests in flight at most.
+    """
+    local = threading.local()
+
+    def send(index):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        entry = entries[index]
+        kwargs = {'headers': dict(entry.get('headers', {}))}
+        if bodies[index] is not None:
+            kwargs['json'] = bodies[index]
+        elif 'body_size' in entry:
+            # Only the size of bodies which are not JSON was captured
+            kwargs['data'] = b'x' * entry['body_size']
+            if entry.get('content_type'):
+                kwargs['headers']['Content-Type'] = entry['content_type']
+        request_start = perf_counter()
+        try:
+            status = local.session.request(
+                entry['method'], url + entry['path'], **kwargs).status_code
+        except requests.exceptions.RequestException:
+            status = None
+        return status, perf_counter() - request_start
+
+    futures = []
+    first = entries[0]['offset']
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for index, entry in enumerate(entries):
+            if speed > 0:
+                delay = (start + (entry['offset'] - first) / speed -
+                         perf_counter())
+                if delay > 0:
+                    sleep(delay)
+            futures.append(executor.submit(send, index))
+        outcomes = [future.result() for future in futures]
+    return outcomes, perf_counter() - start
+
+
+def build_report(entries, outcomes, elapsed):
+    """Compare the replayed requests to the captured ones."""
+    routes = {}
+    for entry, (status, latency) in zip(entries, outcomes):
+        route = routes.setdefault(
+            '{} {}'.format(entry['method'], entry.get('route')),
+            {'captured': [], 'replayed': [], 'status_changed': 0})
+        route['captured'].append(entry['duration_ms'] / 1000)
+        route['replayed'].append(latency)
+        if status != entry['status']:
+            route['status_changed'] += 1
+    captured_time = entries[-1]['offset'] - entries[0]['offset']
+    report = {
+        'requests': len(entries),
+        'failed_requests': sum(
+            1 for status, _ in outcomes if status is None),
+        'status_changed': sum(
+            route['status_changed'] for route in routes.values()),
+        'captured_requests_per_sec': len(entries) / captured_time
+        if captured_time else None,
+        'replayed_requests_per_sec': len(entries) / elapsed
+        if elapsed else None,
+        'routes': {}
+    }
+    for name, route in sorted(routes.items()):
+        captured = summary(route['captured'])
+        replayed = summary(route['replayed'])
+        report['routes'][name] = {
+            'captured_ms': captured,
+            'replayed_ms': replayed,
+            'p50_ratio': replayed['p50'] / captured['p50']
+            if captured['p50'] else None,
+            'status_changed': route['status_changed']
+        }
+    return report
+
+
+def compare(current, baseline, threshold):
+    """Return the routes whose median latency got slower than the
+    threshold allows as (route, ratio) tuples (see bench.compare)."""
+    regressions = []
+    for name, route in current['routes'].items():
+        try:
+            before = baseline['routes'][name]['replayed_ms']['p50']
+        except KeyError:
+            continue
+        ratio = route['replayed_ms']['p50'] / before if before else 1
+        print('{:<40} {:>10.2f} ms {:>7.2f}x'.format(
+            name, route['replayed_ms']['p50'], ratio))
+        if ratio > 1 + threshold:
+            regressions.append((name, ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('capture', help='the JSONL capture file')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='the pacing factor (0 replays at max speed)')
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='requests in flight at most')
+    parser.add_argument('--target',
+                        help='replay against this node instead of starting '
+                        'a fresh one')
+    parser.add_argument('--storage', choices=sorted(BACKENDS),
+                        default='file')
+    parser.add_argument('--port', type=int, default=7200)
+    parser.add_argument('--keep', action='store_true',
+                        help='keep the data and log of the fresh node')
+    parser.add_argument('--output', help='write the report to this file')
+    parser.add_argument('--baseline', help='compare against this report')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='the tolerated slowdown against the baseline')
+    args = parser.parse_args(argv)
+    if args.speed < 0:
+        parser.error('the speed must not be negative')
+
+    entries = load_capture(args.capture)
+    if not entries:
+        parser.error('the capture is empty')
+    # Keys are generated before the replay, so it only times the node
+    keys = KeySubstitution()
+    bodies = [keys.prepare(entry) for entry in entries]
+    print('Replaying {} requests ({} voters with new keys)...'.format(
+        len(entries), len(keys.keys)))
+
+    cluster, directory = None, None
+    url = args.target
+    if url is None:
+        directory = tempfile.mkdtemp(prefix='ballot-replay-')
+        cluster = Cluster(1, args.port, args.storage, directory)
+        url = cluster.urls[0]
+    try:
+        if cluster is not None:
+            cluster.wait_until_ready()
+        outcomes, elapsed = replay(
+            url, entries, bodies, args.speed, args.concurrency)
+    finally:
+        if cluster is not None:
+            cluster.stop()
+            if args.keep:
+                print('Node data kept in {}'.format(directory))
+            else:
+                shutil.rmtree(directory, ignore_errors=True)
+    report = build_report(entries, outcomes, elapsed)
+    report['config'] = vars(args)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, mode='w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline is None:
+        return 0
+    with open(args.baseline, mode='r') as f:
+        baseline = json.load(f)
+    regressions = compare(report, baseline, args.threshold)
+    for name, ratio in regressions:
+        print('Regression: {} is {:.2f}x slower'.format(name, ratio))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
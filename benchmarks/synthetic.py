@@ -0,0 +1,102 @@
+"""Generates synthetic elections with signed votes for the benchmarks.
+
+Generating keys and signatures dominates, so every election is cached as
+JSON in the temp directory and reused by later runs with the same
+parameters.
+"""
+
+import json
+import os
+import random
+import tempfile
+from time import time
+
+from ballot import Ballot
+from block import Block
+from key_dictionary import KeyDictionary
+from utility.hash_util import hash_block
+from utility.merkle import merkle_root
+from vote import Vote
+
+CACHE_DIR = os.path.join(tempfile.gettempdir(), 'ballot-benchmarks')
+CANDIDATES = ('alice', 'bob', 'carol', 'dave', 'eve')
+# The number of votes per block (the reward vote comes on top)
+BLOCK_SIZE = 100
+MINER = 'benchmark-miner'
+
+
+def cache_filename(size, scheme, key_pool):
+    return os.path.join(CACHE_DIR, 'election-{}-{}-{}.json'.format(
+        size, scheme, key_pool))
+
+
+def generate_votes(size, scheme='ed25519', key_pool=0, seed=0):
+    """Return a list of signed votes.
+
+    Arguments:
+        :size: The number of votes.
+        :scheme: The signature scheme (see ballot.SCHEMES).
+        :key_pool: The number of voter keys to cycle through (0 creates a
+        key for every vote; RSA keys take long to generate).
+    """
+    rng = random.Random(seed)
+    ballot = Ballot(None)
+    keys = [ballot.generate_keys(scheme) for _ in range(key_pool)]
+    votes = []
+    for index in range(size):
+        if keys:
+            private_key, public_key = keys[index % len(keys)]
+        else:
+            private_key, public_key = ballot.generate_keys(scheme)
+        candidate = rng.choice(CANDIDATES)
+        signature = ballot.sign_vote(
+            public_key, private_key, candidate, scheme=scheme)
+        votes.append(Vote(public_key, candidate, signature, 1, scheme))
+    return votes
+
+
+def build_chain(votes, block_size=BLOCK_SIZE):
+    """Pack votes into a chain of blocks, starting with a genesis block.
+    The blocks carry a dummy proof, searching real proofs of work would
+    take longer than the benchmarks themselves.
+
+    Arguments:
+        :votes: The votes which should be confirmed.
+        :block_size: The number of votes per block.
+    """
+    chain = [Block(0, 'benchmark', [], 1, 0)]
+    timestamp = time()
+    for start in range(0, len(votes), block_size):
+        block_votes = votes[start:start + block_size]
+        block_votes.append(Vote('MINING', MINER, '', 1))
+        chain.append(Block(
+            len(chain), hash_block(chain[-1]), block_votes, 0,
+            timestamp + len(chain), merkle_root(block_votes)))
+    return chain
+
+
+def load_election(size, scheme='ed25519', key_pool=0):
+    """Return the chain of a synthetic election, generating and caching it
+    if it was not generated before.
+
+    Arguments:
+        :size: The number of signed votes.
+        :scheme: The signature scheme (see ballot.SCHEMES).
+        :key_pool: The number of voter keys (0 for one key per vote).
+    """
+    filename = cache_filename(size, scheme, key_pool)
+    try:
+        with open(filename, mode='r') as f:
+            data = json.load(f)
+        keys = KeyDictionary(data['keys'])
+        return [Block.from_dict(block, keys) for block in data['chain']]
+    except (IOError, ValueError, KeyError):
+        pass
+    chain = build_chain(generate_votes(size, scheme, key_pool))
+    keys = KeyDictionary()
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(filename + '.tmp', mode='w') as f:
+        json.dump({'chain': [block.to_dict(keys) for block in chain],
+                   'keys': keys.keys}, f)
+    os.replace(filename + '.tmp', filename)
+    return chain
@@ -1,6 +1,7 @@
 from time import time
 
 from utility.printable import Printable
+from vote import Vote
 
 
 class Block(Printable):
@@ -13,11 +14,51 @@ class Block(Printable):
         (automatically generated by default).
         :votes: A list of vote which are included in the block.
         :proof: The proof of work number that yielded this block.
+        :merkle_root: The merkle root over the votes of the block (None for
+        blocks which were created without one).
     """
 
-    def __init__(self, index, previous_hash, votes, proof, time=time()):
+    def __init__(self, index, previous_hash, votes, proof, time=time(),
+                 merkle_root=None):
         self.index = index
         self.previous_hash = previous_hash
         self.timestamp = time
         self.votes = votes
         self.proof = proof
+        self.merkle_root = merkle_root
+
+    def to_dict(self, keys=None):
+        """Converts this block (and its votes) into a JSON serialisable
+        dict.
+
+        Arguments:
+            :keys: A KeyDictionary to pack the votes with (None keeps the
+            votes as dicts).
+        """
+        dict_block = self.__dict__.copy()
+        if keys is None:
+            dict_block['votes'] = [vt.__dict__.copy() for vt in self.votes]
+        else:
+            dict_block['votes'] = [keys.encode_vote(vt) for vt in self.votes]
+        return dict_block
+
+    @classmethod
+    def from_dict(cls, values, keys=None):
+        """Rebuild a block from its dict representation.
+
+        Arguments:
+            :values: The dict representation of the block.
+            :keys: The KeyDictionary the votes were packed with (votes are
+            interned into it if they are dicts).
+        """
+        if keys is None:
+            votes = [Vote.from_dict(vt) for vt in values['votes']]
+        else:
+            votes = [keys.decode_vote(vt) for vt in values['votes']]
+        return cls(
+            values['index'],
+            values['previous_hash'],
+            votes,
+            values['proof'],
+            values['timestamp'],
+            values.get('merkle_root'))
@@ -0,0 +1,158 @@
+from collections import OrderedDict
+import threading
+
+from block import Block
+from utility.hash_util import hash_block
+
+
+class BlockStore:
+    """Holds the chain of an election. Block headers and hashes always stay
+    in memory, the votes of the blocks are kept in a size-bounded LRU cache
+    and are reloaded from the storage once they were evicted.
+
+    Attributes:
+        :loader: Returns the votes of a block index from the storage (None
+        keeps every block in memory).
+        :capacity: The maximum number of votes kept in memory (None for no
+        limit).
+    """
+
+    def __init__(self, blocks=(), loader=None, capacity=None, hashes=None):
+        self.loader = loader
+        self.capacity = capacity if loader is not None else None
+        self.__headers = []
+        self.__hashes = []
+        self.__bodies = OrderedDict()
+        self.__size = 0
+        # Blocks from this height on are not stored yet and never evicted
+        self.__stored_height = 0
+        # Changes whenever blocks are removed, so votes loaded for a block
+        # which was replaced meanwhile are not cached
+        self.__generation = 0
+        self.__lock = threading.RLock()
+        for index, block in enumerate(blocks):
+            self.append(block, hashes[index] if hashes else None)
+        if loader is not None:
+            # Blocks handed in together with a loader come from the storage
+            self.__stored_height = len(self.__headers)
+
+    def append(self, block, block_hash=None):
+        """Add a block to the end of the chain.
+
+        Arguments:
+            :block: The block which should be added. Blocks without votes
+            (None) are headers whose votes are loaded on demand.
+            :block_hash: The hash of the block if it is already known.
+        """
+        if block_hash is None:
+            block_hash = hash_block(block)
+        header = Block(block.index, block.previous_hash, None, block.proof,
+                       block.timestamp, block.merkle_root)
+        with self.__lock:
+            self.__headers.append(header)
+            self.__hashes.append(block_hash)
+            if block.votes is not None:
+                self.__cache(len(self.__headers) - 1, block.votes)
+
+    def enable_paging(self, loader, capacity):
+        """Mark all blocks as stored, so their votes may be evicted and
+        reloaded from the storage.
+
+        Arguments:
+            :loader: Returns the votes of a block index from the storage.
+            :capacity: The maximum number of votes kept in memory.
+        """
+        with self.__lock:
+            self.loader = loader
+            self.capacity = capacity
+            self.__stored_height = len(self.__headers)
+            self.__evict()
+
+    def truncate(self, height):
+        """Remove all blocks from the given height on.
+
+        Arguments:
+            :height: The number of blocks which are kept.
+        """
+        with self.__lock:
+            del self.__headers[height:]
+            del self.__hashes[height:]
+            self.__stored_height = min(self.__stored_height, height)
+            self.__generation += 1
+            for index in [i for i in self.__bodies if i >= height]:
+                self.__size -= len(self.__bodies.pop(index))
+
+    def hash_at(self, index):
+        """Return the hash of a block without loading its votes."""
+        return self.__hashes[index]
+
+    def hashes(self):
+        """Return the hashes of all blocks."""
+        with self.__lock:
+            return self.__hashes[:]
+
+    def header(self, index):
+        """Return a block of the chain without its votes (votes is None)."""
+        return self.__headers[index]
+
+    def get_votes(self, index):
+        """Return the votes of a block, loading them if they were evicted.
+        """
+        with self.__lock:
+            if index < 0:
+                index += len(self.__headers)
+            votes = self.__bodies.get(index)
+            if votes is not None:
+                self.__bodies.move_to_end(index)
+                return votes
+            generation = self.__generation
+        # The storage takes its own lock while loading and holds it while
+        # saving the chain (which takes ours), so the lock is released here
+        votes = self.loader(index)
+        with self.__lock:
+            cached = self.__bodies.get(index)
+            if cached is not None:
+                return cached
+            if generation == self.__generation:
+                self.__cache(index, votes)
+        return votes
+
+    def __cache(self, index, votes):
+        self.__bodies[index] = votes
+        self.__size += len(votes)
+        self.__evict()
+
+    def __evict(self):
+        if self.capacity is None:
+            return
+        while self.__size > self.capacity:
+            # Evict the least recently used body which can be reloaded
+            for index in self.__bodies:
+                if index < self.__stored_height:
+                    break
+            else:
+                return
+            self.__size -= len(self.__bodies.pop(index))
+
+    def resident_votes(self):
+        """Return the number of votes currently kept in memory."""
+        return self.__size
+
+    def __len__(self):
+        return len(self.__headers)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        header = self.__headers[index]
+        return Block(header.index, header.previous_hash,
+                     self.get_votes(index), header.proof, header.timestamp,
+                     header.merkle_root)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __reversed__(self):
+        for index in range(len(self) - 1, -1, -1):
+            yield self[index]
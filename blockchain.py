@@ -1,16 +1,60 @@
-from functools import reduce
-import json
+from time import time
+import uuid
 import requests
 
 # Import two functions from our hash_util.py file. Omit the ".py" in the import
 from utility.hash_util import hash_block
+from utility.merkle import merkle_proof, merkle_root, hash_vote
 from utility.verification import Verification
+from utility.compression import json_request
+from utility.seen_cache import SeenCache
+from utility.metrics import (
+    POW_ATTEMPTS, POW_DURATION, SAVE_DURATION, STORAGE_BYTES)
+from utility.logger import get_logger
+from utility import async_http, offload
+from utility.tracing import tracer
 from block import Block
+from block_store import BlockStore
 from vote import Vote
+from key_dictionary import KeyDictionary
 from ballot import Ballot
+from tally import Tally
+from vote_columns import VoteColumns, analytics
+from peers import PeerManager
+from storage import get_storage
+
+logger = get_logger(__name__)
 
 # The reward we give to miners (for creating a new block)
 MINING_REWARD = 1
+# The number of blocks between two tally checkpoints
+CHECKPOINT_INTERVAL = 10
+# The number of vote and block digests remembered to drop gossip duplicates
+SEEN_CACHE_SIZE = 10000
+# One out of this many declines by peers is logged
+DECLINED_LOG_SAMPLE = 10
+# The settings an election is created with unless others are given
+DEFAULT_SETTINGS = {
+    'scheme': 'rsa',
+    # Either proof-of-work ('pow') or proof-of-authority ('poa'), where
+    # blocks are signed by one of the validators (node public keys)
+    'consensus': 'pow',
+    'validators': []
+}
+# The consensus modes an election can run with
+CONSENSUS_MODES = ('pow', 'poa')
+
+
+def parse_cursor(cursor):
+    """Split a voter page cursor into the block index and the position of
+    the last returned vote in that block."""
+    if not cursor:
+        return 0, -1
+    height, position = str(cursor).split('.')
+    height, position = int(height), int(position)
+    if height < 0:
+        raise ValueError('Invalid cursor: {}'.format(cursor))
+    return height, position
 
 
 class Blockchain:
@@ -22,22 +66,53 @@ class Blockchain:
         :chain: The list of blocks
         :unverified_votes (private): The list of open votes
         :public_key: The connected node (which runs the blockchain).
+        :private_key: The key the node seals blocks with in
+        proof-of-authority mode.
+        :storage: The storage engine the election is persisted with.
+        :cache_size: The maximum number of block votes kept in memory (None
+        keeps all of them; only indexed storage engines can evict votes).
+        :settings: The per-election options (see DEFAULT_SETTINGS). They
+        are fixed once the election was stored.
     """
 
     def __init__(
-            self, public_key, node_id, election_id=None, description=None):
+            self, public_key, node_id, election_id=None, description=None,
+            storage='file', settings=None, cache_size=None,
+            private_key=None):
         """The constructor of the Blockchain class."""
         # Our starting block for the blockchain
         genesis_block = Block(0, description, [], election_id, 0)
         # Initializing our (empty) blockchain list
+        self.cache_size = cache_size
         self.chain = [genesis_block]
         # Unhandled votes
         self.__unverified_votes = []
         self.public_key = public_key
-        self.__peer_nodes = set()
+        self.private_key = private_key
+        self.__peer_nodes = PeerManager(election_id=election_id)
         self.node_id = node_id
         self.election_id = election_id
         self.resolve_conflicts = False
+        self.seen = SeenCache(SEEN_CACHE_SIZE)
+        self.__tally = Tally()
+        # The columnar copy of the votes is built on the first analytics
+        # query and kept up to date from then on
+        self.__columns = None
+        # The counter restarts with every instance, the id keeps versions
+        # of a reloaded election from matching older ones
+        self.__instance_id = uuid.uuid4().hex[:8]
+        self.__version = 0
+        self.storage_backend = storage
+        self.storage = get_storage(storage, node_id, election_id)
+        # Every vote refers to the shared copies of its voter and candidate
+        self.keys = self.storage.keys
+        self.settings = dict(DEFAULT_SETTINGS)
+        stored_settings = self.storage.load_settings()
+        if stored_settings is not None:
+            self.settings.update(stored_settings)
+        elif settings is not None:
+            self.settings.update(settings)
+            self.storage.save_settings(self.settings)
         self.load_data()
 
     # This turns the chain attribute into a property with a getter
@@ -49,102 +124,121 @@ class Blockchain:
     # The setter for the chain property
     @chain.setter
     def chain(self, val):
+        if not isinstance(val, BlockStore):
+            # New blocks stay in memory until they were saved
+            val = BlockStore(val)
         self.__chain = val
 
+    def get_tip_hash(self):
+        """Return the hash of the last block."""
+        return self.__chain.hash_at(-1)
+
+    def get_height(self):
+        """Return the number of blocks in the chain."""
+        return len(self.__chain)
+
+    def get_block_hashes(self):
+        """Return the hash of every block (peers look for the fork point
+        in them before they download any blocks)."""
+        return self.__chain.hashes()
+
+    def get_version(self):
+        """Return a tag which changes whenever the chain, the open votes or
+        the peer nodes change."""
+        return '{}-{}-{}'.format(
+            self.__instance_id, self.get_tip_hash(), self.__version)
+
     def get_unverified_votes(self):
         """Returns a copy of the open votes list."""
         return self.__unverified_votes[:]
 
     def load_data(self):
-        """Initialize blockchain + open transactions data from a file."""
-        try:
-            with open('blockchain-{}-{}.txt'.format(
-                    self.node_id, self.election_id), mode='r') as f:
-                file_content = f.readlines()
-                blockchain = json.loads(file_content[0][:-1])
-                # We need to convert  the loaded data because
-                # Transactions should use OrderedDict
-                updated_blockchain = []
-                for block in blockchain:
-                    converted_tx = [Vote(
-                        vt['voter'],
-                        vt['candidate'],
-                        vt['signature'],
-                        vt['amount'])
-                        for vt in block['votes']
-                        ]
-                    updated_block = Block(
-                        block['index'],
-                        block['previous_hash'],
-                        converted_tx,
-                        block['proof'],
-                        block['timestamp']
-                        )
-                    updated_blockchain.append(updated_block)
-                self.chain = updated_blockchain
-                unverified_votes = json.loads(file_content[1][:-1])
-                # We need to convert  the loaded data because
-                # Transactions should use OrderedDict
-                updated_transactions = []
-                for vt in unverified_votes:
-                    updated_transaction = Vote(
-                        vt['voter'],
-                        vt['candidate'],
-                        vt['signature'],
-                        vt['amount']
-                        )
-                    updated_transactions.append(updated_transaction)
-                self.__unverified_votes = updated_transactions
-                peer_nodes = json.loads(file_content[2])
-                self.__peer_nodes = set(peer_nodes)
-        except (IOError, IndexError):
-            pass
-        finally:
-            print('Cleanup!')
-
+        """Initialize blockchain + open votes data from the storage."""
+        data = self.storage.load(self.cache_size)
+        if data is not None:
+            chain, unverified_votes, peer_nodes = data
+            self.chain = chain
+            self.__unverified_votes = unverified_votes
+            self.__peer_nodes = PeerManager(peer_nodes, self.election_id)
+        self.load_checkpoint()
+
+    @tracer.span('save_data')
     def save_data(self):
-        """Save blockchain + open votes snapshot to a file."""
+        """Save blockchain + open votes snapshot to the storage."""
+        # Every change is saved, so this is where cached responses expire
+        self.__version += 1
+        with SAVE_DURATION.time(election=self.election_id,
+                                storage=self.storage_backend):
+            self.storage.save(
+                self.__chain, self.__unverified_votes,
+                self.__peer_nodes.urls())
+        STORAGE_BYTES.set(self.storage.size(), election=self.election_id,
+                          storage=self.storage_backend)
+        if self.storage.indexed:
+            # Saved blocks can be reloaded, so their votes may be evicted
+            self.__chain.enable_paging(
+                self.storage.load_block_votes, self.cache_size)
+
+    def load_checkpoint(self):
+        """Restore the tally from the latest checkpoint and replay only
+        the blocks which were added after it."""
+        checkpoint = self.storage.load_checkpoint()
+        # A checkpoint only counts if its tip is still part of our chain
         try:
-            with open('blockchain-{}-{}.txt'.format(
-                    self.node_id, self.election_id), mode='w') as f:
-                saveable_chain = [
-                    block.__dict__ for block in
-                    [
-                        Block(
-                            block_el.index,
-                            block_el.previous_hash,
-                            [vt.__dict__ for vt in block_el.votes],
-                            block_el.proof,
-                            block_el.timestamp) for block_el in self.__chain
-                    ]
-                ]
-                f.write(json.dumps(saveable_chain))
-                f.write('\n')
-                saveable_tx = [vt.__dict__ for vt in self.__unverified_votes]
-                f.write(json.dumps(saveable_tx))
-                f.write('\n')
-                f.write(json.dumps(list(self.__peer_nodes)))
-                # save_data = {
-                #     'chain': blockchain,
-                #     'ot': unverified_votes
-                # }
-                # f.write(pickle.dumps(save_data))
-        except IOError:
-            print('Saving failed!')
+            if (checkpoint is None or
+                    not 0 < checkpoint['height'] <= len(self.__chain) or
+                    self.__chain.hash_at(checkpoint['height'] - 1) !=
+                    checkpoint['tip_hash']):
+                raise ValueError('Checkpoint is not on the chain')
+            tally = Tally.from_dict(checkpoint['tally'])
+        except (KeyError, ValueError):
+            self.__tally = Tally.from_chain(self.__chain)
+            return
+        for block in self.__chain[checkpoint['height']:]:
+            tally.apply_block(block)
+        self.__tally = tally
+        # Recover open votes which got lost since the checkpoint was taken
+        open_voters = {vt.voter for vt in self.__unverified_votes}
+        for vt in checkpoint['unverified_votes']:
+            if vt['voter'] in open_voters or tally.get_sent(vt['voter']) > 0:
+                continue
+            self.__unverified_votes.append(
+                self.keys.intern_vote(Vote.from_dict(vt)))
+            open_voters.add(vt['voter'])
+
+    def save_checkpoint(self):
+        """Save the tally, chain tip and open votes as a checkpoint."""
+        self.storage.save_checkpoint({
+            'height': len(self.__chain),
+            'tip_hash': self.get_tip_hash(),
+            'tally': self.__tally.to_dict(),
+            'unverified_votes': [
+                vt.__dict__ for vt in self.__unverified_votes]
+        })
+
+    def apply_block(self, block):
+        """Add a block to the tally and checkpoint it periodically.
+
+        Arguments:
+            :block: The block which was appended to the chain.
+        """
+        self.__tally.apply_block(block)
+        if self.__columns is not None:
+            self.__columns.append_block(block)
+        if self.__tally.height % CHECKPOINT_INTERVAL == 0:
+            self.save_checkpoint()
 
     def proof_of_work(self):
         """Generate a proof of work for the open votes,
         the hash of the previous block and a random number
         (which is guessed until it fits)."""
-        last_block = self.__chain[-1]
-        last_hash = hash_block(last_block)
-        proof = 0
-        # Try different PoW numbers and return the first valid one
-        while not Verification.valid_proof(
-                self.__unverified_votes,
-                last_hash,
-                proof):
-            proof += 1
+        last_hash = self.get_tip_hash()
+        # Try different PoW numbers and return the first valid one (in a
+        # worker process if one is configured)
+        with POW_DURATION.time(election=self.election_id):
+            proof = offload.run(
+                Verification.find_proof, self.__unverified_votes, last_hash)
+        POW_ATTEMPTS.inc(proof + 1, election=self.election_id)
         return proof
 
     def get_balance(self, voter=None):
@@ -156,36 +250,14 @@ class Blockchain:
             participant = self.public_key
         else:
             participant = voter
-        # Fetch a list of all sent vote amounts for the given person
-        # (empty lists are returned if the person was NOT the voter)
-        # This fetches sent amounts of votes that were already included
-        # in blocks of the blockchain
-        tx_sender = [[vt.amount for vt in block.votes
-                      if vt.voter == participant] for block in self.__chain]
-        # Fetch a list of all sent vote amounts for the given person
-        # (empty lists are returned if the person was NOT the voter)
-        # This fetches sent amounts of open votes (to avoid double spending)
-        open_tx_sender = [vt.amount
-                          for vt in self.__unverified_votes
-                          if vt.voter is participant]
-        tx_sender.append(open_tx_sender)
-
-        print(tx_sender)
-        amount_sent = reduce(lambda tx_sum, tx_amt: tx_sum + sum(tx_amt)
-                             if len(tx_amt) > 0 else tx_sum + 0, tx_sender, 0)
-
-        # This fetches received vote amounts of votes that were already
-        # included in blocks of the blockchain
+        # Confirmed votes come from the tally, open votes are counted as
+        # sent as well (to avoid double spending)
+        amount_sent = self.__tally.get_sent(participant) + sum(
+            vt.amount for vt in self.__unverified_votes
+            if vt.voter == participant)
         # We ignore open votes here because you shouldn't be able to
         # spend votes before the vote was confirmed + included in a block
-        tx_recipient = [
-                    [vt.amount for vt in block.votes
-                        if vt.candidate == participant]
-                    for block in self.__chain
-        ]
-        amount_received = reduce(lambda tx_sum, tx_amt: tx_sum + sum(tx_amt)
-                                 if len(tx_amt) > 0
-                                 else tx_sum + 0, tx_recipient, 0)
+        amount_received = self.__tally.get_received(participant)
 
         # Return the total balance
         return amount_received - amount_sent
@@ -199,20 +271,15 @@ class Blockchain:
             participant = self.public_key
         else:
             participant = voter
-        tx_rec = [
-            [vt.amount for vt in block.votes
-                if vt.candidate == participant and vt.voter == 'MINING']
-            for block in self.__chain
-        ]
-        amount_mined = reduce(lambda tx_sum, tx_amt: tx_sum + sum(tx_amt)
-                              if len(tx_amt) > 0 else tx_sum + 0, tx_rec, 0)
-
         # Return the total amount of mines
-        return amount_mined
+        return self.__tally.mined.get(participant, 0)
 
     def get_results_voters(self, candidate):
         if candidate is None:
             return None
+        if self.storage.indexed:
+            return self.storage.get_results_voters(
+                candidate, len(self.__chain))
 
         tx_rec = [
             [vt.voter for vt in block.votes
@@ -222,21 +289,152 @@ class Blockchain:
 
         return tx_rec
 
+    def get_results_voters_page(self, candidate, cursor=None, limit=100):
+        """Return one page of the voters of a candidate and the cursor of
+        the next page (None once all voters were returned).
+
+        Arguments:
+            :candidate: The candidate whose voters are requested.
+            :cursor: The cursor returned with the previous page.
+            :limit: The maximum number of voters on the page.
+        """
+        if candidate is None:
+            return None
+        if limit < 1:
+            raise ValueError('The page limit must be positive')
+        height, position = parse_cursor(cursor)
+        if self.storage.indexed:
+            page = self.storage.get_results_voters_page(
+                candidate, height, position, limit + 1)
+        else:
+            page = []
+            # The blocks are read one at a time, so a page does not copy
+            # the rest of the chain
+            for block_index in range(height, len(self.__chain)):
+                block = self.__chain[block_index]
+                for index, vt in enumerate(block.votes):
+                    if block.index == height and index <= position:
+                        continue
+                    if vt.candidate == candidate and vt.voter != 'MINING':
+                        page.append((block.index, index, vt.voter))
+                if len(page) > limit:
+                    break
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = '{}.{}'.format(page[-1][0], page[-1][1])
+        return [voter for _, _, voter in page], next_cursor
+
+    def get_results_count(self, candidate):
+        """Return the number of confirmed voters of a candidate."""
+        if candidate is None:
+            return None
+        return self.__tally.get_count(candidate)
+
+    def get_vote_history(self, voter):
+        """Return the confirmed votes of a voter together with the index
+        of the block they were included in.
+
+        Arguments:
+            :voter: The voter whose votes are requested.
+        """
+        if voter is None:
+            return None
+        if self.storage.indexed:
+            return self.storage.get_vote_history(voter)
+        return [(block.index, vt) for block in self.__chain
+                for vt in block.votes if vt.voter == voter]
+
+    def is_duplicate_vote(self, voter, candidate, signature, amount=1,
+                          scheme=None):
+        """Return whether a vote received from a peer was handled before.
+        Its digest is marked as seen before the vote is verified, so a copy
+        relayed by another peer at the same time is a duplicate as well. A
+        vote whose digest was forgotten is found among the open and the
+        confirmed votes by its signature.
+
+        Arguments:
+            :voter: The voter of the vote.
+            :candidate: The candidate of the vote.
+            :signature: The signature of the vote.
+            :amount: The amount of the vote.
+            :scheme: The signature scheme of the vote.
+        """
+        vote = Vote(voter, candidate, signature, amount,
+                    scheme or self.settings['scheme'])
+        if not self.seen.add(hash_vote(vote)):
+            return True
+        if any(vt.voter == voter and vt.signature == signature
+               for vt in self.__unverified_votes):
+            return True
+        # Voters without a confirmed vote are answered by the tally
+        if self.__tally.get_sent(voter) == 0:
+            return False
+        return any(vt.signature == signature
+                   for _, vt in self.get_vote_history(voter))
+
+    def get_vote_proof(self, signature):
+        """Return the header of the block which confirmed a vote together
+        with the merkle inclusion proof of the vote (None if the vote is not
+        part of a block with a merkle root).
+
+        Arguments:
+            :signature: The signature of the vote.
+        """
+        if not signature:
+            return None
+        location = None
+        if self.storage.indexed:
+            location = self.storage.find_vote(signature)
+        else:
+            for block in reversed(self.__chain):
+                for position, vt in enumerate(block.votes):
+                    if vt.signature == signature:
+                        location = (block.index, position)
+                        break
+                if location is not None:
+                    break
+        if location is None or location[0] >= len(self.__chain):
+            return None
+        block = self.__chain[location[0]]
+        if block.merkle_root is None:
+            return None
+        vote = block.votes[location[1]]
+        header = block.__dict__.copy()
+        del header['votes']
+        return {
+            'block': header,
+            'hash': self.__chain.hash_at(block.index),
+            'merkle_root': block.merkle_root,
+            'vote': vote.__dict__,
+            'leaf': hash_vote(vote),
+            'proof': merkle_proof(block.votes, location[1])
+        }
+
     def get_results(self, candidate):
         if candidate is None:
             return None
 
-        tx_rec = [
-            [vt.amount for vt in block.votes
-                if vt.candidate == candidate and vt.voter != 'MINING']
-            for block in self.__chain
-        ]
-        results = reduce(lambda tx_sum, tx_amt: tx_sum + sum(tx_amt)
-                         if len(tx_amt) > 0 else tx_sum + 0, tx_rec, 0)
+        return self.__tally.get_results(candidate)
 
-        # Return the total amount of mines
-        return results
+    def get_all_results(self):
+        """Return the confirmed votes of every candidate at once."""
+        return dict(self.__tally.results)
+
+    def get_analytics(self, bucket, candidate=None):
+        """Return aggregate statistics of the confirmed votes: the results,
+        the votes per block and the votes per time bucket (overall, of
+        every candidate and optionally of a single candidate).
 
+        Arguments:
+            :bucket: The length of a time bucket in seconds.
+            :candidate: The candidate whose time series is requested.
+        """
+        if self.__columns is None:
+            self.__columns = VoteColumns.from_chain(self.__chain, self.keys)
+        return analytics(self.__columns, bucket, candidate)
+
+    @tracer.span('get_is_vote')
     def get_is_vote(self, voter=None):
         """Check weather particpant was voted or not.
         """
@@ -246,22 +444,11 @@ class Blockchain:
             participant = self.public_key
         else:
             participant = voter
-        # Fetch a list of all sent vote amounts for the given person
-        # (empty lists are returned if the person was NOT the voter)
-        # This fetches sent amounts of votes that were already included in
-        # blocks of the blockchain
-        tx_sender = [[vt.amount for vt in block.votes
-                      if vt.voter == participant] for block in self.__chain]
-        # Fetch a list of all sent vote amounts for the given person
-        # (empty lists are returned if the person was NOT the voter)
-        # This fetches sent amounts of open votes (to avoid double spending)
-        open_tx_sender = [vt.amount
-                          for vt in self.__unverified_votes
-                          if vt.voter == participant]
-        tx_sender.append(open_tx_sender)
-
-        amount_sent = reduce(lambda tx_sum, tx_amt: tx_sum + sum(tx_amt)
-                             if len(tx_amt) > 0 else tx_sum + 0, tx_sender, 0)
+        # Votes which were already included in blocks come from the tally,
+        # open votes are checked as well (to avoid double spending)
+        amount_sent = self.__tally.get_sent(participant) + sum(
+            vt.amount for vt in self.__unverified_votes
+            if vt.voter == participant)
 
         if (amount_sent >= 1):
             return True
@@ -283,32 +470,59 @@ class Blockchain:
                  signature,
                  election,
                  amount=1,
-                 is_receiving=False):
+                 is_receiving=False,
+                 scheme=None):
 
+        if scheme is None:
+            scheme = self.settings['scheme']
+        # Only votes of the election's signature scheme are accepted
+        if scheme != self.settings['scheme']:
+            return False
         if self.get_is_vote(voter):
             return False
-        vote = Vote(voter, candidate, signature, amount)
+        vote = Vote(voter, candidate, signature, amount, scheme)
         if Verification.verify_vote(vote, self.get_balance, False):
-            self.__unverified_votes.append(vote)
+            # Keys are only interned for accepted votes, the dictionary
+            # never shrinks
+            self.__unverified_votes.append(self.keys.intern_vote(vote))
+            digest = hash_vote(vote)
+            self.seen.add(digest)
             self.save_data()
-            if not is_receiving:
-                for node in self.__peer_nodes:
-                    url = '{}/broadcast-vote'.format(node)
-                    try:
-                        response = requests.post(url,
-                                                 json={
-                                                     'voter': voter,
-                                                     'candidate': candidate,
-                                                     'amount': amount,
-                                                     'signature': signature,
-                                                     'election': election})
-                        if (response.status_code == 400 or
-                                response.status_code == 500):
-                            print('Vote declined, needs resolving')
-                            return False
-                    except requests.exceptions.ConnectionError:
-                        continue
-            return True
+            data, headers = json_request({
+                'voter': voter,
+                'candidate': candidate,
+                'amount': amount,
+                'signature': signature,
+                'scheme': scheme,
+                'election': election})
+            if is_receiving:
+                # Votes from a peer are passed on to the other peers
+                self.__peer_nodes.relay(
+                    election, 'vote', digest, '/broadcast-vote', data,
+                    headers)
+                return True
+            # With an event loop the vote is accepted before the peers
+            # answered, their answers are only logged
+            return not self.__peer_nodes.announce(
+                election, 'vote', digest, '/broadcast-vote', data, headers,
+                self.vote_declined)
+        return False
+
+    def vote_declined(self, responses):
+        """Log a peer which declined an announced vote and return whether
+        one did.
+
+        Arguments:
+            :responses: The responses of the peers to the vote.
+        """
+        for response in responses:
+            if response.status_code == 400 or response.status_code == 500:
+                logger.warning(
+                    'Vote declined by a peer, needs resolving',
+                    extra={'sample': DECLINED_LOG_SAMPLE, 'fields': {
+                        'election': self.election_id, 'peer': response.url,
+                        'status': response.status_code}})
+                return True
         return False
 
     def mine_block(self):
@@ -316,59 +530,79 @@ class Blockchain:
         # Fetch the currently last block of the blockchain
         if self.public_key is None:
             return None
-        last_block = self.__chain[-1]
+        authority = self.settings['consensus'] == 'poa'
+        if authority and (self.private_key is None or
+                          self.public_key not in self.settings['validators']):
+            return None
         # Hash the last block (=> to be able to compare it
         # to the stored hash value)
-        hashed_block = hash_block(last_block)
-        proof = self.proof_of_work()
-        reward_vote = Vote(
-            'MINING', self.public_key, '', MINING_REWARD)
+        hashed_block = self.get_tip_hash()
+        proof = None if authority else self.proof_of_work()
+        reward_vote = self.keys.intern_vote(Vote(
+            'MINING', self.public_key, '', MINING_REWARD))
         # Copy vote instead of manipulating the original unverified_votes list
         # This ensures that if for some reason the mining should fail,
         # we don't have the reward vote stored in the open votes
         copied_votes = self.__unverified_votes[:]
-        for vt in copied_votes:
-            if not Ballot.verify_vote(vt):
-                return None
+        if not all(Ballot.verify_votes(copied_votes)):
+            return None
         copied_votes.append(reward_vote)
-        block = Block(len(self.__chain), hashed_block,
-                      copied_votes, proof)
+        timestamp = time()
+        index = len(self.__chain)
+        root = merkle_root(copied_votes)
+        if authority:
+            # Validators seal blocks with their signature instead of
+            # searching for a proof of work
+            proof = Ballot.sign_message(
+                self.private_key,
+                Verification.seal_message(
+                    index, copied_votes, hashed_block, timestamp, root))
+        block = Block(index, hashed_block, copied_votes, proof, timestamp,
+                      root)
         self.__chain.append(block)
         self.__unverified_votes = []
         self.save_data()
-        for node in self.__peer_nodes:
-            url = '{}/broadcast-block'.format(node)
-            converted_block = block.__dict__.copy()
-            converted_block['votes'] = [
-                vt.__dict__ for vt in converted_block['votes']]
-            try:
-                response = requests.post(url, json={
-                    'block': converted_block,
-                    'election': self.election_id
-                    })
-                if response.status_code == 400 or response.status_code == 500:
-                    print('Block declined, needs resolving')
-                if response.status_code == 409:
-                    self.resolve_conflicts = True
-            except requests.exceptions.ConnectionError:
-                continue
+        self.apply_block(block)
+        block_hash = self.get_tip_hash()
+        self.seen.add(block_hash)
+        converted_block = block.to_dict()
+        data, headers = json_request({
+            'block': converted_block,
+            'election': self.election_id
+            })
+        self.__peer_nodes.announce(
+            self.election_id, 'block', block_hash, '/broadcast-block', data,
+            headers, self.block_declined)
         return block
 
+    def block_declined(self, responses):
+        """Log the peers which declined an announced block and flag a
+        conflict if a peer has a different chain.
+
+        Arguments:
+            :responses: The responses of the peers to the block.
+        """
+        for response in responses:
+            if response.status_code == 400 or response.status_code == 500:
+                logger.warning(
+                    'Block declined by a peer, needs resolving',
+                    extra={'sample': DECLINED_LOG_SAMPLE, 'fields': {
+                        'election': self.election_id, 'peer': response.url,
+                        'status': response.status_code}})
+            if response.status_code == 409:
+                self.resolve_conflicts = True
+
     def add_block(self, block):
-        votes = [Vote(vt['voter'],
-                 vt['candidate'],
-                 vt['signature'],
-                 vt['amount']) for vt in block['votes']]
-        proof_is_valid = Verification.valid_proof(
-            votes[:-1], block['previous_hash'], block['proof'])
-        hashes_match = hash_block(self.chain[-1]) == block['previous_hash']
-        if not proof_is_valid or not hashes_match:
+        # The keys of the votes are interned once the block was accepted
+        converted_block = Block.from_dict(block)
+        proof_is_valid = Verification.valid_seal(
+            converted_block, self.settings)
+        hashes_match = self.get_tip_hash() == block['previous_hash']
+        if (not proof_is_valid or not hashes_match or
+                not Verification.valid_merkle_root(converted_block)):
             return False
-        converted_block = Block(
-            block['index'],
-            block['previous_hash'],
-            votes, block['proof'],
-            block['timestamp'])
+        for vt in converted_block.votes:
+            self.keys.intern_vote(vt)
         self.__chain.append(converted_block)
         stored_transactions = self.__unverified_votes[:]
         for ivt in block['votes']:
@@ -380,46 +614,182 @@ class Blockchain:
                     try:
                         self.__unverified_votes.remove(unverified_votes)
                     except ValueError:
-                        print('Item was already removed')
+                        logger.debug('Vote was already removed')
         self.save_data()
+        self.apply_block(converted_block)
+        block_hash = self.get_tip_hash()
+        self.seen.add(block_hash)
+        # Blocks from a peer are passed on to the other peers
+        data, headers = json_request({
+            'block': block,
+            'election': self.election_id
+            })
+        self.__peer_nodes.relay(
+            self.election_id, 'block', block_hash, '/broadcast-block', data,
+            headers)
         return True
 
+    def wants(self, item_type, digest):
+        """Return whether an announced vote or block is new to this node.
+
+        Arguments:
+            :item_type: Either 'vote' or 'block'.
+            :digest: The hash of the vote or block.
+        """
+        if digest in self.seen:
+            return False
+        if item_type == 'block':
+            return digest != self.get_tip_hash()
+        return item_type == 'vote'
+
     def resolve(self, election):
-        winner_chain = self.chain
-        replace = False
-        for node in self.__peer_nodes:
-            url = '{}/chain?election={}'.format(node, election)
+        """Switch to the longest valid chain of the peers. Only the block
+        hashes are fetched from the peers to find the fork point, then only
+        the blocks after it are downloaded and verified, from the peers
+        with the longest chains until one is valid. In the async server
+        mode the requests are sent from the event loop (see
+        PeerManager.gather) and all peers are asked for their hashes at
+        once; the verification runs in the calling thread."""
+        winner_blocks = None
+        winner_fork = 0
+        offers = []
+        # Both http clients decompress the answers transparently
+        for node, response in self.__peer_nodes.gather(
+                'GET', '/chain?election={}&format=hashes'.format(election),
+                headers={'Accept-Encoding': 'gzip, deflate'}):
             try:
-                response = requests.get(url)
-                node_chain = response.json()
-                node_chain = [Block(
-                    block['index'],
-                    block['previous_hash'],
-                    [
-                        Vote(
-                            vt['voter'],
-                            vt['candidate'],
-                            vt['signature'],
-                            vt['amount']) for vt in block['votes']
-                    ],
-                    block['proof'],
-                    block['timestamp']) for block in node_chain
-                ]
-                node_chain_length = len(node_chain)
-                local_chain_length = len(winner_chain)
-                if (node_chain_length > local_chain_length and
-                        Verification.verify_chain(node_chain)):
-                    winner_chain = node_chain
-                    replace = True
-            except requests.exceptions.ConnectionError:
+                hashes = response.json()['hashes']
+                if len(hashes) > len(self.__chain):
+                    offers.append((node, hashes))
+            except (ValueError, KeyError, TypeError):
+                continue
+        # The longest chains are tried first, the fastest peers among equal
+        # ones
+        offers.sort(key=lambda offer: len(offer[1]), reverse=True)
+        for node, hashes in offers:
+            try:
+                fork = self.find_fork(hashes)
+                response = self.__peer_nodes.fetch(
+                    'GET', node,
+                    '/chain?election={}&format=packed&start={}'.format(
+                        election, fork),
+                    headers={'Accept-Encoding': 'gzip, deflate'})
+                blocks = self.unpack_chain(response.json())
+                # The peer may have moved on between both requests
+                if [hash_block(block) for block in blocks] != hashes[fork:]:
+                    continue
+                # The blocks are verified against the last shared block
+                anchor = [self.__chain[fork - 1]] if fork > 0 else []
+                if Verification.verify_chain(
+                        anchor + blocks, 1, self.settings):
+                    winner_blocks = blocks
+                    winner_fork = fork
+                    break
+            except (requests.exceptions.RequestException,
+                    async_http.RequestError, ValueError, KeyError,
+                    TypeError, IndexError):
                 continue
         self.resolve_conflicts = False
-        self.chain = winner_chain
+        replace = winner_blocks is not None
         if replace:
-            self.__unverified_votes = []
+            self.reorg(winner_fork, winner_blocks)
         self.save_data()
+        if replace:
+            self.save_checkpoint()
         return replace
 
+    def pack_chain(self, start=0):
+        """Return the chain in the packed wire format: the votes refer to
+        the voter and candidate keys by their index in a key list which is
+        sent once.
+
+        Arguments:
+            :start: The index of the first block which is packed.
+        """
+        packer = KeyDictionary()
+        chain = [block.to_dict(packer) for block in self.__chain[start:]]
+        return {'keys': packer.keys, 'chain': chain}
+
+    def unpack_chain(self, data):
+        """Rebuild a chain sent by a peer, either packed (see pack_chain)
+        or as a plain list of blocks by nodes which do not pack.
+
+        Arguments:
+            :data: The decoded JSON answer of the peer.
+        """
+        if isinstance(data, dict):
+            packer = KeyDictionary(data['keys'])
+            data = data['chain']
+        else:
+            packer = KeyDictionary()
+        # The keys are interned by reorg, only for the adopted blocks
+        return [Block.from_dict(block, packer) for block in data]
+
+    def find_fork(self, hashes):
+        """Return the number of leading blocks another chain shares with
+        ours. The search starts at the tip, so it costs as much as the
+        reorg is deep.
+
+        Arguments:
+            :hashes: The block hashes of the other chain.
+        """
+        height = min(len(self.__chain), len(hashes))
+        while height > 0:
+            if hashes[height - 1] == self.__chain.hash_at(height - 1):
+                return height
+            height -= 1
+        return 0
+
+    def reorg(self, fork, blocks):
+        """Switch to another chain which shares the first blocks with ours.
+        Only the orphaned blocks are undone and only the new blocks applied,
+        votes of orphaned blocks which are still valid are opened again.
+
+        Arguments:
+            :fork: The number of leading blocks both chains share.
+            :blocks: The blocks of the new chain from the fork point on.
+        """
+        orphaned = self.__chain[fork:]
+        for block in reversed(orphaned):
+            self.revert_block(block)
+        self.__chain.truncate(fork)
+        confirmed = set()
+        for block in blocks:
+            for vt in block.votes:
+                self.keys.intern_vote(vt)
+            self.__chain.append(block)
+            self.__tally.apply_block(block)
+            if self.__columns is not None:
+                self.__columns.append_block(block)
+            confirmed.update(vt.signature for vt in block.votes)
+        orphaned_votes = [(vt, True) for block in orphaned
+                          for vt in block.votes if vt.voter != 'MINING']
+        unverified_votes = []
+        open_voters = set()
+        for vt, was_orphaned in orphaned_votes + [
+                (vt, False) for vt in self.__unverified_votes]:
+            if (vt.signature in confirmed or vt.voter in open_voters or
+                    self.__tally.get_sent(vt.voter) > 0):
+                continue
+            # Blocks from peers are accepted on their proof, so the
+            # signatures of orphaned votes are checked before reopening them
+            if was_orphaned and (vt.scheme != self.settings['scheme'] or
+                                 not Ballot.verify_vote(vt)):
+                continue
+            unverified_votes.append(vt)
+            open_voters.add(vt.voter)
+        self.__unverified_votes = unverified_votes
+
+    def revert_block(self, block):
+        """Undo the effects of a block which is removed from the chain.
+
+        Arguments:
+            :block: The orphaned block.
+        """
+        self.__tally.revert_block(block)
+        if self.__columns is not None:
+            self.__columns.truncate(block.index)
+
     def add_peer_node(self, node):
         """Adds a new node to the peer node set.
 
@@ -440,4 +810,8 @@ class Blockchain:
 
     def get_peer_nodes(self):
         """Return a list of all connected peer nodes."""
-        return list(self.__peer_nodes)
+        return self.__peer_nodes.urls()
+
+    def get_peer_health(self):
+        """Return the latency, failures and last contact of every peer."""
+        return self.__peer_nodes.health()
@@ -0,0 +1,178 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import threading
+
+from utility.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def shard_for(election_id, shards):
+    """Return the index of the shard which hosts an election.
+
+    Arguments:
+        :election_id: The id of the election.
+        :shards: The number of shards.
+    """
+    try:
+        return int(election_id) % shards
+    except (TypeError, ValueError):
+        return 0
+
+
+class ElectionRegistry:
+    """Maps election ids to their blockchains. Stored elections are only
+    registered at boot and loaded on first access or by a background
+    warm-up, so the node can serve requests right away.
+
+    Attributes:
+        :loader: Creates the blockchain of a registered election.
+    """
+
+    def __init__(self, loader):
+        self.loader = loader
+        self.__elections = {}
+        self.__registered = set()
+        self.__locks = {}
+        self.__lock = threading.Lock()
+        # The number of requests changing every election and the elections
+        # which are being finalized
+        self.__writers = {}
+        self.__finalizing = set()
+        self.__changed = threading.Condition(self.__lock)
+
+    def register(self, election_id):
+        """Register a stored election without loading it yet.
+
+        Arguments:
+            :election_id: The id of the stored election.
+        """
+        with self.__lock:
+            if election_id not in self.__elections:
+                self.__registered.add(election_id)
+
+    def load(self, election_id):
+        """Return the blockchain of an election, loading it if it was only
+        registered so far. Raises a KeyError for unknown elections."""
+        blockchain = self.__elections.get(election_id)
+        if blockchain is not None:
+            return blockchain
+        with self.__lock:
+            if election_id not in self.__registered:
+                raise KeyError(election_id)
+            lock = self.__locks.setdefault(election_id, threading.Lock())
+        # Concurrent callers wait for the first one instead of loading the
+        # same election twice
+        with lock:
+            blockchain = self.__elections.get(election_id)
+            if blockchain is None:
+                blockchain = self.loader(election_id)
+                with self.__lock:
+                    self.__elections[election_id] = blockchain
+                    self.__registered.discard(election_id)
+                    self.__locks.pop(election_id, None)
+        return blockchain
+
+    def warm_up(self, workers=4):
+        """Load all registered elections in the background.
+
+        Arguments:
+            :workers: The number of elections loaded concurrently.
+        """
+        with self.__lock:
+            pending = list(self.__registered)
+        if not pending or workers < 1:
+            return None
+        executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='warm-up')
+        for election_id in pending:
+            executor.submit(self.__warm_up_election, election_id)
+        executor.shutdown(wait=False)
+        return executor
+
+    def __warm_up_election(self, election_id):
+        try:
+            self.load(election_id)
+        except KeyError:
+            # The election was removed before it was loaded
+            pass
+        except Exception:
+            # Nobody waits for the warm-up, so a broken election is only
+            # visible in the log (it fails again on first access)
+            logger.exception('Election %s could not be loaded', election_id,
+                             extra={'fields': {'election': election_id}})
+
+    def begin_write(self, election_id):
+        """Register a request which changes an election. It waits while
+        the election is finalized, so it sees the archive afterwards.
+
+        Arguments:
+            :election_id: The id of the election which is changed.
+        """
+        with self.__changed:
+            self.__changed.wait_for(
+                lambda: election_id not in self.__finalizing)
+            self.__writers[election_id] = (
+                self.__writers.get(election_id, 0) + 1)
+
+    def end_write(self, election_id):
+        """Unregister a request registered with begin_write."""
+        with self.__changed:
+            self.__writers[election_id] -= 1
+            if not self.__writers[election_id]:
+                del self.__writers[election_id]
+            self.__changed.notify_all()
+
+    @contextmanager
+    def finalizing(self, election_id):
+        """Hold off the requests which change an election while it is
+        finalized. Waits for the running ones to finish first.
+
+        Arguments:
+            :election_id: The id of the election which is finalized.
+        """
+        with self.__changed:
+            self.__changed.wait_for(
+                lambda: election_id not in self.__finalizing)
+            self.__finalizing.add(election_id)
+            self.__changed.wait_for(
+                lambda: election_id not in self.__writers)
+        try:
+            yield
+        finally:
+            with self.__changed:
+                self.__finalizing.discard(election_id)
+                self.__changed.notify_all()
+
+    def loaded(self):
+        """Return the (election id, blockchain) pairs of all elections
+        which are loaded already."""
+        with self.__lock:
+            return list(self.__elections.items())
+
+    def get(self, election_id, default=None):
+        try:
+            return self.load(election_id)
+        except KeyError:
+            return default
+
+    def __getitem__(self, election_id):
+        return self.load(election_id)
+
+    def __setitem__(self, election_id, blockchain):
+        with self.__lock:
+            self.__elections[election_id] = blockchain
+            self.__registered.discard(election_id)
+
+    def __contains__(self, election_id):
+        with self.__lock:
+            return (election_id in self.__elections or
+                    election_id in self.__registered)
+
+    def __iter__(self):
+        with self.__lock:
+            return iter(list(self.__elections) + list(self.__registered))
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__elections) + len(self.__registered)
@@ -0,0 +1,81 @@
+import threading
+
+from vote import Vote
+
+
+class KeyDictionary:
+    """Interns the voter and candidate keys of an election. Every distinct
+    key is held once and gets a compact integer id, which the storage and
+    the packed wire format use instead of the key itself. Votes keep
+    referring to the shared key strings, so hashing and signature checks
+    still see the full keys.
+
+    Attributes:
+        :keys: The interned keys, indexed by their id.
+    """
+
+    def __init__(self, keys=()):
+        self.keys = []
+        self.__ids = {}
+        self.__lock = threading.Lock()
+        for key in keys:
+            self.intern(key)
+
+    def intern(self, key):
+        """Return the id of a key, assigning the next free id to new keys.
+
+        Arguments:
+            :key: The voter or candidate key.
+        """
+        with self.__lock:
+            key_id = self.__ids.get(key)
+            if key_id is None:
+                key_id = len(self.keys)
+                self.keys.append(key)
+                self.__ids[key] = key_id
+            return key_id
+
+    def get_id(self, key, default=None):
+        """Return the id of a key or the default if it was never interned.
+        """
+        return self.__ids.get(key, default)
+
+    def key(self, key_id):
+        """Return the key with the given id."""
+        return self.keys[key_id]
+
+    def canonical(self, key):
+        """Return the shared copy of a key (interning it if it is new)."""
+        return self.keys[self.intern(key)]
+
+    def intern_vote(self, vote):
+        """Make a vote refer to the shared copies of its keys.
+
+        Arguments:
+            :vote: The vote which should be interned.
+        """
+        vote.voter = self.canonical(vote.voter)
+        vote.candidate = self.canonical(vote.candidate)
+        return vote
+
+    def encode_vote(self, vote):
+        """Return the packed [voter id, candidate id, amount, signature,
+        scheme] form of a vote."""
+        return [self.intern(vote.voter), self.intern(vote.candidate),
+                vote.amount, vote.signature, vote.scheme]
+
+    def decode_vote(self, values):
+        """Rebuild a vote from its packed form. Votes stored as dicts by
+        older versions are accepted as well.
+
+        Arguments:
+            :values: The packed or dict representation of the vote.
+        """
+        if isinstance(values, dict):
+            return self.intern_vote(Vote.from_dict(values))
+        voter_id, candidate_id, amount, signature, scheme = values
+        return Vote(self.key(voter_id), self.key(candidate_id), signature,
+                    amount, scheme)
+
+    def __len__(self):
+        return len(self.keys)
@@ -1,14 +1,198 @@
-from flask import Flask, jsonify, request
+from time import perf_counter
+
+from flask import Flask, g, jsonify, request
 from flask_cors import CORS
-from ballot import Ballot
-from blockchain import Blockchain
+from utility.response_cache import ResponseCache
+from utility.metrics import (
+    CHAIN_HEIGHT, MEMPOOL_VOTES, REQUEST_DURATION, registry)
+from utility.compression import (
+    MAX_BODY_SIZE, MIN_SIZE, DecompressingMiddleware, choose_encoding,
+    compress)
+from utility.capture import TrafficRecorder
+from utility.profiling import RequestProfiler
+from utility.tracing import tracer
+from utility import offload
+from utility.logger import (
+    LOG_FORMATS, LOG_LEVELS, configure, get_logger)
+from archive import ElectionArchive
+from async_server import WsgiToAsgi, serve
+from ballot import Ballot, SCHEMES
+from blockchain import Blockchain, CONSENSUS_MODES
+from election_registry import ElectionRegistry, shard_for
+from peers import DIGEST_HEADER, use_event_loop
+from storage import BACKENDS
+from vote_columns import TooManyBuckets
 
 
+logger = get_logger(__name__)
 app = Flask(__name__)
 CORS(app)
+# Peers may send compressed blocks and votes
+app.wsgi_app = DecompressingMiddleware(app.wsgi_app)
+
+
+# How node.py serves requests (see async_server.py)
+SERVER_MODES = ('threaded', 'async')
+
+# The routes which change an election, finalized elections reject them
+FROZEN_ENDPOINTS = frozenset([
+    'create_election', 'add_vote', 'mine', 'broadcast_vote',
+    'broadcast_block', 'resolve_conflicts', 'add_node', 'remove_node',
+    'finalize_election'])
+
+
+def load_election(election_id):
+    """Load a stored election the first time it is accessed. Finalized
+    elections are loaded from their archive."""
+    if ElectionArchive.exists(port, election_id):
+        return ElectionArchive.load(port, election_id, ballot.public_key)
+    return Blockchain(ballot.public_key, port, election_id,
+                      storage=storage_backend, cache_size=block_cache_size,
+                      private_key=ballot.private_key)
+
+
+elections = ElectionRegistry(load_election)
+response_cache = ResponseCache()
+profiler = RequestProfiler()
+# The /admin routes are only served when the node is started with --admin
+admin_enabled = False
+# Records the served requests when the node is started with --capture
+recorder = None
 
 
-elections = {}
+def cached_response(key, version, build, status=200):
+    """Serve a JSON response from the cache. Clients which send the
+    current ETag in If-None-Match get an empty 304 response.
+
+    Arguments:
+        :key: Identifies the response (route and election).
+        :version: The version of the data the response is built from.
+        :build: Returns the data of the response if it is not cached.
+        :status: The status code of a full response.
+    """
+    etag, body, encoding = response_cache.get(
+        key, version, build,
+        choose_encoding(request.headers.get('Accept-Encoding')))
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(
+            body, status=status, mimetype='application/json')
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def already_seen():
+    """Return whether a gossiped vote or block was handled before, judged
+    by the digest header and election query of the request alone (the body
+    is not parsed)."""
+    election = request.args.get('election', type=int)
+    digest = request.headers.get(DIGEST_HEADER)
+    if election is None or digest is None or election not in elections:
+        return False
+    return digest in elections[election].seen
+
+
+def admin_disabled():
+    """Return the response of an admin route on nodes started without
+    --admin (None if admin routes are enabled)."""
+    if admin_enabled:
+        return None
+    response = {
+        'message': 'Admin routes are disabled.'
+    }
+    return jsonify(response), 403
+
+
+@app.before_request
+def start_timer():
+    g.request_start = perf_counter()
+    # Admin requests would only show up in their own profiles
+    if not request.path.startswith('/admin'):
+        profiler.begin_request()
+        tracer.begin('{} {}'.format(request.method, request.path))
+
+
+@app.before_request
+def reject_finalized():
+    """Answer requests which would change a finalized election with 409.
+    The other requests which change an election are registered, so it is
+    not finalized while they run."""
+    if request.endpoint not in FROZEN_ENDPOINTS:
+        return None
+    election = request.args.get('election')
+    values = request.get_json(silent=True)
+    if election is None and isinstance(values, dict):
+        election = values.get(
+            'id' if request.endpoint == 'create_election' else 'election')
+    try:
+        election = int(election)
+    except (TypeError, ValueError):
+        return None
+    if request.endpoint != 'finalize_election':
+        elections.begin_write(election)
+        g.writing = election
+    blockchain = elections.get(election)
+    if not isinstance(blockchain, ElectionArchive):
+        return None
+    response = {
+        'message': 'Election is finalized.',
+        'height': blockchain.get_height()
+    }
+    return jsonify(response), 409
+
+
+@app.teardown_request
+def end_write(error=None):
+    election = g.pop('writing', None)
+    if election is not None:
+        elections.end_write(election)
+
+
+@app.teardown_request
+def finish_profiling(error=None):
+    profiler.end_request()
+    trace = tracer.end()
+    if trace is not None:
+        fields = {'{}_ms'.format(span['name']): round(span['total_ms'], 3)
+                  for span in trace['spans']}
+        logger.warning('Slow request %s took %.1f ms', trace['request'],
+                       trace['duration_ms'], extra={'fields': fields})
+
+
+@app.after_request
+def record_request(response):
+    """Observe the request latency per route (compression included, after
+    request hooks run in reverse order)."""
+    start = g.get('request_start')
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_DURATION.observe(
+            perf_counter() - start, route=route, method=request.method,
+            status=response.status_code)
+        if recorder is not None and not request.path.startswith('/admin'):
+            recorder.record(request, response, start)
+    return response
+
+
+@app.after_request
+def compress_response(response):
+    """Compress large responses for clients which accept it."""
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    if (encoding is None or response.direct_passthrough or
+            'Content-Encoding' in response.headers or
+            response.status_code < 200 or response.status_code >= 300):
+        return response
+    body = response.get_data()
+    if len(body) < MIN_SIZE:
+        return response
+    response.set_data(compress(body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
 
 
 @app.route('/create-election', methods=['POST'])
@@ -25,9 +209,43 @@ def create_election():
             'message': 'Some data is missing.'
             }
         return jsonify(response), 400
+    scheme = values.get('scheme', 'rsa')
+    if scheme not in SCHEMES:
+        response = {
+            'message': 'Unknown signature scheme.'
+            }
+        return jsonify(response), 400
+    consensus = values.get('consensus', 'pow')
+    if consensus not in CONSENSUS_MODES:
+        response = {
+            'message': 'Unknown consensus mode.'
+            }
+        return jsonify(response), 400
+    validators = values.get('validators')
+    if validators is not None and (
+            not isinstance(validators, list) or
+            not all(isinstance(key, str) for key in validators)):
+        response = {
+            'message': 'The validators must be a list of public keys.'
+            }
+        return jsonify(response), 400
+    # Nodes only accept blocks sealed by the validators they were given, so
+    # every node of the election has to be created with the same set
+    if consensus == 'poa' and not validators:
+        response = {
+            'message': 'Proof of authority needs a list of validators.'
+            }
+        return jsonify(response), 400
     if ballot.load_keys():
+        settings = {
+            'scheme': scheme,
+            'consensus': consensus,
+            'validators': validators or []
+        }
         blockchain = Blockchain(
-                ballot.public_key, port, values['id'], values['description'])
+                ballot.public_key, port, values['id'], values['description'],
+                storage_backend, settings, block_cache_size,
+                ballot.private_key)
         global elections
         elections[values['id']] = blockchain
         elections[values['id']].save_data()
@@ -44,7 +262,14 @@ def create_election():
 
 @app.route('/generateKeys', methods=['POST'])
 def generate_keys():
-    private_key, public_key = ballot.generate_keys()
+    values = request.get_json(silent=True) or {}
+    scheme = values.get('scheme', 'rsa')
+    if scheme not in SCHEMES:
+        response = {
+            'message': 'Unknown signature scheme.'
+        }
+        return jsonify(response), 400
+    private_key, public_key = ballot.generate_keys(scheme)
     if private_key:
         response = {
             'public_key': public_key,
@@ -122,6 +347,11 @@ def get_balance():
 
 @app.route('/broadcast-vote', methods=['POST'])
 def broadcast_vote():
+    if already_seen():
+        response = {
+            'message': 'Vote already seen.'
+            }
+        return jsonify(response), 200
     values = request.get_json()
     if not values:
         response = {
@@ -135,13 +365,23 @@ def broadcast_vote():
             }
         return jsonify(response), 400
     global elections
-    success = elections[int(values['election'])].add_vote(
+    blockchain = elections[int(values['election'])]
+    # Several peers may relay the same vote, copies are no failure
+    if blockchain.is_duplicate_vote(
+            values['voter'], values['candidate'], values['signature'],
+            values['amount'], values.get('scheme', 'rsa')):
+        response = {
+            'message': 'Vote already seen.'
+            }
+        return jsonify(response), 200
+    success = blockchain.add_vote(
         values['candidate'],
         values['voter'],
         values['signature'],
         int(values['election']),
         values['amount'],
-        is_receiving=True)
+        is_receiving=True,
+        scheme=values.get('scheme', 'rsa'))
     if success:
         response = {
             'message': 'Successfully added Vote!',
@@ -149,7 +389,8 @@ def broadcast_vote():
                 'voter': values['voter'],
                 'candidate': values['candidate'],
                 'amount': values['amount'],
-                'signature': values['signature']
+                'signature': values['signature'],
+                'scheme': values.get('scheme', 'rsa')
             }
         }
         return jsonify(response), 201
@@ -160,8 +401,55 @@ def broadcast_vote():
         return jsonify(response), 500
 
 
+@app.route('/inv', methods=['POST'])
+def inventory():
+    values = request.get_json()
+    if not values:
+        response = {
+            'message': 'No data found.'
+        }
+        return jsonify(response), 400
+    required = ['election', 'items']
+    if not all(key in values for key in required):
+        response = {
+            'message': 'Required data are missing.'
+        }
+        return jsonify(response), 400
+    items = values['items']
+    if not isinstance(items, list) or not all(
+            isinstance(item, dict) and
+            isinstance(item.get('type'), str) and
+            isinstance(item.get('hash'), str) for item in items):
+        response = {
+            'message': 'Items must be a list of types and hashes.'
+        }
+        return jsonify(response), 400
+    try:
+        election = int(values['election'])
+    except (TypeError, ValueError):
+        response = {
+            'message': 'Invalid election id.'
+        }
+        return jsonify(response), 400
+    global elections
+    blockchain = elections[election]
+    # Only the votes and blocks this node lacks are requested
+    wanted = [item['hash'] for item in items
+              if blockchain.wants(item['type'], item['hash'])]
+    response = {
+        'message': 'Inventory checked.',
+        'wanted': wanted
+    }
+    return jsonify(response), 200
+
+
 @app.route('/broadcast-block', methods=['POST'])
 def broadcast_block():
+    if already_seen():
+        response = {
+            'message': 'Block already seen.'
+        }
+        return jsonify(response), 200
     values = request.get_json()
     if not values:
         response = {
@@ -177,7 +465,7 @@ def broadcast_block():
     block = values['block']
     global elections
     election = int(values['election'])
-    if block['index'] == elections[election].chain[-1].index + 1:
+    if block['index'] == elections[election].get_height():
         if elections[int(values['election'])].add_block(block):
             response = {
                 'message': 'Block added'
@@ -188,7 +476,7 @@ def broadcast_block():
                 'message': 'Block seems invalid.'
             }
             return jsonify(response), 409
-    elif block['index'] > elections[int(values['election'])].chain[-1].index:
+    elif block['index'] > elections[election].get_height() - 1:
         response = {
             'message': 'Blockchain seems to differ from local blockchain.'
         }
@@ -229,7 +517,15 @@ def add_vote():
             'message': 'Voter already Voted.'
         }
         return jsonify(response), 400
-    signature = ballot.sign_vote(voter, voter_private_key, candidate)
+    scheme = elections[int(values['election'])].settings['scheme']
+    try:
+        signature = ballot.sign_vote(
+            voter, voter_private_key, candidate, scheme=scheme)
+    except (ValueError, TypeError):
+        response = {
+            'message': 'Invalid keys for the election.'
+        }
+        return jsonify(response), 400
     success = elections[int(values['election'])].add_vote(
         candidate,
         voter,
@@ -242,6 +538,7 @@ def add_vote():
                 'voter': voter,
                 'candidate': candidate,
                 'signature': signature,
+                'scheme': scheme,
                 'election': int(values['election'])
             },
             'funds': elections[int(values['election'])].get_balance(voter)
@@ -274,9 +571,7 @@ def mine():
         return jsonify(response), 409
     block = elections[int(values['election'])].mine_block()
     if block is not None:
-        dict_block = block.__dict__.copy()
-        dict_block['votes'] = [
-            vt.__dict__ for vt in dict_block['votes']]
+        dict_block = block.to_dict()
         response = {
             'message': 'Block added successfully.',
             'block': dict_block
@@ -313,6 +608,53 @@ def resolve_conflicts():
     return jsonify(response), 200
 
 
+@app.route('/finalize', methods=['POST'])
+def finalize_election():
+    values = request.get_json()
+    if not values:
+        response = {
+            'message': 'No data found.'
+        }
+        return jsonify(response), 400
+    required_fields = ['election']
+    if not all(field in values for field in required_fields):
+        response = {
+            'message': 'Election ID Needed!'
+        }
+        return jsonify(response), 400
+    global elections
+    election = int(values['election'])
+    height = values.get('height')
+    # Votes and blocks are not added while the chain is sealed
+    with elections.finalizing(election):
+        blockchain = elections[election]
+        if isinstance(blockchain, ElectionArchive):
+            response = {
+                'message': 'Election is finalized.',
+                'height': blockchain.get_height()
+            }
+            return jsonify(response), 409
+        try:
+            archive = ElectionArchive.seal(
+                blockchain, int(height) if height is not None else None)
+        except ValueError:
+            response = {
+                'message': 'Invalid height for the election.'
+            }
+            return jsonify(response), 400
+        # From now on the election is served from its archive, its
+        # storage is superseded
+        elections[election] = archive
+        blockchain.storage.remove()
+    response = {
+        'message': 'Election finalized.',
+        'height': archive.get_height(),
+        'tip_hash': archive.get_tip_hash(),
+        'results': archive.get_all_results()
+    }
+    return jsonify(response), 201
+
+
 @app.route('/votes', methods=['POST'])
 def get_unverified_vote():
     values = request.get_json()
@@ -340,13 +682,31 @@ def get_chain():
             'message': 'Election id is missing.'
         }
         return jsonify(response), 400
+    start = request.args.get('start', default=0, type=int)
+    if start < 0:
+        response = {
+            'message': 'The start block must not be negative.'
+        }
+        return jsonify(response), 400
     global elections
-    chain_snapshot = elections[election].chain
-    dict_chain = [block.__dict__.copy() for block in chain_snapshot]
-    for dict_block in dict_chain:
-        dict_block['votes'] = [
-            vt.__dict__ for vt in dict_block['votes']]
-    return jsonify(dict_chain), 200
+    blockchain = elections[election]
+    # Peers ask for the block hashes first and then for the packed blocks
+    # after the fork point, which send every key only once
+    chain_format = request.args.get('format')
+    if chain_format not in ('packed', 'hashes'):
+        chain_format = None
+    if chain_format != 'packed':
+        start = 0
+
+    def build():
+        if chain_format == 'hashes':
+            return {'hashes': blockchain.get_block_hashes()}
+        if chain_format == 'packed':
+            return blockchain.pack_chain(start)
+        return [block.to_dict() for block in blockchain.chain]
+    return cached_response(
+        ('chain', election, chain_format, start), blockchain.get_version(),
+        build)
 
 
 @app.route('/totalmines', methods=['GET'])
@@ -433,6 +793,69 @@ def add_results():
     return jsonify(response), 200
 
 
+@app.route('/results/all', methods=['GET'])
+def get_all_results():
+    election = request.args.get('election', default=0, type=int)
+    if not (election):
+        response = {
+            'message': 'Election id is missing.'
+        }
+        return jsonify(response), 400
+    global elections
+    blockchain = elections[election]
+
+    def build():
+        return {
+            'message': 'Fetched request successfully.',
+            'Votes': blockchain.get_all_results()
+        }
+    return cached_response(
+        ('results/all', election), blockchain.get_version(), build)
+
+
+@app.route('/analytics', methods=['GET'])
+def get_analytics():
+    election = request.args.get('election', default=0, type=int)
+    if not (election):
+        response = {
+            'message': 'Election id is missing.'
+        }
+        return jsonify(response), 400
+    # The length of a time bucket in whole seconds (an hour by default)
+    try:
+        bucket = int(request.args.get('bucket', default=3600))
+    except ValueError:
+        bucket = 0
+    if bucket < 1:
+        response = {
+            'message': 'Bucket must be a positive number of seconds.'
+        }
+        return jsonify(response), 400
+    candidate = request.args.get('candidate')
+    global elections
+    blockchain = elections[election]
+
+    def build():
+        return {
+            'message': 'Fetched request successfully.',
+            'analytics': blockchain.get_analytics(bucket, candidate)
+        }
+    try:
+        # Only candidates with confirmed votes are cached, so arbitrary
+        # names cannot fill the cache
+        if candidate is not None and not blockchain.get_results_count(
+                candidate):
+            return jsonify(build()), 200
+        return cached_response(
+            ('analytics', election, bucket, candidate),
+            blockchain.get_version(), build)
+    except TooManyBuckets as error:
+        response = {
+            'message': str(error)
+        }
+        return jsonify(response), 400
+
+
 @app.route('/results-voters', methods=['POST'])
 def get_results_voters():
     values = request.get_json()
@@ -449,6 +872,31 @@ def get_results_voters():
         return jsonify(response), 400
     global elections
     election = int(values['election'])
+    if values.get('count_only'):
+        count = elections[election].get_results_count(values['candidate'])
+        response = {
+            'message': 'Fetched request successfully.',
+            'Count': count
+        }
+        return jsonify(response), 200
+    if 'cursor' in values or 'limit' in values:
+        try:
+            voters, next_cursor = elections[
+                election].get_results_voters_page(
+                    values['candidate'],
+                    values.get('cursor'),
+                    int(values.get('limit', 100)))
+        except (TypeError, ValueError):
+            response = {
+                'message': 'Invalid cursor or limit.'
+            }
+            return jsonify(response), 400
+        response = {
+            'message': 'Fetched request successfully.',
+            'Voters': voters,
+            'next_cursor': next_cursor
+        }
+        return jsonify(response), 200
     results = elections[election].get_results_voters(values['candidate'])
     response = {
         'message': 'Fetched request successfully.',
@@ -457,6 +905,60 @@ def get_results_voters():
     return jsonify(response), 200
 
 
+@app.route('/vote-proof', methods=['POST'])
+def get_vote_proof():
+    values = request.get_json()
+    if not values:
+        response = {
+            'message': 'No data found.'
+        }
+        return jsonify(response), 400
+    required_fields = ['signature', 'election']
+    if not all(field in values for field in required_fields):
+        response = {
+            'message': 'Required data is missing.'
+        }
+        return jsonify(response), 400
+    global elections
+    election = int(values['election'])
+    vote_proof = elections[election].get_vote_proof(values['signature'])
+    if vote_proof is None:
+        response = {
+            'message': 'No confirmed vote with a merkle proof found.'
+        }
+        return jsonify(response), 404
+    response = {
+        'message': 'Fetched request successfully.',
+        'Proof': vote_proof
+    }
+    return jsonify(response), 200
+
+
+@app.route('/vote-history', methods=['POST'])
+def get_vote_history():
+    values = request.get_json()
+    if not values:
+        response = {
+            'message': 'No data found.'
+        }
+        return jsonify(response), 400
+    required_fields = ['voter', 'election']
+    if not all(field in values for field in required_fields):
+        response = {
+            'message': 'Required data is missing.'
+        }
+        return jsonify(response), 400
+    global elections
+    election = int(values['election'])
+    history = elections[election].get_vote_history(values['voter'])
+    response = {
+        'message': 'Fetched request successfully.',
+        'Votes': [
+            {'block': index, 'vote': vt.__dict__} for index, vt in history]
+    }
+    return jsonify(response), 200
+
+
 @app.route('/node', methods=['POST'])
 def add_node():
     values = request.get_json()
@@ -512,18 +1014,36 @@ def get_nodes():
         }
         return jsonify(response), 400
     global elections
-    nodes = elections[election].get_peer_nodes()
+    blockchain = elections[election]
+
+    def build():
+        return {
+            'all_nodes': blockchain.get_peer_nodes()
+        }
+    return cached_response(
+        ('nodes', election), blockchain.get_version(), build, 201)
+
+
+@app.route('/nodes/health', methods=['GET'])
+def get_nodes_health():
+    election = request.args.get('election', default=0, type=int)
+    if not (election):
+        response = {
+            'message': 'Election id is missing.'
+        }
+        return jsonify(response), 400
+    global elections
     response = {
-        'all_nodes': nodes
+        'peers': elections[election].get_peer_health()
     }
-    return jsonify(response), 201
+    return jsonify(response), 200
 
 
 @app.route('/election', methods=['GET'])
 def get_elections():
     election = request.args.get('election', default=0, type=int)
     global elections
-    if elections.get(election) is not None:
+    if election in elections:
         response = {
             'election': 1
         }
@@ -535,6 +1055,118 @@ def get_elections():
         return jsonify(response), 201
 
 
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    # Gauges are sampled at scrape time, elections which were not loaded
+    # yet are left out instead of being loaded for a scrape
+    for election, blockchain in elections.loaded():
+        MEMPOOL_VOTES.set(
+            len(blockchain.get_unverified_votes()), election=election)
+        CHAIN_HEIGHT.set(blockchain.get_height(), election=election)
+    return app.response_class(
+        registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/admin/profile', methods=['POST'])
+def start_profile():
+    disabled = admin_disabled()
+    if disabled is not None:
+        return disabled
+    values = request.get_json(silent=True) or {}
+    count = values.get('requests')
+    seconds = values.get('seconds')
+    if (count is None) == (seconds is None):
+        response = {
+            'message': 'Either requests or seconds is required.'
+        }
+        return jsonify(response), 400
+    try:
+        count = int(count) if count is not None else None
+        seconds = float(seconds) if seconds is not None else None
+    except (TypeError, ValueError):
+        response = {
+            'message': 'Requests and seconds must be numbers.'
+        }
+        return jsonify(response), 400
+    if (count or seconds or 0) <= 0:
+        response = {
+            'message': 'Requests and seconds must be positive.'
+        }
+        return jsonify(response), 400
+    profiler.start(count, seconds)
+    response = {
+        'message': 'Profiling started.',
+        'requests': count,
+        'seconds': seconds
+    }
+    return jsonify(response), 201
+
+
+@app.route('/admin/profile', methods=['GET'])
+def get_profile():
+    disabled = admin_disabled()
+    if disabled is not None:
+        return disabled
+    sort = request.args.get('sort', 'cumulative')
+    limit = request.args.get('limit', 40, type=int)
+    try:
+        report = profiler.report(sort, limit)
+    except KeyError:
+        response = {
+            'message': 'Unknown sort key {}.'.format(sort)
+        }
+        return jsonify(response), 400
+    if report is None:
+        response = {
+            'message': 'No requests were profiled yet.',
+            'active': profiler.active
+        }
+        return jsonify(response), 404
+    header = '# {} requests profiled, session {}\n'.format(
+        profiler.profiled, 'running' if profiler.active else 'finished')
+    return app.response_class(header + report, mimetype='text/plain')
+
+
+@app.route('/admin/traces', methods=['GET'])
+def get_traces():
+    disabled = admin_disabled()
+    if disabled is not None:
+        return disabled
+    response = {
+        'threshold_ms': tracer.threshold * 1000
+        if tracer.threshold is not None else None,
+        'traces': tracer.slow_traces()
+    }
+    return jsonify(response), 200
+
+
+@app.route('/admin/traces', methods=['POST'])
+def set_trace_threshold():
+    disabled = admin_disabled()
+    if disabled is not None:
+        return disabled
+    values = request.get_json(silent=True)
+    if not values or 'threshold_ms' not in values:
+        response = {
+            'message': 'Required data are missing.'
+        }
+        return jsonify(response), 400
+    threshold = values['threshold_ms']
+    try:
+        tracer.threshold = (float(threshold) / 1000
+                            if threshold is not None else None)
+    except (TypeError, ValueError):
+        response = {
+            'message': 'The threshold must be a number or null.'
+        }
+        return jsonify(response), 400
+    response = {
+        'message': 'Slow request threshold set.',
+        'threshold_ms': threshold
+    }
+    return jsonify(response), 200
+
+
 @app.route('/')
 def serverStatus():
     return 'Server Running Correctly!'
@@ -542,10 +1174,87 @@ def serverStatus():
 
 if __name__ == '__main__':
     from argparse import ArgumentParser
+    import signal
+    import sys
     parser = ArgumentParser()
     parser.add_argument('-p', '--port', type=int, default=8900)
+    parser.add_argument('-s', '--storage', choices=sorted(BACKENDS),
+                        default='file')
+    parser.add_argument('-w', '--warm-up-workers', type=int, default=4,
+                        help='elections preloaded concurrently at boot '
+                        '(0 loads every election on first access)')
+    parser.add_argument('-c', '--block-cache-votes', type=int, default=None,
+                        help='votes of old blocks kept in memory per '
+                        'election (sqlite storage only, default: all)')
+    parser.add_argument('--max-body-size', type=int, default=MAX_BODY_SIZE,
+                        help='the largest request body in bytes, before and '
+                        'after decompression (default: 16 MiB)')
+    parser.add_argument('--admin', action='store_true',
+                        help='serve the /admin profiling and tracing routes')
+    parser.add_argument('--slow-request-ms', type=float, default=None,
+                        help='log a span breakdown of requests slower than '
+                        'this (default: off)')
+    parser.add_argument('--capture', metavar='PATH', default=None,
+                        help='record the served requests to a JSONL capture '
+                        'file (private keys are redacted)')
+    parser.add_argument('--socket', metavar='PATH', default=None,
+                        help='listen on this Unix socket instead of the port '
+                        '(used by shard_router.py)')
+    parser.add_argument('--shard', metavar='INDEX/COUNT', default=None,
+                        help='only host the elections of this shard (used '
+                        'by shard_router.py)')
+    parser.add_argument('--server', choices=SERVER_MODES, default='threaded',
+                        help='serve with a thread per connection or from an '
+                        'asyncio event loop (default: threaded)')
+    parser.add_argument('--handler-threads', type=int, default=32,
+                        help='requests handled at the same time by the async '
+                        'server (default: 32)')
+    parser.add_argument('--pow-processes', type=int, default=0,
+                        help='worker processes for proof of work and '
+                        'signature checks (default: 0, in the request '
+                        'thread)')
+    parser.add_argument('--log-level', choices=LOG_LEVELS, default='INFO')
+    parser.add_argument('--log-format', choices=LOG_FORMATS, default='text')
     args = parser.parse_args()
+    configure(args.log_level, args.log_format)
+    shard, shards = 0, 1
+    if args.shard is not None:
+        try:
+            shard, shards = (int(part) for part in args.shard.split('/'))
+        except ValueError:
+            parser.error('--shard must be given as INDEX/COUNT')
     port = args.port
+    storage_backend = args.storage
+    block_cache_size = args.block_cache_votes
+    app.wsgi_app.max_size = args.max_body_size
+    admin_enabled = args.admin
+    if args.slow_request_ms is not None:
+        tracer.threshold = args.slow_request_ms / 1000
+    if args.capture is not None:
+        recorder = TrafficRecorder(args.capture, headers=(DIGEST_HEADER,))
     ballot = Ballot(port)
-    blockchain = Blockchain(ballot.public_key, port)
-    app.run(host='0.0.0.0', port=port)
\ No newline at end of file
+    ballot.load_keys()
+    stored = BACKENDS[storage_backend].discover(port)
+    for election_id in stored + [
+            election_id for election_id in ElectionArchive.discover(port)
+            if election_id not in stored]:
+        if shard_for(election_id, shards) == shard:
+            elections.register(election_id)
+    elections.warm_up(args.warm_up_workers)
+    offload.configure(args.pow_processes)
+    # Leave the server on SIGTERM too, so the worker processes stop
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    try:
+        if args.server == 'async':
+            # Gossip to peers runs on the event loop of the server
+            serve(WsgiToAsgi(app, args.handler_threads, use_event_loop),
+                  port=port, socket_path=args.socket,
+                  max_body_size=args.max_body_size)
+        elif args.socket is not None:
+            app.run(host='unix://' + args.socket)
+        else:
+            app.run(host='0.0.0.0', port=port)
+    finally:
+        # The pool is stopped while the interpreter is still intact, so
+        # its workers exit and its semaphores are released
+        offload.shutdown()
\ No newline at end of file
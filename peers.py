@@ -0,0 +1,335 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from time import time
+
+import requests
+
+from utility import async_http
+from utility.metrics import (
+    PEER_REQUEST_DURATION, PEER_REQUEST_FAILURES, RELAYS_DROPPED)
+from utility.printable import Printable
+from utility.tracing import tracer
+
+# Consecutive failures after which a peer's circuit opens
+FAILURE_THRESHOLD = 3
+# The first and the longest wait (seconds) before an open circuit is probed
+BASE_BACKOFF = 1.0
+MAX_BACKOFF = 300.0
+# How long a single request to a peer may take (seconds)
+PEER_TIMEOUT = 5
+# The weight of the newest sample in the latency average
+LATENCY_WEIGHT = 0.3
+# The header gossiped votes and blocks carry their digest in
+DIGEST_HEADER = 'X-Digest'
+# The event loop gossip runs on in the async server mode (None sends it
+# from the request threads)
+event_loop = None
+# The threads which relay votes and blocks without an event loop, and the
+# relays which may wait for them (further ones are dropped, peers catch up
+# when they resolve conflicts)
+RELAY_THREADS = 4
+RELAY_BACKLOG = 256
+relay_executor = ThreadPoolExecutor(RELAY_THREADS, thread_name_prefix='relay')
+relay_slots = threading.BoundedSemaphore(RELAY_BACKLOG)
+
+
+def use_event_loop(loop):
+    """Send gossip to peers without blocking on the given event loop.
+
+    Arguments:
+        :loop: A running event loop (None to send from threads again).
+    """
+    global event_loop
+    event_loop = loop
+
+
+def inventory_request(election_id, item_type, digest, headers):
+    """Return the inventory announcing a vote or block and the headers
+    of its payload."""
+    inventory = {
+        'election': election_id,
+        'items': [{'type': item_type, 'hash': digest}]
+    }
+    # The digest travels in a header, so peers can drop a payload they
+    # have seen without parsing it
+    return inventory, dict(headers, **{DIGEST_HEADER: digest})
+
+
+class PeerHealth(Printable):
+    """The health of a single peer node.
+
+    Attributes:
+        :url: The URL of the peer.
+        :latency: The moving average of the response time (None until the
+        peer answered once).
+        :failures: The number of consecutive failed requests.
+        :last_seen: When the peer answered last (None if it never did).
+        :retry_at: When an open circuit may be probed again (0 if closed).
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.latency = None
+        self.failures = 0
+        self.last_seen = None
+        self.retry_at = 0
+
+
+class PeerManager:
+    """Tracks the peer nodes of an election. Peers which keep failing get
+    their circuit opened and are only probed again after an exponentially
+    growing backoff; healthy peers are contacted fastest first."""
+
+    def __init__(self, urls=(), election_id=None):
+        self.election_id = election_id
+        self.__peers = {}
+        self.__lock = threading.Lock()
+        for url in urls:
+            self.add(url)
+
+    def add(self, url):
+        """Add a peer (a known peer keeps its health)."""
+        with self.__lock:
+            self.__peers.setdefault(url, PeerHealth(url))
+
+    def discard(self, url):
+        """Remove a peer if it is known."""
+        with self.__lock:
+            self.__peers.pop(url, None)
+
+    def urls(self):
+        """Return the URLs of all peers."""
+        with self.__lock:
+            return list(self.__peers)
+
+    def health(self):
+        """Return the health of all peers as dicts."""
+        with self.__lock:
+            return [peer.__dict__.copy() for peer in self.__peers.values()]
+
+    def available(self):
+        """Return the URLs of the peers worth contacting, fastest first.
+        Peers with an open circuit are left out until their backoff
+        passed."""
+        now = time()
+        with self.__lock:
+            peers = [peer for peer in self.__peers.values()
+                     if peer.retry_at <= now]
+        # Peers which never answered are tried after the measured ones
+        peers.sort(key=lambda peer: (peer.latency is None, peer.latency))
+        return [peer.url for peer in peers]
+
+    def record_success(self, url, latency):
+        """Close the circuit of a peer and update its latency."""
+        with self.__lock:
+            peer = self.__peers.get(url)
+            if peer is None:
+                return
+            if peer.latency is None:
+                peer.latency = latency
+            else:
+                peer.latency += LATENCY_WEIGHT * (latency - peer.latency)
+            peer.failures = 0
+            peer.last_seen = time()
+            peer.retry_at = 0
+
+    def record_failure(self, url):
+        """Count a failed request and open the circuit if the peer failed
+        too often."""
+        with self.__lock:
+            peer = self.__peers.get(url)
+            if peer is None:
+                return
+            peer.failures += 1
+            if peer.failures >= FAILURE_THRESHOLD:
+                backoff = min(
+                    MAX_BACKOFF,
+                    BASE_BACKOFF * 2 ** (peer.failures - FAILURE_THRESHOLD))
+                peer.retry_at = time() + backoff
+
+    def request(self, method, url, path, **kwargs):
+        """Send a request to a peer and record how it went. Raises a
+        requests.exceptions.RequestException if the peer did not answer.
+
+        Arguments:
+            :method: The HTTP method.
+            :url: The URL of the peer.
+            :path: The path (and query) on the peer.
+        """
+        kwargs.setdefault('timeout', PEER_TIMEOUT)
+        route = path.split('?')[0]
+        start = time()
+        try:
+            response = requests.request(method, url + path, **kwargs)
+        except requests.exceptions.RequestException:
+            self.record_failure(url)
+            PEER_REQUEST_FAILURES.inc(election=self.election_id, path=route)
+            raise
+        latency = time() - start
+        self.record_success(url, latency)
+        PEER_REQUEST_DURATION.observe(
+            latency, election=self.election_id, path=route)
+        return response
+
+    async def request_async(self, method, url, path, **kwargs):
+        """Like request, but without blocking the event loop. Raises an
+        async_http.RequestError if the peer did not answer.
+
+        Arguments:
+            :method: The HTTP method.
+            :url: The URL of the peer.
+            :path: The path (and query) on the peer.
+        """
+        kwargs.setdefault('timeout', PEER_TIMEOUT)
+        route = path.split('?')[0]
+        start = time()
+        try:
+            response = await async_http.fetch(method, url + path, **kwargs)
+        except async_http.RequestError:
+            self.record_failure(url)
+            PEER_REQUEST_FAILURES.inc(election=self.election_id, path=route)
+            raise
+        latency = time() - start
+        self.record_success(url, latency)
+        PEER_REQUEST_DURATION.observe(
+            latency, election=self.election_id, path=route)
+        return response
+
+    def fetch(self, method, url, path, **kwargs):
+        """Send a request to a peer (see request). With an event loop (see
+        use_event_loop) it is sent from the loop and the calling thread
+        only waits for the answer. Raises a
+        requests.exceptions.RequestException or an async_http.RequestError
+        if the peer did not answer.
+
+        Arguments:
+            :method: The HTTP method.
+            :url: The URL of the peer.
+            :path: The path (and query) on the peer.
+        """
+        if event_loop is not None:
+            return asyncio.run_coroutine_threadsafe(
+                self.request_async(method, url, path, **kwargs),
+                event_loop).result()
+        return self.request(method, url, path, **kwargs)
+
+    def gather(self, method, path, **kwargs):
+        """Send a request to all available peers and return the (url,
+        response) of those which answered, fastest first. With an event
+        loop (see use_event_loop) all peers are asked at once on it,
+        otherwise one after the other.
+
+        Arguments:
+            :method: The HTTP method.
+            :path: The path (and query) on the peers.
+        """
+        if event_loop is not None:
+            return asyncio.run_coroutine_threadsafe(
+                self.gather_async(method, path, **kwargs),
+                event_loop).result()
+        answers = []
+        for url in self.available():
+            try:
+                answers.append(
+                    (url, self.request(method, url, path, **kwargs)))
+            except requests.exceptions.RequestException:
+                continue
+        return answers
+
+    async def gather_async(self, method, path, **kwargs):
+        """Like gather, but on the event loop (see gather for the
+        arguments)."""
+        urls = self.available()
+
+        async def ask(url):
+            try:
+                return await self.request_async(method, url, path, **kwargs)
+            except async_http.RequestError:
+                return None
+
+        responses = await asyncio.gather(*(ask(url) for url in urls))
+        return [(url, response) for url, response in zip(urls, responses)
+                if response is not None]
+
+    @tracer.span('peer_broadcast')
+    def announce(self, election_id, item_type, digest, path, data, headers,
+                 handle=None):
+        """Announce a vote or block to the available peers (inv) and send
+        the payload only to those which ask for it. Returns the responses
+        of the peers which received the payload, or what handle returns
+        for them. With an event loop (see use_event_loop) the peers are
+        contacted concurrently on it and the calling thread does not wait:
+        handle is called on the loop once all peers answered and None is
+        returned.
+
+        Arguments:
+            :election_id: The election the vote or block belongs to.
+            :item_type: Either 'vote' or 'block'.
+            :digest: The hash of the vote or block.
+            :path: The route the payload is posted to.
+            :data: The encoded payload (see compression.json_request).
+            :headers: The headers of the payload.
+            :handle: Called with the responses (optional).
+        """
+        if event_loop is not None:
+            future = asyncio.run_coroutine_threadsafe(self.announce_async(
+                election_id, item_type, digest, path, data, headers),
+                event_loop)
+            if handle is not None:
+                future.add_done_callback(lambda done: handle(done.result()))
+            return None
+        inventory, headers = inventory_request(
+            election_id, item_type, digest, headers)
+        responses = []
+        for url in self.available():
+            try:
+                response = self.request('POST', url, '/inv', json=inventory)
+                # Peers without the inventory route get the payload anyway
+                if (response.status_code == 200 and
+                        digest not in response.json()['wanted']):
+                    continue
+                responses.append(self.request(
+                    'POST', url, '{}?election={}'.format(path, election_id),
+                    data=data, headers=headers))
+            except (requests.exceptions.RequestException, ValueError,
+                    KeyError):
+                continue
+        return responses if handle is None else handle(responses)
+
+    async def announce_async(self, election_id, item_type, digest, path,
+                             data, headers):
+        """Like announce, but all peers are contacted at once on the event
+        loop (see announce for the arguments)."""
+        inventory, headers = inventory_request(
+            election_id, item_type, digest, headers)
+
+        async def offer(url):
+            try:
+                response = await self.request_async(
+                    'POST', url, '/inv', json_body=inventory)
+                if (response.status_code == 200 and
+                        digest not in response.json()['wanted']):
+                    return None
+                return await self.request_async(
+                    'POST', url, '{}?election={}'.format(path, election_id),
+                    data=data, headers=headers)
+            except (async_http.RequestError, ValueError, KeyError):
+                return None
+
+        responses = await asyncio.gather(
+            *(offer(url) for url in self.available()))
+        return [response for response in responses if response is not None]
+
+    def relay(self, *args):
+        """Announce a vote or block received from another peer in the
+        background (see announce for the arguments)."""
+        if event_loop is not None:
+            asyncio.run_coroutine_threadsafe(
+                self.announce_async(*args), event_loop)
+            return
+        if not relay_slots.acquire(blocking=False):
+            RELAYS_DROPPED.inc(election=self.election_id)
+            return
+        future = relay_executor.submit(self.announce, *args)
+        future.add_done_callback(lambda _: relay_slots.release())
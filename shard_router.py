@@ -0,0 +1,271 @@
+"""Runs a node as several worker processes behind one endpoint.
+
+Usage (from the repository root):
+
+    python shard_router.py -p 8900 --shards 4 -s sqlite
+
+Every worker is a node.py process which hosts the elections of its shard
+and listens on a Unix socket. The router answers on the public port and
+forwards each request to the worker of the election it names (the
+election query argument, the election field of the body or the id of a
+new election). Requests without an election go to the first worker. The
+workers share the identity (port) and the keys of the node, so stored
+elections are picked up by the worker of their shard. Arguments the router
+does not know are passed on to the workers.
+"""
+
+from argparse import ArgumentParser
+import atexit
+import http.client
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+from time import sleep, time
+
+from flask import Flask, request
+
+from election_registry import shard_for
+from utility.compression import DecompressingMiddleware
+from utility.logger import (
+    LOG_FORMATS, LOG_LEVELS, configure, get_logger)
+
+NODE_SCRIPT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'node.py')
+# How long a worker may take to start (seconds)
+STARTUP_TIMEOUT = 30
+# How often the workers are checked and restarted if they exited (seconds)
+MONITOR_INTERVAL = 1.0
+# Headers which only concern a single connection
+HOP_HEADERS = ('connection', 'keep-alive', 'transfer-encoding',
+               'content-length', 'host', 'server', 'date')
+METHODS = ['GET', 'POST', 'PUT', 'DELETE', 'PATCH', 'OPTIONS', 'HEAD']
+
+
+def add_label(line, name, value):
+    """Add a label to a sample line of the Prometheus text format."""
+    label = '{}="{}"'.format(name, value)
+    if '{' in line:
+        index = line.index('{') + 1
+        return line[:index] + label + ',' + line[index:]
+    metric, rest = line.split(' ', 1)
+    return '{}{{{}}} {}'.format(metric, label, rest)
+
+
+def merge_metrics(texts):
+    """Merge the metrics of the workers into one exposition in which every
+    sample is labelled with the shard it comes from.
+
+    Arguments:
+        :texts: The (shard, exposition) pairs of the workers.
+    """
+    comments, samples, names = {}, {}, []
+    for shard, text in texts:
+        name = None
+        for line in text.splitlines():
+            if line.startswith('# '):
+                name = line.split(' ')[2]
+                if name not in comments:
+                    comments[name], samples[name] = [], []
+                    names.append(name)
+                if line not in comments[name]:
+                    comments[name].append(line)
+            elif line and name is not None:
+                samples[name].append(add_label(line, 'shard', shard))
+    lines = []
+    for name in names:
+        lines += comments[name] + samples[name]
+    return '\n'.join(lines) + '\n'
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """An HTTP connection over a Unix socket."""
+
+    def __init__(self, path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class Worker:
+    """A node process which hosts one shard of the elections.
+
+    Attributes:
+        :index: The index of the shard.
+        :socket_path: The Unix socket the worker listens on.
+    """
+
+    def __init__(self, index, shards, port, socket_path, node_args):
+        self.index = index
+        self.socket_path = socket_path
+        self.__command = [
+            sys.executable, NODE_SCRIPT, '-p', str(port),
+            '--socket', socket_path,
+            '--shard', '{}/{}'.format(index, shards)] + list(node_args)
+        self.process = None
+
+    def start(self):
+        self.process = subprocess.Popen(self.__command)
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait()
+
+    def request(self, method, path, body=None, headers=None):
+        """Send a request to the worker and return (status, headers,
+        body) of its response."""
+        connection = UnixHTTPConnection(self.socket_path)
+        try:
+            connection.request(method, path, body=body, headers=headers or {})
+            response = connection.getresponse()
+            return response.status, response.getheaders(), response.read()
+        finally:
+            connection.close()
+
+    def wait_until_ready(self):
+        deadline = time() + STARTUP_TIMEOUT
+        while True:
+            try:
+                self.request('GET', '/')
+                return
+            except OSError:
+                if self.process.poll() is not None or time() > deadline:
+                    raise RuntimeError(
+                        'Shard {} did not start'.format(self.index))
+                sleep(0.1)
+
+
+logger = get_logger(__name__)
+app = Flask(__name__)
+# Compressed bodies are unpacked, so the election can be read from them
+app.wsgi_app = DecompressingMiddleware(app.wsgi_app)
+workers = []
+stopped = threading.Event()
+
+
+def request_election():
+    """Return the election a request names (None if it names none)."""
+    election = request.args.get('election')
+    if election is not None:
+        return election
+    values = request.get_json(silent=True)
+    if not isinstance(values, dict):
+        return None
+    if request.path == '/create-election':
+        return values.get('id')
+    return values.get('election')
+
+
+def forward(worker):
+    """Forward the current request to a worker and return its response."""
+    path = request.path
+    if request.query_string:
+        path += '?' + request.query_string.decode('latin-1')
+    headers = {name: value for name, value in request.headers.items()
+               if name.lower() not in HOP_HEADERS}
+    try:
+        status, response_headers, body = worker.request(
+            request.method, path, request.get_data(), headers)
+    except OSError:
+        return app.response_class(
+            '{"message": "The shard of the election is unavailable."}',
+            status=503, mimetype='application/json')
+    response = app.response_class(body, status=status)
+    response.headers.clear()
+    for name, value in response_headers:
+        if name.lower() not in HOP_HEADERS:
+            response.headers.add(name, value)
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    texts = []
+    for worker in workers:
+        try:
+            status, _, body = worker.request('GET', '/metrics')
+        except OSError:
+            continue
+        if status == 200:
+            texts.append((worker.index, body.decode('utf-8')))
+    return app.response_class(
+        merge_metrics(texts), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/ballot', methods=['GET', 'POST'])
+def ballot_keys():
+    # The keys are created once and every worker loads them from the file
+    response = forward(workers[0])
+    if response.status_code == 201:
+        for worker in workers[1:]:
+            try:
+                worker.request('GET', '/ballot')
+            except OSError:
+                logger.error('Shard %s did not reload the keys',
+                             worker.index)
+    return response
+
+
+@app.route('/', defaults={'path': ''}, methods=METHODS)
+@app.route('/<path:path>', methods=METHODS)
+def dispatch(path):
+    return forward(workers[shard_for(request_election(), len(workers))])
+
+
+def monitor():
+    """Restart the workers which exited."""
+    while not stopped.wait(MONITOR_INTERVAL):
+        for worker in workers:
+            if worker.process.poll() is not None:
+                logger.warning('Shard %s exited with status %s, restarting',
+                               worker.index, worker.process.returncode)
+                worker.start()
+
+
+def stop_workers(directory):
+    stopped.set()
+    for worker in workers:
+        worker.stop()
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-p', '--port', type=int, default=8900)
+    parser.add_argument('--shards', type=int, default=os.cpu_count() or 1,
+                        help='the number of worker processes (default: one '
+                        'per core)')
+    parser.add_argument('--log-level', choices=LOG_LEVELS, default='INFO')
+    parser.add_argument('--log-format', choices=LOG_FORMATS, default='text')
+    args, node_args = parser.parse_known_args()
+    configure(args.log_level, args.log_format)
+    # The workers log like the router
+    node_args += ['--log-level', args.log_level,
+                  '--log-format', args.log_format]
+    if args.shards < 1:
+        parser.error('at least one shard is required')
+    directory = tempfile.mkdtemp(prefix='ballot-shards-')
+    atexit.register(stop_workers, directory)
+    # Exit through atexit on SIGTERM too, so the workers do not linger
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    for index in range(args.shards):
+        workers.append(Worker(
+            index, args.shards, args.port,
+            os.path.join(directory, 'shard-{}.sock'.format(index)),
+            node_args))
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.wait_until_ready()
+    threading.Thread(target=monitor, daemon=True).start()
+    app.run(host='0.0.0.0', port=args.port)
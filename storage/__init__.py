@@ -0,0 +1,22 @@
+from storage.file_storage import FileStorage
+from storage.sqlite_storage import SQLiteStorage
+
+# The storage engines a blockchain can be persisted with
+BACKENDS = {
+    'file': FileStorage,
+    'sqlite': SQLiteStorage
+}
+
+
+def get_storage(backend, node_id, election_id):
+    """Create the storage engine for an election.
+
+    Arguments:
+        :backend: The name of the storage engine (see BACKENDS).
+        :node_id: The node (port) the election is running on.
+        :election_id: The election which should be stored.
+    """
+    return BACKENDS[backend](node_id, election_id)
+
+
+__all__ = ['BACKENDS', 'FileStorage', 'SQLiteStorage', 'get_storage']
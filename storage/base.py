@@ -0,0 +1,113 @@
+from key_dictionary import KeyDictionary
+
+
+class Storage:
+    """A base class for the places a blockchain can be persisted to.
+
+    Attributes:
+        :node_id: The node (port) the election is running on.
+        :election_id: The election which is stored.
+        :keys: The KeyDictionary the voter and candidate keys are stored
+        with.
+        :indexed: Whether the backend can answer vote queries itself
+        instead of having them scanned from the chain in memory.
+    """
+    indexed = False
+
+    def __init__(self, node_id, election_id):
+        self.node_id = node_id
+        self.election_id = election_id
+        self.keys = KeyDictionary()
+
+    @classmethod
+    def discover(cls, node_id):
+        """Return the ids of all elections stored for a node."""
+        raise NotImplementedError
+
+    @staticmethod
+    def parse_election_ids(filenames, prefix, suffix):
+        """Extract the election ids from a list of store file names.
+
+        Arguments:
+            :filenames: The file names which matched the store pattern.
+            :prefix: The part of the name in front of the election id.
+            :suffix: The part of the name after the election id.
+        """
+        election_ids = []
+        for filename in filenames:
+            election_id = filename[len(prefix):len(filename) - len(suffix)]
+            if election_id == 'None':
+                continue
+            # Election ids are looked up as integers by the node
+            try:
+                election_ids.append(int(election_id))
+            except ValueError:
+                election_ids.append(election_id)
+        return election_ids
+
+    def load(self, cache_size=None):
+        """Return the stored (chain, unverified votes, peer nodes) tuple or
+        None if nothing could be loaded. The chain is a BlockStore.
+
+        Arguments:
+            :cache_size: The maximum number of votes the chain keeps in
+            memory (only honoured by indexed engines).
+        """
+        raise NotImplementedError
+
+    def load_block_votes(self, index):
+        """Return the votes of a stored block."""
+        raise NotImplementedError
+
+    def save(self, chain, unverified_votes, peer_nodes):
+        """Persist the chain, open votes and peer nodes."""
+        raise NotImplementedError
+
+    def size(self):
+        """Return the number of bytes the election takes up on disk."""
+        raise NotImplementedError
+
+    def load_settings(self):
+        """Return the stored election settings or None."""
+        raise NotImplementedError
+
+    def save_settings(self, settings):
+        """Persist the election settings."""
+        raise NotImplementedError
+
+    def load_checkpoint(self):
+        """Return the latest tally checkpoint or None."""
+        raise NotImplementedError
+
+    def save_checkpoint(self, checkpoint):
+        """Replace the latest tally checkpoint."""
+        raise NotImplementedError
+
+    def remove(self):
+        """Delete the files of the stored election (once it was
+        archived). Requests which still hold the election may read from
+        the storage afterwards, so it must stay readable."""
+        raise NotImplementedError
+
+    def get_results_voters(self, candidate, height):
+        """Return the voters of a candidate grouped per block.
+
+        Arguments:
+            :candidate: The candidate whose voters are requested.
+            :height: The number of blocks in the chain.
+        """
+        raise NotImplementedError
+
+    def get_results_voters_page(self, candidate, height, position, limit):
+        """Return up to limit (block index, position, voter) tuples of a
+        candidate's voters which come after the given vote."""
+        raise NotImplementedError
+
+    def find_vote(self, signature):
+        """Return the (block index, position) of a confirmed vote or None.
+        """
+        raise NotImplementedError
+
+    def get_vote_history(self, voter):
+        """Return the confirmed votes of a voter as (block index, vote)."""
+        raise NotImplementedError
@@ -0,0 +1,134 @@
+import glob
+import json
+import os
+
+from block import Block
+from block_store import BlockStore
+from key_dictionary import KeyDictionary
+from storage.base import Storage
+from utility.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class FileStorage(Storage):
+    """Stores an election in plain text files. The chain, open votes, peer
+    nodes and the key dictionary live on one JSON line each in
+    blockchain-<node>-<election>.txt. Votes are packed with the key
+    dictionary; files written before it existed hold the votes as dicts.
+    """
+
+    @classmethod
+    def discover(cls, node_id):
+        prefix = 'blockchain-{}-'.format(node_id)
+        return cls.parse_election_ids(
+            glob.glob(glob.escape(prefix) + '*.txt'), prefix, '.txt')
+
+    @property
+    def filename(self):
+        return 'blockchain-{}-{}.txt'.format(self.node_id, self.election_id)
+
+    @property
+    def checkpoint_filename(self):
+        return 'checkpoint-{}-{}.txt'.format(self.node_id, self.election_id)
+
+    @property
+    def settings_filename(self):
+        return 'settings-{}-{}.txt'.format(self.node_id, self.election_id)
+
+    def load(self, cache_size=None):
+        try:
+            with open(self.filename, mode='r') as f:
+                file_content = f.readlines()
+                blockchain = json.loads(file_content[0][:-1])
+                # Older files end after the peer nodes and have no keys
+                stored_keys = KeyDictionary(
+                    json.loads(file_content[3])
+                    if len(file_content) > 3 else ())
+                # A single JSON line has no random access, so every block
+                # stays in memory
+                updated_blockchain = BlockStore(
+                    self.__intern_block(Block.from_dict(block, stored_keys))
+                    for block in blockchain)
+                unverified_votes = json.loads(file_content[1][:-1])
+                updated_transactions = [
+                    self.keys.intern_vote(stored_keys.decode_vote(vt))
+                    for vt in unverified_votes]
+                peer_nodes = json.loads(file_content[2])
+                return updated_blockchain, updated_transactions, peer_nodes
+        except (IOError, IndexError):
+            logger.debug('No stored chain for election %s', self.election_id)
+            return None
+
+    def __intern_block(self, block):
+        for vt in block.votes:
+            self.keys.intern_vote(vt)
+        return block
+
+    def save(self, chain, unverified_votes, peer_nodes):
+        try:
+            with open(self.filename, mode='w') as f:
+                saveable_chain = [
+                    block.to_dict(self.keys) for block in chain]
+                f.write(json.dumps(saveable_chain))
+                f.write('\n')
+                saveable_tx = [
+                    self.keys.encode_vote(vt) for vt in unverified_votes]
+                f.write(json.dumps(saveable_tx))
+                f.write('\n')
+                f.write(json.dumps(list(peer_nodes)))
+                f.write('\n')
+                f.write(json.dumps(self.keys.keys))
+        except IOError:
+            logger.exception(
+                'Saving election %s failed', self.election_id)
+
+    def size(self):
+        try:
+            return os.path.getsize(self.filename)
+        except OSError:
+            return 0
+
+    def load_settings(self):
+        try:
+            with open(self.settings_filename, mode='r') as f:
+                return json.loads(f.read())
+        except (IOError, ValueError):
+            return None
+
+    def save_settings(self, settings):
+        try:
+            with open(self.settings_filename, mode='w') as f:
+                f.write(json.dumps(settings))
+        except IOError:
+            logger.exception(
+                'Saving the settings of election %s failed',
+                self.election_id)
+
+    def load_checkpoint(self):
+        try:
+            with open(self.checkpoint_filename, mode='r') as f:
+                return json.loads(f.read())
+        except (IOError, ValueError):
+            return None
+
+    def save_checkpoint(self, checkpoint):
+        try:
+            # Write to a temporary file first so a crash never leaves a
+            # half written checkpoint behind
+            with open(self.checkpoint_filename + '.tmp', mode='w') as f:
+                f.write(json.dumps(checkpoint))
+            os.replace(self.checkpoint_filename + '.tmp',
+                       self.checkpoint_filename)
+        except IOError:
+            logger.exception(
+                'Saving the checkpoint of election %s failed',
+                self.election_id)
+
+    def remove(self):
+        for filename in (self.filename, self.checkpoint_filename,
+                         self.settings_filename):
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,387 @@
+import glob
+import json
+import os
+import sqlite3
+import threading
+
+from block import Block
+from block_store import BlockStore
+from vote import Vote
+from storage.base import Storage
+from storage.file_storage import FileStorage
+from utility.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Timestamps and amounts are declared without a type so SQLite stores them
+# exactly as given; a changed type would change the block hashes. Voters and
+# candidates are stored as ids of the keys table.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blocks (
+    height INTEGER PRIMARY KEY,
+    previous_hash TEXT,
+    timestamp,
+    proof TEXT,
+    hash TEXT NOT NULL,
+    merkle_root TEXT
+);
+CREATE TABLE IF NOT EXISTS keys (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS votes (
+    height INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    voter_id INTEGER NOT NULL,
+    candidate_id INTEGER NOT NULL,
+    amount NOT NULL,
+    signature TEXT NOT NULL,
+    scheme TEXT NOT NULL DEFAULT 'rsa',
+    PRIMARY KEY (height, position)
+);
+CREATE TABLE IF NOT EXISTS unverified_votes (
+    position INTEGER PRIMARY KEY,
+    voter_id INTEGER NOT NULL,
+    candidate_id INTEGER NOT NULL,
+    amount NOT NULL,
+    signature TEXT NOT NULL,
+    scheme TEXT NOT NULL DEFAULT 'rsa'
+);
+CREATE TABLE IF NOT EXISTS peers (
+    url TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS settings (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    data TEXT NOT NULL
+);
+"""
+# Created after the migrations, which may still have to rebuild the tables
+INDEXES = """
+CREATE INDEX IF NOT EXISTS votes_voter_id ON votes (voter_id);
+CREATE INDEX IF NOT EXISTS votes_signature ON votes (signature);
+CREATE INDEX IF NOT EXISTS votes_candidate_id
+    ON votes (candidate_id, height, position);
+"""
+# The key columns of the vote tables before the key dictionary existed
+LEGACY_VOTE_TABLES = {
+    'votes': 'height, position',
+    'unverified_votes': 'position'
+}
+
+
+class SQLiteStorage(Storage):
+    """Stores an election in an SQLite database
+    (blockchain-<node>-<election>.db). Blocks are written incrementally and
+    votes are indexed by voter, candidate and block height."""
+    indexed = True
+
+    def __init__(self, node_id, election_id):
+        super().__init__(node_id, election_id)
+        # Flask serves requests from several threads, so the connection is
+        # shared and guarded by a lock
+        self.__lock = threading.RLock()
+        self.__conn = sqlite3.connect(self.filename, check_same_thread=False)
+        self.__conn.execute('PRAGMA journal_mode=WAL')
+        self.__conn.execute('PRAGMA synchronous=NORMAL')
+        self.__conn.executescript(SCHEMA)
+        self.__migrate()
+        self.__conn.executescript(INDEXES)
+        # The whole key dictionary is kept in memory, its ids are stable
+        self.__stored_keys = 0
+        for (key,) in self.__conn.execute('SELECT key FROM keys ORDER BY id'):
+            self.keys.intern(key)
+            self.__stored_keys += 1
+
+    def __migrate(self):
+        """Add the columns newer versions rely on to older databases."""
+        columns = [row[1] for row in self.__conn.execute(
+            'PRAGMA table_info(blocks)')]
+        if 'merkle_root' not in columns:
+            self.__conn.execute(
+                'ALTER TABLE blocks ADD COLUMN merkle_root TEXT')
+        for table in ('votes', 'unverified_votes'):
+            columns = [row[1] for row in self.__conn.execute(
+                'PRAGMA table_info({})'.format(table))]
+            if 'scheme' not in columns:
+                self.__conn.execute(
+                    'ALTER TABLE {} ADD COLUMN scheme TEXT NOT NULL '
+                    'DEFAULT \'rsa\''.format(table))
+            if 'voter' in columns:
+                self.__migrate_keys(table, LEGACY_VOTE_TABLES[table])
+
+    def __migrate_keys(self, table, key_columns):
+        """Move the voter and candidate keys of a vote table into the keys
+        table and rebuild it with their ids."""
+        with self.__conn:
+            rows = self.__conn.execute(
+                'SELECT voter FROM {0} UNION SELECT candidate FROM {0}'
+                .format(table)).fetchall()
+            # Ids are counted from 0 like the ids of the key dictionary
+            self.__conn.executemany(
+                'INSERT OR IGNORE INTO keys (id, key) '
+                'VALUES ((SELECT COUNT(*) FROM keys), ?)', rows)
+            self.__conn.execute(
+                'ALTER TABLE {0} RENAME TO legacy_{0}'.format(table))
+            # Recreate the table (its old indexes go away with the legacy
+            # table); executescript would commit half way through
+            for statement in SCHEMA.split(';'):
+                self.__conn.execute(statement)
+            self.__conn.execute(
+                'INSERT INTO {0} ({1}, voter_id, candidate_id, amount, '
+                'signature, scheme) '
+                'SELECT {1}, voters.id, candidates.id, amount, signature, '
+                'scheme FROM legacy_{0} '
+                'JOIN keys AS voters ON voters.key = voter '
+                'JOIN keys AS candidates ON candidates.key = candidate'
+                .format(table, key_columns))
+            self.__conn.execute('DROP TABLE legacy_{}'.format(table))
+
+    @classmethod
+    def discover(cls, node_id):
+        prefix = 'blockchain-{}-'.format(node_id)
+        election_ids = cls.parse_election_ids(
+            glob.glob(glob.escape(prefix) + '*.db'), prefix, '.db')
+        # Text files are imported the first time they are opened
+        for election_id in FileStorage.discover(node_id):
+            if election_id not in election_ids:
+                election_ids.append(election_id)
+        return election_ids
+
+    @property
+    def filename(self):
+        return 'blockchain-{}-{}.db'.format(self.node_id, self.election_id)
+
+    def load(self, cache_size=None):
+        with self.__lock:
+            blocks = self.__conn.execute(
+                'SELECT height, previous_hash, timestamp, proof, merkle_root, '
+                'hash FROM blocks ORDER BY height').fetchall()
+            if not blocks:
+                # Pick up an election which was stored in a text file before
+                if self.__import_file_storage() is None:
+                    return None
+                return self.load(cache_size)
+            # Only the headers are read, votes are loaded on demand
+            chain = BlockStore(
+                [Block(height, previous_hash, None, json.loads(proof),
+                       timestamp, root)
+                 for height, previous_hash, timestamp, proof, root, _
+                 in blocks],
+                self.load_block_votes,
+                cache_size,
+                [row[5] for row in blocks])
+            unverified_votes = [
+                self.__vote(row) for row in self.__conn.execute(
+                    'SELECT voter_id, candidate_id, signature, amount, '
+                    'scheme FROM unverified_votes ORDER BY position')]
+            peer_nodes = [row[0] for row in self.__conn.execute(
+                'SELECT url FROM peers')]
+        return chain, unverified_votes, peer_nodes
+
+    def load_block_votes(self, index):
+        with self.__lock:
+            return [self.__vote(row) for row in self.__conn.execute(
+                'SELECT voter_id, candidate_id, signature, amount, scheme '
+                'FROM votes WHERE height = ? ORDER BY position', (index,))]
+
+    def __vote(self, row):
+        """Build a vote from a (voter id, candidate id, signature, amount,
+        scheme) row."""
+        voter_id, candidate_id, signature, amount, scheme = row
+        return Vote(self.keys.key(voter_id), self.keys.key(candidate_id),
+                    signature, amount, scheme)
+
+    def __import_file_storage(self):
+        data = FileStorage(self.node_id, self.election_id).load()
+        if data is not None:
+            self.__write(*data)
+        return data
+
+    def save(self, chain, unverified_votes, peer_nodes):
+        with self.__lock:
+            self.__write(chain, unverified_votes, peer_nodes)
+
+    def __write(self, chain, unverified_votes, peer_nodes):
+        try:
+            with self.__conn:
+                start = self.__fork_height(chain)
+                self.__conn.execute(
+                    'DELETE FROM blocks WHERE height >= ?', (start,))
+                self.__conn.execute(
+                    'DELETE FROM votes WHERE height >= ?', (start,))
+                for block in chain[start:]:
+                    block_hash = chain.hash_at(block.index)
+                    self.__conn.execute(
+                        'INSERT INTO blocks (height, previous_hash, '
+                        'timestamp, proof, hash, merkle_root) '
+                        'VALUES (?, ?, ?, ?, ?, ?)',
+                        (block.index, block.previous_hash, block.timestamp,
+                         json.dumps(block.proof), block_hash,
+                         block.merkle_root))
+                    self.__conn.executemany(
+                        'INSERT INTO votes (height, position, voter_id, '
+                        'candidate_id, amount, signature, scheme) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        [(block.index, position,
+                          self.keys.intern(vt.voter),
+                          self.keys.intern(vt.candidate),
+                          vt.amount, vt.signature, vt.scheme)
+                         for position, vt in enumerate(block.votes)])
+                self.__conn.execute('DELETE FROM unverified_votes')
+                self.__conn.executemany(
+                    'INSERT INTO unverified_votes (position, voter_id, '
+                    'candidate_id, amount, signature, scheme) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    [(position, self.keys.intern(vt.voter),
+                      self.keys.intern(vt.candidate), vt.amount,
+                      vt.signature, vt.scheme)
+                     for position, vt in enumerate(unverified_votes)])
+                stored_keys = self.__write_keys()
+                self.__conn.execute('DELETE FROM peers')
+                self.__conn.executemany(
+                    'INSERT INTO peers VALUES (?)',
+                    [(node,) for node in peer_nodes])
+            self.__stored_keys = stored_keys
+        except sqlite3.Error:
+            logger.exception(
+                'Saving election %s failed', self.election_id)
+
+    def __write_keys(self):
+        """Insert the keys which were interned since the last save and
+        return the number of stored keys."""
+        keys = self.keys.keys[self.__stored_keys:]
+        self.__conn.executemany(
+            'INSERT INTO keys (id, key) VALUES (?, ?)',
+            [(self.__stored_keys + offset, key)
+             for offset, key in enumerate(keys)])
+        return self.__stored_keys + len(keys)
+
+    def __fork_height(self, chain):
+        """Return the first height at which the stored blocks differ from
+        the given chain. Usually this is the stored height, so only new
+        blocks get written."""
+        row = self.__conn.execute(
+            'SELECT COUNT(*) FROM blocks').fetchone()
+        height = min(row[0], len(chain))
+        while height > 0:
+            stored_hash = self.__conn.execute(
+                'SELECT hash FROM blocks WHERE height = ?',
+                (height - 1,)).fetchone()
+            if (stored_hash is not None and
+                    stored_hash[0] == chain.hash_at(height - 1)):
+                break
+            height -= 1
+        return height
+
+    def size(self):
+        # Committed pages may still live in the write-ahead log
+        total = 0
+        for filename in (self.filename, self.filename + '-wal'):
+            try:
+                total += os.path.getsize(filename)
+            except OSError:
+                pass
+        return total
+
+    def load_settings(self):
+        with self.__lock:
+            row = self.__conn.execute(
+                'SELECT data FROM settings WHERE id = 0').fetchone()
+        if row is not None:
+            return json.loads(row[0])
+        settings = FileStorage(self.node_id, self.election_id).load_settings()
+        if settings is not None:
+            self.save_settings(settings)
+        return settings
+
+    def save_settings(self, settings):
+        try:
+            with self.__lock, self.__conn:
+                self.__conn.execute(
+                    'INSERT OR REPLACE INTO settings VALUES (0, ?)',
+                    (json.dumps(settings),))
+        except sqlite3.Error:
+            logger.exception(
+                'Saving the settings of election %s failed',
+                self.election_id)
+
+    def load_checkpoint(self):
+        with self.__lock:
+            row = self.__conn.execute(
+                'SELECT data FROM checkpoints WHERE id = 0').fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def save_checkpoint(self, checkpoint):
+        try:
+            with self.__lock, self.__conn:
+                self.__conn.execute(
+                    'INSERT OR REPLACE INTO checkpoints VALUES (0, ?)',
+                    (json.dumps(checkpoint),))
+        except sqlite3.Error:
+            logger.exception(
+                'Saving the checkpoint of election %s failed',
+                self.election_id)
+
+    def remove(self):
+        # The connection stays open: requests which still hold the
+        # election read from the unlinked files until it is collected
+        with self.__lock:
+            for suffix in ('', '-wal', '-shm'):
+                try:
+                    os.remove(self.filename + suffix)
+                except FileNotFoundError:
+                    pass
+        # Text files which were imported would be discovered again
+        FileStorage(self.node_id, self.election_id).remove()
+
+    def get_results_voters(self, candidate, height):
+        results = [[] for _ in range(height)]
+        candidate_id = self.keys.get_id(candidate)
+        if candidate_id is None:
+            return results
+        with self.__lock:
+            rows = self.__conn.execute(
+                'SELECT height, voter_id FROM votes '
+                'WHERE candidate_id = ? AND voter_id != ? '
+                'ORDER BY height, position',
+                (candidate_id, self.keys.get_id('MINING', -1)))
+            for block_height, voter_id in rows:
+                if block_height < height:
+                    results[block_height].append(self.keys.key(voter_id))
+        return results
+
+    def get_results_voters_page(self, candidate, height, position, limit):
+        candidate_id = self.keys.get_id(candidate)
+        if candidate_id is None:
+            return []
+        with self.__lock:
+            rows = self.__conn.execute(
+                'SELECT height, position, voter_id FROM votes '
+                'WHERE candidate_id = ? AND voter_id != ? '
+                'AND (height, position) > (?, ?) '
+                'ORDER BY height, position LIMIT ?',
+                (candidate_id, self.keys.get_id('MINING', -1), height,
+                 position, limit)).fetchall()
+        return [(block_height, block_position, self.keys.key(voter_id))
+                for block_height, block_position, voter_id in rows]
+
+    def find_vote(self, signature):
+        with self.__lock:
+            return self.__conn.execute(
+                'SELECT height, position FROM votes WHERE signature = ? '
+                'ORDER BY height DESC LIMIT 1', (signature,)).fetchone()
+
+    def get_vote_history(self, voter):
+        voter_id = self.keys.get_id(voter)
+        if voter_id is None:
+            return []
+        with self.__lock:
+            rows = self.__conn.execute(
+                'SELECT height, voter_id, candidate_id, signature, amount, '
+                'scheme FROM votes WHERE voter_id = ? '
+                'ORDER BY height, position', (voter_id,)).fetchall()
+        return [(row[0], self.__vote(row[1:])) for row in rows]
@@ -0,0 +1,106 @@
+from utility.printable import Printable
+
+
+class Tally(Printable):
+    """Running totals derived from the confirmed blocks of an election.
+
+    Attributes:
+        :height: The number of blocks which were applied to this tally.
+        :results: The votes received per candidate (mining excluded).
+        :counts: The number of voters per candidate.
+        :mined: The mining rewards received per participant.
+        :sent: The votes sent per voter.
+    """
+
+    def __init__(self, height=0, results=None, counts=None, mined=None,
+                 sent=None):
+        self.height = height
+        self.results = results if results is not None else {}
+        self.counts = counts if counts is not None else {}
+        self.mined = mined if mined is not None else {}
+        self.sent = sent if sent is not None else {}
+
+    def apply_block(self, block):
+        """Add the votes of the next block to the totals.
+
+        Arguments:
+            :block: The block which was appended to the chain.
+        """
+        for vt in block.votes:
+            if vt.voter == 'MINING':
+                self.mined[vt.candidate] = (
+                    self.mined.get(vt.candidate, 0) + vt.amount)
+                continue
+            self.results[vt.candidate] = (
+                self.results.get(vt.candidate, 0) + vt.amount)
+            self.counts[vt.candidate] = self.counts.get(vt.candidate, 0) + 1
+            self.sent[vt.voter] = self.sent.get(vt.voter, 0) + vt.amount
+        self.height += 1
+
+    def revert_block(self, block):
+        """Remove the votes of the last applied block from the totals
+        (used when the block is orphaned by a reorg).
+
+        Arguments:
+            :block: The block which was removed from the chain.
+        """
+        for vt in block.votes:
+            if vt.voter == 'MINING':
+                self.__subtract(self.mined, vt.candidate, vt.amount)
+                continue
+            self.__subtract(self.results, vt.candidate, vt.amount)
+            self.__subtract(self.counts, vt.candidate, 1)
+            self.__subtract(self.sent, vt.voter, vt.amount)
+        self.height -= 1
+
+    @staticmethod
+    def __subtract(totals, key, amount):
+        totals[key] = totals.get(key, 0) - amount
+        # Drop emptied entries so they look like they were never counted
+        if totals[key] == 0:
+            del totals[key]
+
+    def get_results(self, candidate):
+        """Return the confirmed votes a candidate received."""
+        return self.results.get(candidate, 0)
+
+    def get_count(self, candidate):
+        """Return the number of confirmed voters of a candidate."""
+        return self.counts.get(candidate, 0)
+
+    def get_received(self, participant):
+        """Return everything a participant received, mining included."""
+        return (self.results.get(participant, 0) +
+                self.mined.get(participant, 0))
+
+    def get_sent(self, voter):
+        """Return the confirmed votes a voter sent."""
+        return self.sent.get(voter, 0)
+
+    def to_dict(self):
+        """Converts the tally into a JSON serialisable dict."""
+        return {
+            'height': self.height,
+            'results': self.results,
+            'counts': self.counts,
+            'mined': self.mined,
+            'sent': self.sent
+        }
+
+    @classmethod
+    def from_dict(cls, values):
+        """Rebuild a tally from the output of to_dict."""
+        return cls(
+            values['height'],
+            values['results'],
+            values['counts'],
+            values['mined'],
+            values['sent'])
+
+    @classmethod
+    def from_chain(cls, chain):
+        """Replay a whole chain into a fresh tally."""
+        tally = cls()
+        for block in chain:
+            tally.apply_block(block)
+        return tally
@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pytest
+
+# The modules of the node live in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ballot import Ballot  # noqa: E402
+from blockchain import Blockchain  # noqa: E402
+
+ELECTION = 7
+SETTINGS = {'scheme': 'ed25519'}
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """Elections are stored in the working directory."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def make_chain(node_id, storage='file', public_key=None):
+    """Return an empty election of a node."""
+    return Blockchain(public_key or 'node-{}'.format(node_id), node_id,
+                      ELECTION, 'test election', storage=storage,
+                      settings=SETTINGS)
+
+
+def cast_vote(blockchain, candidate):
+    """Add a vote of a new voter to the open votes and return it."""
+    ballot = Ballot(blockchain.node_id)
+    private_key, public_key = ballot.generate_keys('ed25519')
+    signature = ballot.sign_vote(public_key, private_key, candidate, 1,
+                                 'ed25519')
+    assert blockchain.add_vote(candidate, public_key, signature, ELECTION,
+                               scheme='ed25519')
+    return blockchain.get_unverified_votes()[-1]
+
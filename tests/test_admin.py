@@ -0,0 +1,97 @@
+import pytest
+
+import node
+from utility.profiling import RequestProfiler
+from utility.tracing import Tracer, tracer
+
+from conftest import ELECTION, make_chain
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(node, 'admin_enabled', True)
+    monkeypatch.setattr(node, 'profiler', RequestProfiler())
+    # The threshold is shared by the whole process
+    monkeypatch.setattr(tracer, 'threshold', None)
+    monkeypatch.setitem(node.elections._ElectionRegistry__elections,
+                        ELECTION, make_chain(1))
+    return node.app.test_client()
+
+
+def test_admin_routes_are_disabled_by_default(client, monkeypatch):
+    monkeypatch.setattr(node, 'admin_enabled', False)
+    for method, path in (('GET', '/admin/profile'),
+                         ('POST', '/admin/profile'),
+                         ('GET', '/admin/traces'),
+                         ('POST', '/admin/traces')):
+        response = client.open(path, method=method, json={})
+        assert response.status_code == 403
+
+
+def test_a_profile_covers_the_requested_number_of_requests(client):
+    assert client.get('/admin/profile').status_code == 404
+    response = client.post('/admin/profile', json={'requests': 2})
+    assert response.status_code == 201
+    for _ in range(3):
+        client.get('/chain?election={}'.format(ELECTION))
+    response = client.get('/admin/profile?sort=tottime&limit=5')
+    assert response.status_code == 200
+    report = response.get_data(as_text=True)
+    assert report.startswith('# 2 requests profiled, session finished')
+    assert 'function calls' in report
+    assert client.get('/admin/profile?sort=bogus').status_code == 400
+
+
+@pytest.mark.parametrize('values', [
+    {}, {'requests': 1, 'seconds': 1}, {'requests': 'many'},
+    {'seconds': [1]}, {'requests': 0}, {'seconds': -1}])
+def test_invalid_profiles_are_rejected(client, values):
+    response = client.post('/admin/profile', json=values)
+    assert response.status_code == 400
+
+
+def test_slow_requests_are_traced(client):
+    assert client.get('/admin/traces').get_json() == {
+        'threshold_ms': None, 'traces': []}
+    response = client.post('/admin/traces', json={'threshold_ms': 0})
+    assert response.status_code == 200
+    client.get('/chain?election={}'.format(ELECTION))
+    traces = client.get('/admin/traces').get_json()
+    assert traces['threshold_ms'] == 0
+    assert traces['traces'][0]['request'] == 'GET /chain'
+    # Admin requests are not traced themselves
+    assert all(trace['request'].startswith('GET /chain')
+               for trace in traces['traces'])
+    for values in ({}, {'threshold_ms': 'slow'}):
+        response = client.post('/admin/traces', json=values)
+        assert response.status_code == 400
+    client.post('/admin/traces', json={'threshold_ms': None})
+    assert tracer.threshold is None
+
+
+def test_spans_add_up_their_calls():
+    spans = Tracer(threshold=0)
+
+    @spans.span('outer')
+    def outer(depth):
+        if depth:
+            outer(depth - 1)
+        inner()
+
+    @spans.span('inner')
+    def inner():
+        pass
+
+    # Nothing is recorded outside of a request
+    outer(1)
+    spans.begin('GET /test')
+    outer(2)
+    trace = spans.end()
+    calls = {span['name']: span['calls'] for span in trace['spans']}
+    # Nested calls of the same span are counted once
+    assert calls == {'outer': 1, 'inner': 3}
+    assert spans.slow_traces() == [trace]
+    spans.threshold = 60
+    spans.begin('GET /fast')
+    assert spans.end() is None
+    assert spans.slow_traces() == [trace]
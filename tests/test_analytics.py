@@ -0,0 +1,59 @@
+from time import time
+
+import pytest
+
+import blockchain as blockchain_module
+import node
+from vote_columns import TooManyBuckets, VoteColumns
+
+from conftest import ELECTION, make_chain
+from test_reorg import mine
+
+
+def analytics(monkeypatch, blockchain, query):
+    monkeypatch.setitem(node.elections._ElectionRegistry__elections,
+                        ELECTION, blockchain)
+    return node.app.test_client().get(
+        '/analytics?election={}&{}'.format(ELECTION, query))
+
+
+@pytest.fixture
+def blockchain(monkeypatch):
+    """A chain whose two blocks were mined a day apart."""
+    blockchain = make_chain(1)
+    mine(blockchain, 'alice')
+    monkeypatch.setattr(blockchain_module, 'time', lambda: time() + 86400)
+    mine(blockchain, 'bob')
+    return blockchain
+
+
+def test_time_series_limits_the_buckets(blockchain):
+    columns = VoteColumns.from_chain(blockchain.chain, blockchain.keys)
+    assert len(columns.time_series(3600)) == 25
+    assert len(columns.candidate_series(3600)['bob']) == 25
+    with pytest.raises(TooManyBuckets):
+        columns.time_series(1)
+    with pytest.raises(TooManyBuckets):
+        columns.candidate_series(1)
+
+
+@pytest.mark.parametrize('bucket', ['0', '-1', '0.001', 'x'])
+def test_bucket_must_be_whole_seconds(monkeypatch, blockchain, bucket):
+    response = analytics(monkeypatch, blockchain, 'bucket=' + bucket)
+    assert response.status_code == 400
+
+
+def test_too_many_buckets_are_rejected(monkeypatch, blockchain):
+    response = analytics(monkeypatch, blockchain, 'bucket=1')
+    assert response.status_code == 400
+    assert 'buckets' in response.get_json()['message']
+
+
+def test_unknown_candidates_are_not_cached(monkeypatch, blockchain):
+    cached = len(node.response_cache)
+    response = analytics(monkeypatch, blockchain, 'candidate=nobody')
+    assert response.status_code == 200
+    assert len(node.response_cache) == cached
+    response = analytics(monkeypatch, blockchain, 'candidate=alice')
+    assert response.get_json()['analytics']['candidate'][0]['votes'] == 1
+    assert len(node.response_cache) == cached + 1
@@ -0,0 +1,170 @@
+import json
+import os
+import threading
+
+import pytest
+
+import archive as archive_module
+import node
+from archive import ElectionArchive
+from election_registry import ElectionRegistry
+from utility.hash_util import hash_block
+from utility.merkle import merkle_root, verify_merkle_proof
+
+from conftest import ELECTION, cast_vote, make_chain
+from test_reorg import mine
+
+
+@pytest.fixture
+def votes():
+    """A chain with three blocks of votes and the votes which were cast."""
+    blockchain = make_chain(1)
+    votes = []
+    for candidates in (('alice', 'bob'), ('alice',), ('bob', 'carol')):
+        votes += [cast_vote(blockchain, candidate)
+                  for candidate in candidates]
+        blockchain.mine_block()
+    return blockchain, votes
+
+
+def test_queries_read_single_blocks(monkeypatch, votes):
+    blockchain, cast = votes
+    ElectionArchive.seal(blockchain)
+    archive = ElectionArchive.load(1, ELECTION)
+    with open(ElectionArchive.filename(1, ELECTION)) as f:
+        assert 'chain' not in json.load(f)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('The archive file was read again')
+
+    monkeypatch.setattr(archive_module.json, 'load', fail)
+    proof = archive.get_vote_proof(cast[2].signature)
+    assert proof['block']['index'] == 2
+    assert verify_merkle_proof(proof['leaf'], proof['proof'],
+                               proof['merkle_root'])
+    assert proof['merkle_root'] == proof['block']['merkle_root']
+    assert archive.get_vote_proof('unknown') is None
+    history = archive.get_vote_history(cast[3].voter)
+    assert [(index, vt.__dict__) for index, vt in history] == [
+        (3, cast[3].__dict__)]
+    assert archive.get_vote_history('unknown') == []
+    packed = archive.pack_chain(2)
+    hashes = [hash_block(block) for block in blockchain.unpack_chain(packed)]
+    assert hashes == blockchain.get_block_hashes()[2:]
+    assert ([block.to_dict() for block in archive.read_chain()] ==
+            [block.to_dict() for block in blockchain.chain])
+
+
+def test_blocks_without_merkle_root_keep_their_header(votes):
+    blockchain, cast = votes
+    chain = blockchain.chain
+    block = chain[1]
+    block.merkle_root = None
+    blockchain.chain = chain
+    archive = ElectionArchive.seal(blockchain)
+    proof = archive.get_vote_proof(cast[0].signature)
+    # The header is returned as it was hashed, the root computed at
+    # sealing is returned next to it
+    assert proof['block']['merkle_root'] is None
+    assert proof['hash'] == hash_block(block)
+    assert proof['merkle_root'] == merkle_root(block.votes)
+    assert verify_merkle_proof(proof['leaf'], proof['proof'],
+                               proof['merkle_root'])
+
+
+@pytest.mark.parametrize('blocks_file', [False, True])
+def test_legacy_archives_are_rewritten(votes, blocks_file):
+    blockchain, cast = votes
+    ElectionArchive.seal(blockchain)
+    filename = ElectionArchive.filename(1, ELECTION)
+    blocks_filename = ElectionArchive.blocks_filename(1, ELECTION)
+    with open(filename) as f:
+        data = json.load(f)
+    del data['offsets']
+    # Older archives held the voters of every candidate and the packed
+    # blocks, either in the archive file or in a blocks file with the
+    # signatures in the archive file
+    data['voters'] = {'alice': [[1, 0, cast[0].voter]]}
+    packed = blockchain.pack_chain()
+    os.remove(ElectionArchive.index_filename(1, ELECTION))
+    if blocks_file:
+        offsets = []
+        with open(blocks_filename, mode='wb') as f:
+            for block in packed['chain']:
+                offsets.append(f.tell())
+                f.write(json.dumps(block).encode() + b'\n')
+        data.update(keys=packed['keys'], offsets=offsets,
+                    signatures={cast[0].signature: [1, 0]})
+    else:
+        os.remove(blocks_filename)
+        data['chain'] = packed
+    with open(filename, mode='w') as f:
+        json.dump(data, f)
+    archive = ElectionArchive.load(1, ELECTION)
+    assert archive.get_vote_proof(cast[0].signature)['block']['index'] == 1
+    assert archive.get_results_voters_page('bob') == (
+        [cast[1].voter, cast[3].voter], None)
+    with open(filename) as f:
+        assert set(json.load(f)).isdisjoint(
+            ('chain', 'voters', 'signatures', 'keys'))
+    assert os.path.exists(blocks_filename)
+
+
+@pytest.mark.parametrize('storage', ['file', 'sqlite'])
+def test_finalize_removes_the_storage(monkeypatch, storage):
+    blockchain = make_chain(1, storage)
+    block = mine(blockchain, 'alice')
+    registry = ElectionRegistry(node.load_election)
+    registry[ELECTION] = blockchain
+    monkeypatch.setattr(node, 'elections', registry)
+    before = set(os.listdir())
+    response = node.app.test_client().post(
+        '/finalize', json={'election': ELECTION})
+    assert response.status_code == 201
+    assert isinstance(registry[ELECTION], ElectionArchive)
+    assert [name for name in os.listdir()
+            if name.startswith('blockchain-')] == []
+    assert set(os.listdir()) - before == {
+        ElectionArchive.filename(1, ELECTION),
+        ElectionArchive.blocks_filename(1, ELECTION),
+        ElectionArchive.index_filename(1, ELECTION)}
+    assert ElectionArchive.discover(1) == [ELECTION]
+    # Requests which still hold the election keep reading from it
+    vt = block.votes[0]
+    assert blockchain.get_results_voters_page('alice') == ([vt.voter], None)
+    assert blockchain.get_vote_proof(vt.signature)['hash'] == hash_block(
+        block)
+
+
+def test_finalize_waits_for_writers():
+    registry = ElectionRegistry(lambda election_id: None)
+    events = []
+    registry.begin_write(ELECTION)
+
+    def finalize():
+        with registry.finalizing(ELECTION):
+            events.append('finalized')
+
+    def write():
+        registry.begin_write(ELECTION)
+        events.append('written')
+        registry.end_write(ELECTION)
+
+    finalizer = threading.Thread(target=finalize)
+    finalizer.start()
+    finalizer.join(0.1)
+    # The running writer holds the finalization off
+    assert events == []
+    registry.end_write(ELECTION)
+    finalizer.join(1)
+    assert events == ['finalized']
+    # Other elections are not affected
+    registry.begin_write(ELECTION + 1)
+    registry.end_write(ELECTION + 1)
+    writer = threading.Thread(target=write)
+    with registry.finalizing(ELECTION):
+        writer.start()
+        writer.join(0.1)
+        assert events == ['finalized']
+    writer.join(1)
+    assert events == ['finalized', 'written']
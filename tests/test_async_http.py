@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+from utility.async_http import read_body
+from utility.compression import BodyTooLarge
+
+
+def read(data, headers, limit):
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await read_body(reader, headers, limit)
+    return asyncio.run(run())
+
+
+CHUNKED = {'transfer-encoding': 'chunked'}
+
+
+@pytest.mark.parametrize('data, headers', [
+    (b'0123456789', {'content-length': '10'}),
+    (b'5\r\n01234\r\n5\r\n56789\r\n0\r\n\r\n', CHUNKED),
+    (b'0123456789', {})
+])
+def test_bodies_up_to_the_limit_are_read(data, headers):
+    assert read(data, headers, 10) == b'0123456789'
+
+
+@pytest.mark.parametrize('data, headers', [
+    (b'0123456789', {'content-length': '10'}),
+    (b'5\r\n01234\r\n5\r\n56789\r\n0\r\n\r\n', CHUNKED),
+    (b'0123456789', {})
+])
+def test_larger_bodies_are_rejected(data, headers):
+    with pytest.raises(BodyTooLarge):
+        read(data, headers, 9)
@@ -0,0 +1,72 @@
+import pytest
+
+import node
+from ballot import Ballot
+from blockchain import Blockchain
+from election_registry import ElectionRegistry
+from utility.verification import Verification
+
+from conftest import ELECTION, cast_vote
+
+
+@pytest.fixture
+def validator():
+    ballot = Ballot(1)
+    ballot.create_keys()
+    return ballot
+
+
+def make_authority_chain(node_id, ballot, validators):
+    return Blockchain(
+        ballot.public_key, node_id, ELECTION, 'test election',
+        settings={'scheme': 'ed25519', 'consensus': 'poa',
+                  'validators': validators},
+        private_key=ballot.private_key)
+
+
+def test_sealed_block_is_accepted(validator):
+    sealer = make_authority_chain(1, validator, [validator.public_key])
+    receiver = make_authority_chain(2, validator, [validator.public_key])
+    cast_vote(sealer, 'alice')
+    block = sealer.mine_block()
+    assert Verification.valid_authority(block, [validator.public_key])
+    assert receiver.add_block(block.to_dict())
+
+
+@pytest.mark.parametrize('field, value', [
+    ('index', 5), ('merkle_root', '0' * 64), ('timestamp', 1.0)])
+def test_altered_header_breaks_the_seal(validator, field, value):
+    sealer = make_authority_chain(1, validator, [validator.public_key])
+    cast_vote(sealer, 'alice')
+    block = sealer.mine_block()
+    setattr(block, field, value)
+    assert not Verification.valid_authority(block, [validator.public_key])
+
+
+def test_validators_must_be_a_list(validator):
+    sealer = make_authority_chain(1, validator, [validator.public_key])
+    block = sealer.mine_block()
+    # A string holding the key would pass a substring test
+    assert not Verification.valid_authority(
+        block, 'x' + validator.public_key)
+
+
+@pytest.mark.parametrize('consensus, validators, status', [
+    ('poa', 'abc', 400), ('poa', [1, 2], 400), ('poa', {'key': 'abc'}, 400),
+    ('poa', ['abc'], 201), ('poa', None, 400), ('poa', [], 400),
+    ('pow', None, 201), ('pow', [], 201)])
+def test_create_election_checks_validators(monkeypatch, consensus,
+                                           validators, status):
+    ballot = Ballot(1)
+    ballot.create_keys()
+    ballot.save_keys()
+    for name, value in (('ballot', ballot), ('port', 1),
+                        ('storage_backend', 'file'),
+                        ('block_cache_size', None),
+                        ('elections', ElectionRegistry(node.load_election))):
+        monkeypatch.setattr(node, name, value, raising=False)
+    values = {'id': ELECTION, 'description': 'test', 'consensus': consensus}
+    if validators is not None:
+        values['validators'] = validators
+    response = node.app.test_client().post('/create-election', json=values)
+    assert response.status_code == status
@@ -0,0 +1,93 @@
+from block import Block
+from block_store import BlockStore
+from blockchain import Blockchain
+from vote import Vote
+
+from conftest import ELECTION, SETTINGS, cast_vote, make_chain
+from test_reorg import mine
+
+
+def make_block(index, size):
+    votes = [Vote('voter-{}-{}'.format(index, position), 'alice', '', 1)
+             for position in range(size)]
+    return Block(index, 'hash-{}'.format(index - 1), votes, 0, 1.0)
+
+
+class Storage:
+    """Serves the votes of the blocks and records which were loaded."""
+
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self.loads = []
+
+    def __call__(self, index):
+        self.loads.append(index)
+        return self.blocks[index].votes
+
+
+def test_votes_are_evicted_and_reloaded():
+    blocks = [make_block(index, 2) for index in range(5)]
+    storage = Storage(blocks)
+    store = BlockStore(blocks)
+    assert store.resident_votes() == 10
+    store.enable_paging(storage, 4)
+    # The least recently used bodies went first
+    assert store.resident_votes() == 4
+    assert storage.loads == []
+    assert store.get_votes(4) is blocks[4].votes
+    assert store.get_votes(0) == blocks[0].votes
+    assert storage.loads == [0]
+    assert store.resident_votes() == 4
+    # Headers and hashes stay in memory
+    assert store.header(1).votes is None
+    assert store[1].votes == blocks[1].votes
+    assert store.hash_at(2) == store.hashes()[2]
+    assert len(store) == 5
+
+
+def test_unstored_blocks_are_not_evicted():
+    blocks = [make_block(index, 2) for index in range(2)]
+    store = BlockStore(blocks)
+    store.enable_paging(Storage(blocks), 1)
+    for index in range(2, 5):
+        store.append(make_block(index, 2))
+    # Only stored blocks can be reloaded, the new ones exceed the capacity
+    assert store.resident_votes() == 6
+    store.truncate(3)
+    assert len(store) == 3
+    assert store.resident_votes() == 2
+
+
+def test_votes_loaded_across_a_truncation_are_not_cached():
+    blocks = [make_block(index, 2) for index in range(3)]
+    store = BlockStore(blocks)
+
+    def loader(index):
+        # The block is replaced while its votes are loaded
+        store.truncate(index)
+        return blocks[index].votes
+
+    store.enable_paging(loader, 0)
+    assert store.resident_votes() == 0
+    assert store.get_votes(2) == blocks[2].votes
+    assert store.resident_votes() == 0
+
+
+def test_indexed_chains_keep_few_votes_in_memory():
+    blockchain = make_chain(1, 'sqlite')
+    for candidate in ('alice', 'bob', 'carol', 'dave'):
+        mine(blockchain, candidate, candidate)
+    pending = cast_vote(blockchain, 'erin')
+    hashes = blockchain.get_block_hashes()
+    reloaded = Blockchain('node-1', 1, ELECTION, 'test election',
+                          storage='sqlite', settings=SETTINGS, cache_size=3)
+    store = reloaded._Blockchain__chain
+    assert store.resident_votes() <= 3
+    assert reloaded.get_block_hashes() == hashes
+    assert reloaded.get_results_voters_page('bob')[0] == [
+        vt.voter for vt in blockchain.chain[2].votes
+        if vt.candidate == 'bob']
+    assert [block.to_dict() for block in reloaded.chain] == [
+        block.to_dict() for block in blockchain.chain]
+    assert store.resident_votes() <= 3
+    assert reloaded.get_unverified_votes()[0].signature == pending.signature
@@ -0,0 +1,47 @@
+import json
+
+import pytest
+from flask import Flask, request
+
+from utility.capture import REDACTED, TrafficRecorder
+
+PRIVATE_KEY = 'a1b2c3d4e5f6' * 8
+
+
+class Response:
+    status_code = 400
+
+
+@pytest.fixture
+def capture(tmp_path):
+    """Record requests to a capture and return its entries."""
+    app = Flask(__name__)
+    recorder = TrafficRecorder(str(tmp_path / 'capture.jsonl'))
+
+    def record(**kwargs):
+        with app.test_request_context('/vote', method='POST', **kwargs):
+            recorder.record(request, Response(), 0)
+        with open(recorder.path) as f:
+            return [json.loads(line) for line in f]
+    yield record
+    recorder.close()
+
+
+@pytest.mark.parametrize('data, content_type', [
+    (json.dumps({'voter_private_key': PRIVATE_KEY}), 'text/plain'),
+    ('{"voter_private_key": "' + PRIVATE_KEY + '"', 'application/json'),
+    ('voter_private_key=' + PRIVATE_KEY, 'application/x-www-form-urlencoded')
+])
+def test_raw_bodies_are_not_captured(capture, data, content_type):
+    entry, = capture(data=data, content_type=content_type)
+    assert PRIVATE_KEY not in json.dumps(entry)
+    assert entry['body_size'] == len(data)
+    assert entry['content_type'] == content_type
+
+
+def test_json_bodies_are_redacted(capture):
+    entry, = capture(json={'voter_private_key': PRIVATE_KEY,
+                           'votes': [{'private_key': PRIVATE_KEY}]})
+    assert PRIVATE_KEY not in json.dumps(entry)
+    assert entry['json'] == {'voter_private_key': REDACTED,
+                             'votes': [{'private_key': REDACTED}]}
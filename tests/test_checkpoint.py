@@ -0,0 +1,64 @@
+import pytest
+
+import blockchain as blockchain_module
+from tally import Tally
+
+from conftest import cast_vote, make_chain
+from test_reorg import mine
+
+
+def full_rebuild(monkeypatch):
+    """Make rebuilding the tally from the whole chain fail."""
+    def fail(chain):
+        raise AssertionError('The tally was rebuilt from the whole chain')
+
+    monkeypatch.setattr(blockchain_module.Tally, 'from_chain', fail)
+
+
+@pytest.mark.parametrize('storage', ['file', 'sqlite'])
+def test_blocks_after_the_checkpoint_are_replayed(monkeypatch, storage):
+    blockchain = make_chain(1, storage)
+    mine(blockchain, 'alice')
+    blockchain.save_checkpoint()
+    mine(blockchain, 'bob', 'alice')
+    expected = Tally.from_chain(blockchain.chain).to_dict()
+    full_rebuild(monkeypatch)
+    reloaded = make_chain(1, storage)
+    assert reloaded.get_height() == 3
+    assert reloaded.get_all_results() == expected['results']
+    assert reloaded.get_totalmines() == 2
+
+
+def test_a_checkpoint_off_the_chain_is_ignored():
+    blockchain = make_chain(1)
+    mine(blockchain, 'alice')
+    blockchain.save_checkpoint()
+    checkpoint = blockchain.storage.load_checkpoint()
+    # A checkpoint of a chain which was replaced since
+    checkpoint['tip_hash'] = '0' * 64
+    checkpoint['tally']['results'] = {'mallory': 100}
+    blockchain.storage.save_checkpoint(checkpoint)
+    reloaded = make_chain(1)
+    assert reloaded.get_all_results() == {'alice': 1}
+    # Checkpoints beyond the chain fall back the same way
+    checkpoint = dict(checkpoint, height=5,
+                      tip_hash=blockchain.get_tip_hash())
+    blockchain.storage.save_checkpoint(checkpoint)
+    assert make_chain(1).get_all_results() == {'alice': 1}
+
+
+def test_open_votes_are_recovered_from_the_checkpoint():
+    blockchain = make_chain(1)
+    confirmed = cast_vote(blockchain, 'alice')
+    blockchain.mine_block()
+    pending = cast_vote(blockchain, 'bob')
+    blockchain.save_checkpoint()
+    checkpoint = blockchain.storage.load_checkpoint()
+    # The vote was open when the checkpoint was taken and confirmed later
+    checkpoint['unverified_votes'].insert(0, confirmed.__dict__)
+    blockchain.storage.save_checkpoint(checkpoint)
+    # The open votes got lost since
+    blockchain.storage.save(blockchain.chain, [], [])
+    reloaded = make_chain(1)
+    assert [vt.__dict__ for vt in reloaded.get_unverified_votes()] == [
+        pending.__dict__]
@@ -0,0 +1,49 @@
+import tracemalloc
+import zlib
+
+import pytest
+
+from utility.compression import BodyTooLarge, compress, decompress
+
+# 200 MB of zeros compress to about 200 KB
+BOMB_SIZE = 200 * 1024 * 1024
+LIMIT = 1024 * 1024
+
+
+@pytest.fixture(scope='module')
+def bomb():
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    block = bytes(1024 * 1024)
+    body = b''.join(compressor.compress(block)
+                    for _ in range(BOMB_SIZE // len(block)))
+    return body + compressor.flush()
+
+
+def test_bomb_is_rejected_with_bounded_memory(bomb):
+    tracemalloc.start()
+    try:
+        with pytest.raises(BodyTooLarge):
+            decompress(bomb, 'gzip', LIMIT)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < 4 * LIMIT
+
+
+@pytest.mark.parametrize('encoding', ['gzip', 'deflate'])
+@pytest.mark.parametrize('size', [0, 1, LIMIT - 1, LIMIT])
+def test_bodies_up_to_the_limit_are_decompressed(encoding, size):
+    body = bytes(range(256)) * (size // 256) + b'x' * (size % 256)
+    assert decompress(compress(body, encoding), encoding, LIMIT) == body
+    assert decompress(compress(body, encoding), encoding) == body
+
+
+def test_one_byte_over_the_limit_is_rejected():
+    with pytest.raises(BodyTooLarge):
+        decompress(compress(b'x' * (LIMIT + 1), 'gzip'), 'gzip', LIMIT)
+
+
+def test_truncated_bodies_are_rejected():
+    body = compress(b'x' * 10000, 'deflate')
+    with pytest.raises(zlib.error):
+        decompress(body[:-4], 'deflate', LIMIT)
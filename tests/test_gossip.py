@@ -0,0 +1,89 @@
+import pytest
+
+import node
+from ballot import Ballot
+from utility.seen_cache import SeenCache
+
+from conftest import ELECTION, make_chain
+
+
+class PeerResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.url = 'http://peer'
+
+
+@pytest.fixture
+def client(monkeypatch):
+    blockchain = make_chain(1)
+    monkeypatch.setitem(node.elections._ElectionRegistry__elections,
+                        ELECTION, blockchain)
+    return blockchain, node.app.test_client()
+
+
+def signed_vote(candidate='alice'):
+    ballot = Ballot(1)
+    private_key, public_key = ballot.generate_keys('ed25519')
+    return {
+        'election': ELECTION,
+        'voter': public_key,
+        'candidate': candidate,
+        'amount': 1,
+        'signature': ballot.sign_vote(public_key, private_key, candidate, 1,
+                                      'ed25519'),
+        'scheme': 'ed25519'
+    }
+
+
+def test_relayed_copies_are_no_failure(client):
+    blockchain, client = client
+    vote = signed_vote()
+    assert client.post('/broadcast-vote', json=vote).status_code == 201
+    response = client.post('/broadcast-vote', json=vote)
+    assert response.status_code == 200
+    assert response.get_json()['message'] == 'Vote already seen.'
+    assert len(blockchain.get_unverified_votes()) == 1
+
+
+def test_copies_are_found_after_the_digest_was_forgotten(client):
+    blockchain, client = client
+    vote = signed_vote()
+    assert client.post('/broadcast-vote', json=vote).status_code == 201
+    blockchain.seen = SeenCache(10)
+    assert client.post('/broadcast-vote', json=vote).status_code == 200
+    blockchain.mine_block()
+    blockchain.seen = SeenCache(10)
+    assert client.post('/broadcast-vote', json=vote).status_code == 200
+
+
+def test_a_second_vote_of_a_voter_is_declined(client):
+    _, client = client
+    vote = signed_vote()
+    assert client.post('/broadcast-vote', json=vote).status_code == 201
+    other = dict(vote, signature=signed_vote()['signature'])
+    assert client.post('/broadcast-vote', json=other).status_code == 500
+
+
+def test_only_rejections_are_declines():
+    blockchain = make_chain(1)
+    assert not blockchain.vote_declined(
+        [PeerResponse(200), PeerResponse(201)])
+    assert blockchain.vote_declined([PeerResponse(200), PeerResponse(500)])
+
+
+@pytest.mark.parametrize('items', [
+    'hash', {'type': 'vote'}, [{'type': 'vote'}], [{'hash': 'x'}],
+    ['x'], [{'type': 'vote', 'hash': 1}]])
+def test_malformed_inventories_are_rejected(client, items):
+    _, client = client
+    response = client.post('/inv', json={'election': ELECTION,
+                                         'items': items})
+    assert response.status_code == 400
+
+
+def test_inventory_lists_the_wanted_items(client):
+    blockchain, client = client
+    blockchain.seen.add('known')
+    response = client.post('/inv', json={'election': ELECTION, 'items': [
+        {'type': 'vote', 'hash': 'known'}, {'type': 'vote', 'hash': 'new'}]})
+    assert response.get_json()['wanted'] == ['new']
@@ -0,0 +1,48 @@
+from conftest import ELECTION, cast_vote, make_chain
+
+
+def test_rejected_votes_are_not_interned():
+    blockchain = make_chain(1)
+    before = len(blockchain.keys)
+    for index in range(20):
+        assert not blockchain.add_vote(
+            'candidate-{}'.format(index), 'voter-{}'.format(index),
+            'bad-signature', ELECTION, scheme='ed25519')
+    assert len(blockchain.keys) == before
+    blockchain.save_data()
+    assert len(make_chain(1).keys) == before
+
+
+def test_accepted_votes_are_interned():
+    blockchain = make_chain(1)
+    vote = cast_vote(blockchain, 'alice')
+    assert blockchain.keys.get_id(vote.voter) is not None
+    assert blockchain.keys.get_id('alice') is not None
+
+
+def test_rejected_blocks_are_not_interned():
+    node_a = make_chain(1)
+    node_b = make_chain(2)
+    cast_vote(node_a, 'alice')
+    block = node_a.mine_block().to_dict()
+    before = len(node_b.keys)
+    forged = dict(block, votes=[dict(vt, candidate='mallory')
+                                for vt in block['votes']])
+    assert not node_b.add_block(forged)
+    assert not node_b.add_block(dict(block, previous_hash='0' * 64))
+    assert len(node_b.keys) == before
+    assert node_b.add_block(block)
+    assert node_b.keys.get_id('alice') is not None
+
+
+def test_unpacked_chain_is_interned_only_when_adopted():
+    node_a = make_chain(1)
+    node_b = make_chain(2)
+    for candidate in ('alice', 'bob'):
+        cast_vote(node_a, candidate)
+        node_a.mine_block()
+    before = len(node_b.keys)
+    blocks = node_b.unpack_chain(node_a.pack_chain(1))
+    assert len(node_b.keys) == before
+    node_b.reorg(1, blocks)
+    assert node_b.keys.get_id('bob') is not None
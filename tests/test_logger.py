@@ -0,0 +1,66 @@
+import io
+import json
+
+import pytest
+
+from utility.logger import configure, get_logger
+
+logger = get_logger(__name__)
+
+
+@pytest.fixture
+def output():
+    stream = io.StringIO()
+    yield stream
+    configure()
+
+
+def records(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_sampled_records_pass_once_per_sample(output):
+    configure('INFO', 'json', output)
+    for index in range(10):
+        logger.info('Declined %s', index, extra={'sample': 4})
+        logger.info('Other message %s', index, extra={'sample': 5})
+    logger.info('Always logged')
+    logged = records(output)
+    assert [(entry['message'], entry['sampled']) for entry in logged
+            if 'sampled' in entry] == [
+        ('Declined 0', 4), ('Other message 0', 5), ('Declined 4', 4),
+        ('Other message 5', 5), ('Declined 8', 4)]
+    assert logged[-1]['message'] == 'Always logged'
+    assert 'sampled' not in logged[-1]
+
+
+def test_disabled_levels_are_not_formatted(output):
+    formatted = []
+
+    class Argument:
+        def __str__(self):
+            formatted.append(1)
+            return 'argument'
+
+    configure('WARNING', 'text', output)
+    logger.info('Skipped %s', Argument())
+    logger.debug('Skipped %s', Argument(), extra={'sample': 1})
+    assert formatted == []
+    assert output.getvalue() == ''
+    logger.warning('Logged %s', Argument(), extra={'fields': {'peer': 'a'}})
+    assert formatted == [1]
+    assert output.getvalue().rstrip().endswith(
+        'WARNING ballot.test_logger: Logged argument peer=a')
+
+
+def test_json_records_carry_their_fields(output):
+    configure('DEBUG', 'json', output)
+    try:
+        raise ValueError('broken')
+    except ValueError:
+        logger.exception('Failed', extra={'fields': {'election': 7}})
+    entry, = records(output)
+    assert entry['level'] == 'ERROR'
+    assert entry['logger'] == 'ballot.test_logger'
+    assert entry['election'] == 7
+    assert 'ValueError: broken' in entry['exception']
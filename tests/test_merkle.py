@@ -0,0 +1,65 @@
+import pytest
+
+from utility.merkle import (
+    hash_vote, merkle_proof, merkle_root, verify_merkle_proof)
+from utility.verification import Verification
+from vote import Vote
+
+from conftest import cast_vote, make_chain
+
+
+def make_votes(count):
+    return [Vote('voter-{}'.format(i), 'candidate', 'sig-{}'.format(i), 1)
+            for i in range(count)]
+
+
+@pytest.mark.parametrize('count', range(1, 10))
+def test_every_vote_has_a_valid_proof(count):
+    votes = make_votes(count)
+    root = merkle_root(votes)
+    for index, vote in enumerate(votes):
+        proof = merkle_proof(votes, index)
+        assert verify_merkle_proof(hash_vote(vote), proof, root)
+
+
+def test_proof_does_not_verify_another_vote():
+    votes = make_votes(5)
+    root = merkle_root(votes)
+    proof = merkle_proof(votes, 2)
+    assert not verify_merkle_proof(hash_vote(votes[3]), proof, root)
+    forged = Vote('voter-2', 'other', 'sig-2', 1)
+    assert not verify_merkle_proof(hash_vote(forged), proof, root)
+
+
+def test_root_changes_with_the_order_of_the_votes():
+    votes = make_votes(4)
+    assert merkle_root(votes) != merkle_root(votes[::-1])
+    assert merkle_root([]) is None
+
+
+@pytest.mark.parametrize('storage', ['file', 'sqlite'])
+def test_vote_proof_round_trip(storage):
+    blockchain = make_chain(1, storage)
+    votes = [cast_vote(blockchain, candidate)
+             for candidate in ('alice', 'bob', 'carol')]
+    blockchain.mine_block()
+    for vote in votes:
+        proof = blockchain.get_vote_proof(vote.signature)
+        assert proof['hash'] == blockchain.get_tip_hash()
+        assert proof['leaf'] == hash_vote(vote)
+        assert verify_merkle_proof(
+            proof['leaf'], proof['proof'], proof['block']['merkle_root'])
+    assert blockchain.get_vote_proof('unknown') is None
+
+
+def test_blocks_without_a_root_are_rejected():
+    node_a = make_chain(1)
+    node_b = make_chain(2)
+    cast_vote(node_a, 'alice')
+    block = node_a.mine_block()
+    assert Verification.valid_merkle_root(block)
+    stripped = dict(block.to_dict(), merkle_root=None)
+    assert not node_b.add_block(stripped)
+    tampered = dict(block.to_dict(), merkle_root='0' * 64)
+    assert not node_b.add_block(tampered)
+    assert node_b.add_block(block.to_dict())
@@ -0,0 +1,61 @@
+import node
+from utility.metrics import Counter, Gauge, Histogram, Registry
+
+from conftest import ELECTION, make_chain
+from test_reorg import mine
+
+
+def test_counters_and_gauges_render_per_label_set():
+    registry = Registry()
+    counter = registry.register(Counter(
+        'test_total', 'Counted things.', ('kind',)))
+    gauge = registry.register(Gauge('test_size', 'A size.'))
+    counter.inc(kind='b')
+    counter.inc(2, kind='a')
+    counter.inc(kind='a')
+    gauge.set(1.5)
+    assert registry.render() == (
+        '# HELP test_total Counted things.\n'
+        '# TYPE test_total counter\n'
+        'test_total{kind="a"} 3\n'
+        'test_total{kind="b"} 1\n'
+        '# HELP test_size A size.\n'
+        '# TYPE test_size gauge\n'
+        'test_size 1.5\n')
+
+
+def test_label_values_are_escaped():
+    counter = Counter('test_total', 'Counted things.', ('path',))
+    counter.inc(path='a"b\\c\nd')
+    assert counter.render().splitlines()[-1] == (
+        'test_total{path="a\\"b\\\\c\\nd"} 1')
+
+
+def test_histograms_count_cumulative_buckets():
+    histogram = Histogram('test_seconds', 'Durations.', ('route',),
+                          buckets=(0.5, 0.1))
+    for value in (0.05, 0.2, 3):
+        histogram.observe(value, route='/chain')
+    assert histogram.render().splitlines()[2:] == [
+        'test_seconds_bucket{route="/chain",le="0.1"} 1',
+        'test_seconds_bucket{route="/chain",le="0.5"} 2',
+        'test_seconds_bucket{route="/chain",le="+Inf"} 3',
+        'test_seconds_sum{route="/chain"} 3.25',
+        'test_seconds_count{route="/chain"} 3']
+    with histogram.time(route='/mine'):
+        pass
+    assert 'test_seconds_count{route="/mine"} 1' in histogram.render()
+
+
+def test_metrics_route_samples_loaded_elections(monkeypatch):
+    blockchain = make_chain(1)
+    mine(blockchain, 'alice')
+    monkeypatch.setitem(node.elections._ElectionRegistry__elections,
+                        ELECTION, blockchain)
+    response = node.app.test_client().get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    lines = response.get_data(as_text=True).splitlines()
+    assert 'node_chain_height{{election="{}"}} 2'.format(ELECTION) in lines
+    assert 'node_mempool_votes{{election="{}"}} 0'.format(ELECTION) in lines
+    assert '# TYPE node_request_duration_seconds histogram' in lines
@@ -0,0 +1,91 @@
+import pytest
+
+import node
+from archive import ElectionArchive
+from block_store import BlockStore
+
+from conftest import ELECTION, make_chain
+from test_reorg import mine
+
+
+@pytest.fixture(params=['file', 'sqlite', 'archive'])
+def election(request):
+    """An election with the voters of alice spread over several blocks,
+    served by both storage engines and an archive."""
+    storage = 'file' if request.param == 'archive' else request.param
+    blockchain = make_chain(1, storage)
+    for candidates in (('alice', 'bob', 'alice'), ('bob',), ('alice',),
+                       ('alice', 'alice')):
+        mine(blockchain, *candidates)
+    if request.param == 'archive':
+        return ElectionArchive.seal(blockchain)
+    return blockchain
+
+
+def all_pages(election, limit):
+    voters, cursors = [], []
+    cursor = None
+    while True:
+        page, cursor = election.get_results_voters_page(
+            'alice', cursor, limit)
+        voters += page
+        if cursor is None:
+            return voters, cursors
+        cursors.append(cursor)
+
+
+@pytest.mark.parametrize('limit', [1, 2, 4, 5, 100])
+def test_pages_return_every_voter_once(election, limit):
+    expected = [voter for block in election.get_results_voters('alice')
+                for voter in block]
+    assert len(expected) == 5
+    voters, cursors = all_pages(election, limit)
+    assert voters == expected
+    # A page is only followed by another one if voters are left
+    assert len(cursors) == (len(expected) - 1) // limit
+
+
+def test_cursors_point_into_blocks(election):
+    page, cursor = election.get_results_voters_page('alice', limit=1)
+    # The cursor is the block index and position of the last voter
+    assert cursor == '1.0'
+    page, cursor = election.get_results_voters_page('alice', cursor, 1)
+    assert cursor == '1.2'
+    assert election.get_results_voters_page('nobody') == ([], None)
+    with pytest.raises(ValueError):
+        election.get_results_voters_page('alice', limit=0)
+    with pytest.raises(ValueError):
+        election.get_results_voters_page('alice', '-1.0')
+
+
+def test_pages_read_only_the_blocks_they_need(monkeypatch):
+    blockchain = make_chain(1)
+    for _ in range(6):
+        mine(blockchain, 'alice')
+    read = []
+    original = BlockStore.__getitem__
+
+    def getitem(self, index):
+        assert not isinstance(index, slice)
+        read.append(index)
+        return original(self, index)
+
+    monkeypatch.setattr(BlockStore, '__getitem__', getitem)
+    page, cursor = blockchain.get_results_voters_page('alice', '2.0', 1)
+    assert cursor == '3.0'
+    # The page and the block which shows that more voters follow
+    assert read == [2, 3, 4]
+
+
+@pytest.mark.parametrize('values', [
+    {'limit': None}, {'limit': 'many'}, {'limit': 0}, {'limit': [1]},
+    {'cursor': 'end'}, {'cursor': '1.2.3'}, {'cursor': '-1.0'}])
+def test_invalid_pages_are_rejected(monkeypatch, values):
+    blockchain = make_chain(1)
+    mine(blockchain, 'alice')
+    monkeypatch.setitem(node.elections._ElectionRegistry__elections,
+                        ELECTION, blockchain)
+    response = node.app.test_client().post('/results-voters', json=dict(
+        values, election=ELECTION, candidate='alice'))
+    assert response.status_code == 400
+    assert response.get_json()['message'] == 'Invalid cursor or limit.'
@@ -0,0 +1,144 @@
+import asyncio
+import threading
+from time import sleep
+
+import pytest
+import requests
+
+import peers
+from peers import PeerManager
+from utility.metrics import RELAYS_DROPPED
+
+
+def dropped(election):
+    return dict((key, value) for _, key, _, value in
+                RELAYS_DROPPED.samples()).get((str(election),), 0)
+
+
+def test_relay_uses_a_bounded_pool(monkeypatch):
+    monkeypatch.setattr(peers, 'relay_slots', threading.BoundedSemaphore(6))
+    release = threading.Event()
+    started = []
+    threads = set()
+
+    def announce(self, *args):
+        started.append(args)
+        threads.add(threading.current_thread().name)
+        release.wait(5)
+
+    monkeypatch.setattr(PeerManager, 'announce', announce)
+    manager = PeerManager(election_id='relay-test')
+    before = dropped('relay-test')
+    threads_before = threading.active_count()
+    for index in range(10):
+        manager.relay('relay-test', 'vote', str(index), '/broadcast-vote',
+                      b'', {})
+    assert threading.active_count() - threads_before <= peers.RELAY_THREADS
+    # Six relays were queued, the others were dropped
+    assert dropped('relay-test') == before + 4
+    release.set()
+    for _ in range(100):
+        if len(started) == 6:
+            break
+        sleep(0.01)
+    assert len(started) == 6
+    assert all(name.startswith('relay') for name in threads)
+
+
+def test_announce_does_not_wait_on_the_event_loop(monkeypatch):
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(peers, 'event_loop', loop)
+    answered = asyncio.Event()
+    handled = threading.Event()
+    results = []
+
+    async def announce_async(self, *args):
+        await answered.wait()
+        return ['response']
+
+    def handle(responses):
+        results.append(responses)
+        handled.set()
+
+    monkeypatch.setattr(PeerManager, 'announce_async', announce_async)
+    manager = PeerManager(election_id='announce-test')
+    assert manager.announce('announce-test', 'vote', 'digest',
+                            '/broadcast-vote', b'', {}, handle) is None
+    # The peers did not answer yet
+    assert results == []
+    loop.call_soon_threadsafe(answered.set)
+    assert handled.wait(5)
+    assert results == [['response']]
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    loop.close()
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(peers, 'time', clock)
+    return clock
+
+
+def test_failing_peers_back_off_exponentially(clock):
+    manager = PeerManager(['http://a', 'http://b'])
+    for _ in range(peers.FAILURE_THRESHOLD - 1):
+        manager.record_failure('http://a')
+    # The circuit only opens once the threshold is reached
+    assert 'http://a' in manager.available()
+    backoffs = []
+    for _ in range(12):
+        manager.record_failure('http://a')
+        health = {peer['url']: peer for peer in manager.health()}
+        backoffs.append(health['http://a']['retry_at'] - clock.now)
+    assert backoffs[:3] == [peers.BASE_BACKOFF, 2 * peers.BASE_BACKOFF,
+                            4 * peers.BASE_BACKOFF]
+    assert max(backoffs) == backoffs[-1] == peers.MAX_BACKOFF
+    assert manager.available() == ['http://b']
+    # The peer is probed again once its backoff passed
+    clock.now += peers.MAX_BACKOFF
+    assert 'http://a' in manager.available()
+    manager.record_success('http://a', 0.1)
+    health = {peer['url']: peer for peer in manager.health()}
+    assert health['http://a']['failures'] == 0
+    assert health['http://a']['retry_at'] == 0
+    assert health['http://a']['last_seen'] == clock.now
+
+
+def test_fastest_peers_are_contacted_first(clock):
+    manager = PeerManager(['http://new', 'http://slow', 'http://fast'])
+    manager.record_success('http://slow', 0.5)
+    manager.record_success('http://fast', 0.3)
+    assert manager.available() == ['http://fast', 'http://slow', 'http://new']
+    # The latency is a moving average
+    manager.record_success('http://fast', 1.3)
+    health = {peer['url']: peer for peer in manager.health()}
+    assert health['http://fast']['latency'] == pytest.approx(
+        0.3 + peers.LATENCY_WEIGHT)
+    assert manager.available()[0] == 'http://slow'
+
+
+def test_failed_requests_are_recorded(monkeypatch, clock):
+    def unreachable(method, url, **kwargs):
+        raise requests.exceptions.ConnectionError(url)
+
+    monkeypatch.setattr(peers.requests, 'request', unreachable)
+    manager = PeerManager(['http://a'])
+    for _ in range(peers.FAILURE_THRESHOLD):
+        with pytest.raises(requests.exceptions.RequestException):
+            manager.request('GET', 'http://a', '/chain')
+    assert manager.available() == []
+    # Unknown peers are not tracked
+    manager.record_failure('http://unknown')
+    assert [peer['url'] for peer in manager.health()] == ['http://a']
@@ -0,0 +1,78 @@
+import threading
+
+import pytest
+
+from election_registry import ElectionRegistry
+
+
+class Loader:
+    """Creates a stand-in blockchain for every election and records the
+    loads. Elections in broken fail to load."""
+
+    def __init__(self, broken=()):
+        self.loads = []
+        self.broken = set(broken)
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, election_id):
+        self.release.wait(5)
+        self.loads.append(election_id)
+        if election_id in self.broken:
+            raise ValueError('Broken election')
+        return 'chain-{}'.format(election_id)
+
+
+def test_registered_elections_are_loaded_on_first_access():
+    loader = Loader()
+    registry = ElectionRegistry(loader)
+    for election_id in (1, 2):
+        registry.register(election_id)
+    assert loader.loads == []
+    assert 1 in registry and len(registry) == 2
+    assert sorted(registry) == [1, 2]
+    assert registry.loaded() == []
+    assert registry[1] == 'chain-1'
+    assert registry[1] == 'chain-1'
+    assert loader.loads == [1]
+    assert registry.loaded() == [(1, 'chain-1')]
+    with pytest.raises(KeyError):
+        registry[3]
+    assert registry.get(3) is None
+    # Elections which are set are not loaded any more
+    registry[2] = 'created'
+    assert registry[2] == 'created'
+    assert loader.loads == [1]
+
+
+def test_concurrent_accesses_load_an_election_once():
+    loader = Loader()
+    loader.release.clear()
+    registry = ElectionRegistry(loader)
+    registry.register(1)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry[1]))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    loader.release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == ['chain-1'] * 4
+    assert loader.loads == [1]
+
+
+def test_warm_up_loads_the_registered_elections():
+    loader = Loader(broken={3})
+    registry = ElectionRegistry(loader)
+    assert registry.warm_up() is None
+    for election_id in (1, 2, 3):
+        registry.register(election_id)
+    registry.warm_up(workers=2).shutdown(wait=True)
+    assert sorted(loader.loads) == [1, 2, 3]
+    assert sorted(registry.loaded()) == [(1, 'chain-1'), (2, 'chain-2')]
+    # A broken election fails again on first access
+    with pytest.raises(ValueError):
+        registry[3]
+    assert registry.warm_up(workers=0) is None
+
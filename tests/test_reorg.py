@@ -0,0 +1,102 @@
+from blockchain import Blockchain
+from tally import Tally
+
+from conftest import cast_vote, make_chain
+
+
+def mine(blockchain, *candidates):
+    """Mine a block with one vote for each candidate."""
+    for candidate in candidates:
+        cast_vote(blockchain, candidate)
+    block = blockchain.mine_block()
+    assert block is not None
+    return block
+
+
+def fork_chains():
+    """Return two chains which share the genesis block and one block and
+    then diverge: [g, a1, a2] and [g, a1, b2, b3]."""
+    node_a = make_chain(1)
+    node_b = make_chain(2)
+    shared = mine(node_a, 'alice')
+    assert node_b.add_block(shared.to_dict())
+    mine(node_a, 'bob')
+    mine(node_b, 'carol')
+    mine(node_b, 'alice', 'carol')
+    return node_a, node_b
+
+
+def test_find_fork():
+    node_a, node_b = fork_chains()
+    assert node_a.find_fork(node_b.get_block_hashes()) == 2
+    assert node_b.find_fork(node_a.get_block_hashes()) == 2
+    assert node_a.find_fork(node_a.get_block_hashes()) == 3
+    # A chain which ends before ours forks where it ends
+    assert node_b.find_fork(node_b.get_block_hashes()[:2]) == 2
+    assert node_a.find_fork(['0' * 64]) == 0
+
+
+def test_reorg_switches_to_the_other_chain():
+    node_a, node_b = fork_chains()
+    fork = node_a.find_fork(node_b.get_block_hashes())
+    node_a.reorg(fork, node_b.chain[fork:])
+    assert node_a.get_block_hashes() == node_b.get_block_hashes()
+    expected = Tally.from_chain(node_b.chain).to_dict()
+    assert node_a.get_all_results() == expected['results']
+    assert node_a.get_results_count('carol') == 2
+    assert node_a.get_results('bob') == 0
+
+
+def test_reorg_reopens_orphaned_votes():
+    node_a, node_b = fork_chains()
+    orphaned = [vt for vt in node_a.chain[2].votes if vt.voter != 'MINING']
+    pending = cast_vote(node_a, 'dave')
+    fork = node_a.find_fork(node_b.get_block_hashes())
+    node_a.reorg(fork, node_b.chain[fork:])
+    open_votes = node_a.get_unverified_votes()
+    signatures = [vt.signature for vt in open_votes]
+    # The orphaned vote for bob and the open vote are open again, the
+    # mining reward of the orphaned block is gone
+    assert [vt.signature for vt in orphaned] + [pending.signature] == \
+        signatures
+    assert all(vt.voter != 'MINING' for vt in open_votes)
+
+
+def test_reorg_drops_votes_confirmed_by_the_new_chain():
+    node_a = make_chain(1)
+    node_b = make_chain(2)
+    vote = cast_vote(node_a, 'alice')
+    assert node_b.add_vote(vote.candidate, vote.voter, vote.signature, 7,
+                           scheme=vote.scheme)
+    node_a.mine_block()
+    node_b.mine_block()
+    mine(node_b, 'bob')
+    fork = node_a.find_fork(node_b.get_block_hashes())
+    assert fork == 1
+    node_a.reorg(fork, node_b.chain[fork:])
+    # The vote is part of the new chain, so it is not opened again
+    assert node_a.get_unverified_votes() == []
+    assert node_a.get_balance(vote.voter) == -1
+
+
+def test_reorg_survives_a_restart():
+    node_a, node_b = fork_chains()
+    fork = node_a.find_fork(node_b.get_block_hashes())
+    node_a.reorg(fork, node_b.chain[fork:])
+    node_a.save_data()
+    reloaded = Blockchain('node-1', 1, 7)
+    assert reloaded.get_block_hashes() == node_b.get_block_hashes()
+    assert reloaded.get_all_results() == node_b.get_all_results()
+
+
+def test_tally_revert_block_undoes_apply_block():
+    node_a, node_b = fork_chains()
+    chain = node_b.chain
+    tally = Tally.from_chain(chain[:2])
+    before = tally.to_dict()
+    for block in chain[2:]:
+        tally.apply_block(block)
+    for block in reversed(chain[2:]):
+        tally.revert_block(block)
+    assert tally.to_dict() == before
+    assert 'carol' not in tally.results
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import threading
+
+import node
+import peers
+from peers import PeerManager
+
+from conftest import ELECTION, cast_vote, make_chain
+from test_reorg import fork_chains, mine
+
+
+class PeerResponse:
+    def __init__(self, response):
+        self.status_code = response.status_code
+        self.url = response.request.url
+        self.__data = response.get_data()
+
+    def json(self):
+        return json.loads(self.__data.decode('utf-8'))
+
+
+def serve_peer(monkeypatch, blockchain):
+    """Answer the requests to peers from the routes of a node which hosts
+    the given election, and return the paths which were requested."""
+    monkeypatch.setitem(node.elections._ElectionRegistry__elections,
+                        ELECTION, blockchain)
+    client = node.app.test_client()
+    paths = []
+
+    def request(self, method, url, path, **kwargs):
+        paths.append(path)
+        # requests would decompress the answer, so none is asked for
+        return PeerResponse(client.open(path, method=method))
+
+    monkeypatch.setattr(PeerManager, 'request', request)
+    return paths
+
+
+def test_resolve_downloads_only_the_blocks_after_the_fork(monkeypatch):
+    node_a, node_b = fork_chains()
+    node_a.add_peer_node('http://peer')
+    paths = serve_peer(monkeypatch, node_b)
+    assert node_a.resolve(ELECTION)
+    assert node_a.get_block_hashes() == node_b.get_block_hashes()
+    assert paths == [
+        '/chain?election={}&format=hashes'.format(ELECTION),
+        '/chain?election={}&format=packed&start=2'.format(ELECTION)]
+
+
+def test_resolve_keeps_a_longer_chain(monkeypatch):
+    node_a, node_b = fork_chains()
+    mine(node_a, 'dave')
+    mine(node_a, 'erin')
+    node_a.add_peer_node('http://peer')
+    paths = serve_peer(monkeypatch, node_b)
+    hashes = node_a.get_block_hashes()
+    assert not node_a.resolve(ELECTION)
+    assert node_a.get_block_hashes() == hashes
+    # The shorter chain is rejected on its hashes alone
+    assert len(paths) == 1
+
+
+def test_resolve_rejects_an_invalid_suffix(monkeypatch):
+    node_a, node_b = fork_chains()
+    node_a.add_peer_node('http://peer')
+    serve_peer(monkeypatch, node_b)
+    original = node.Blockchain.pack_chain
+
+    def tampered(self, start=0):
+        packed = original(self, start)
+        packed['chain'][-1]['proof'] = -1
+        return packed
+
+    monkeypatch.setattr(node.Blockchain, 'pack_chain', tampered)
+    hashes = node_a.get_block_hashes()
+    assert not node_a.resolve(ELECTION)
+    assert node_a.get_block_hashes() == hashes
+
+
+def test_resolve_reopens_orphaned_votes(monkeypatch):
+    node_a = make_chain(1)
+    node_b = make_chain(2)
+    mine(node_a, 'alice')
+    mine(node_b, 'bob')
+    mine(node_b, 'carol')
+    pending = cast_vote(node_a, 'dave')
+    node_a.add_peer_node('http://peer')
+    serve_peer(monkeypatch, node_b)
+    assert node_a.resolve(ELECTION)
+    assert node_a.get_block_hashes() == node_b.get_block_hashes()
+    assert [vt.candidate for vt in node_a.get_unverified_votes()] == [
+        'alice', 'dave']
+    assert node_a.get_unverified_votes()[-1].signature == pending.signature
+
+
+def test_resolve_asks_the_peers_from_the_event_loop(monkeypatch):
+    node_a, node_b = fork_chains()
+    node_a.add_peer_node('http://peer-1')
+    node_a.add_peer_node('http://peer-2')
+    serve_peer(monkeypatch, node_b)
+    request = PeerManager.request
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(peers, 'event_loop', loop)
+    asked = []
+    everyone = asyncio.Event()
+
+    async def request_async(self, method, url, path, **kwargs):
+        assert threading.current_thread() is thread
+        if 'format=hashes' in path:
+            asked.append(url)
+            if len(asked) == 2:
+                everyone.set()
+            # Both peers are asked before either of them answers
+            await asyncio.wait_for(everyone.wait(), 5)
+        return request(self, method, url, path, **kwargs)
+
+    monkeypatch.setattr(PeerManager, 'request_async', request_async)
+    try:
+        assert node_a.resolve(ELECTION)
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        loop.close()
+    assert sorted(asked) == ['http://peer-1', 'http://peer-2']
+    assert node_a.get_block_hashes() == node_b.get_block_hashes()
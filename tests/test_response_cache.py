@@ -0,0 +1,109 @@
+import gzip
+import json
+
+import pytest
+
+import node
+from utility.compression import MIN_SIZE
+from utility.response_cache import ResponseCache
+
+from conftest import ELECTION, make_chain
+from test_reorg import mine
+
+
+@pytest.fixture
+def client(monkeypatch):
+    blockchain = make_chain(1)
+    monkeypatch.setitem(node.elections._ElectionRegistry__elections,
+                        ELECTION, blockchain)
+    return blockchain, node.app.test_client()
+
+
+def test_unchanged_responses_are_not_modified(client):
+    blockchain, client = client
+    path = '/chain?election={}'.format(ELECTION)
+    response = client.get(path)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    response = client.get(path, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.get_data() == b''
+    assert response.headers['ETag'] == etag
+    # Every change of the chain changes the ETag
+    mine(blockchain, 'alice')
+    response = client.get(path, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert len(response.get_json()) == 2
+
+
+def test_formats_have_their_own_etag(client):
+    _, client = client
+    tags = {client.get('/chain?election={}&format={}'.format(
+        ELECTION, chain_format)).headers['ETag']
+        for chain_format in ('hashes', 'packed', 'full')}
+    assert len(tags) == 3
+
+
+def test_large_responses_are_compressed(client):
+    blockchain, client = client
+    for index in range(10):
+        mine(blockchain, 'candidate-{}'.format(index))
+    path = '/chain?election={}'.format(ELECTION)
+    plain = client.get(path)
+    assert len(plain.get_data()) >= MIN_SIZE
+    assert 'Content-Encoding' not in plain.headers
+    packed = client.get(path, headers={'Accept-Encoding': 'gzip'})
+    assert packed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in packed.headers['Vary']
+    assert gzip.decompress(packed.get_data()) == plain.get_data()
+    # Both encodings share the ETag of the data
+    assert packed.headers['ETag'] == plain.headers['ETag']
+
+
+def test_responses_are_built_once_per_version():
+    cache = ResponseCache()
+    builds = []
+
+    def build():
+        builds.append(1)
+        return {'count': len(builds)}
+
+    etag, body, encoding = cache.get('key', 1, build)
+    assert cache.get('key', 1, build) == (etag, body, encoding)
+    assert json.loads(body) == {'count': 1}
+    assert encoding is None
+    new_etag, body, _ = cache.get('key', 2, build)
+    assert new_etag != etag
+    assert json.loads(body) == {'count': 2}
+    assert len(builds) == 2
+
+
+def test_least_recently_used_responses_are_dropped():
+    cache = ResponseCache(capacity=2)
+    builds = []
+
+    def build():
+        builds.append(1)
+        return {}
+
+    cache.get('a', 1, build)
+    cache.get('b', 1, build)
+    cache.get('a', 1, build)
+    cache.get('c', 1, build)
+    assert len(cache) == 2
+    assert len(builds) == 3
+    # b was used least recently
+    cache.get('a', 1, build)
+    assert len(builds) == 3
+    cache.get('b', 1, build)
+    assert len(builds) == 4
+
+
+def test_small_bodies_are_not_compressed():
+    cache = ResponseCache()
+    assert cache.get('small', 1, lambda: {}, 'gzip')[2] is None
+    large = {'data': 'x' * MIN_SIZE}
+    etag, body, encoding = cache.get('large', 1, lambda: large, 'gzip')
+    assert encoding == 'gzip'
+    assert json.loads(gzip.decompress(body)) == large
@@ -0,0 +1,99 @@
+import gzip
+import json
+
+import pytest
+
+import shard_router
+from election_registry import shard_for
+
+
+class Worker:
+    """Answers like a worker and records the requests it got."""
+
+    def __init__(self, index, status=200, reachable=True):
+        self.index = index
+        self.status = status
+        self.reachable = reachable
+        self.requests = []
+
+    def request(self, method, path, body=None, headers=None):
+        if not self.reachable:
+            raise ConnectionRefusedError(path)
+        self.requests.append((method, path, body, headers))
+        response_headers = [('Content-Type', 'application/json'),
+                            ('Connection', 'close'), ('X-Shard', '1')]
+        return self.status, response_headers, json.dumps(
+            {'shard': self.index}).encode()
+
+
+@pytest.fixture
+def workers(monkeypatch):
+    workers = [Worker(index) for index in range(3)]
+    monkeypatch.setattr(shard_router, 'workers', workers)
+    return workers
+
+
+def shard_of(response):
+    return response.get_json()['shard']
+
+
+def test_shards_split_the_elections():
+    assert [shard_for(election_id, 3) for election_id in range(6)] == [
+        0, 1, 2, 0, 1, 2]
+    assert shard_for('7', 3) == 1
+    assert shard_for('unknown', 3) == 0
+    assert shard_for(None, 3) == 0
+
+
+def test_requests_go_to_the_shard_of_their_election(workers):
+    client = shard_router.app.test_client()
+    assert shard_of(client.get('/chain?election=4')) == 1
+    assert shard_of(client.post('/vote', json={'election': 5})) == 2
+    assert shard_of(client.post('/create-election', json={'id': 7})) == 1
+    # Requests which name no election go to the first worker
+    assert shard_of(client.get('/ballot-keys')) == 0
+    assert shard_of(client.post('/vote', data='no json')) == 0
+    body = gzip.compress(json.dumps({'election': 8}).encode())
+    response = client.post('/broadcast-vote', data=body, headers={
+        'Content-Type': 'application/json', 'Content-Encoding': 'gzip'})
+    assert shard_of(response) == 2
+
+
+def test_requests_are_forwarded_as_they_came(workers):
+    client = shard_router.app.test_client()
+    response = client.post('/vote?election=1', json={'election': 1},
+                           headers={'X-Digest': 'abc'})
+    method, path, body, headers = workers[1].requests[0]
+    assert (method, path) == ('POST', '/vote?election=1')
+    assert json.loads(body) == {'election': 1}
+    assert headers['X-Digest'] == 'abc'
+    assert 'Host' not in headers
+    # Headers which concern the worker connection are not passed back
+    assert response.headers['X-Shard'] == '1'
+    assert 'Connection' not in response.headers
+
+
+def test_unreachable_shards_answer_503(workers):
+    workers[2].reachable = False
+    response = shard_router.app.test_client().get('/chain?election=2')
+    assert response.status_code == 503
+    assert shard_of(
+        shard_router.app.test_client().get('/chain?election=1')) == 1
+
+
+def test_new_keys_are_loaded_by_every_shard(workers):
+    workers[0].status = 201
+    response = shard_router.app.test_client().post('/ballot')
+    assert response.status_code == 201
+    assert [worker.requests[0][:2] for worker in workers] == [
+        ('POST', '/ballot'), ('GET', '/ballot'), ('GET', '/ballot')]
+
+
+def test_metrics_are_labelled_with_their_shard():
+    text = ('# HELP up Up.\n# TYPE up gauge\nup 1\n'
+            '# HELP hits Hits.\n# TYPE hits counter\nhits{route="/"} 2\n')
+    assert shard_router.merge_metrics([(0, text), (1, text)]) == (
+        '# HELP up Up.\n# TYPE up gauge\n'
+        'up{shard="0"} 1\nup{shard="1"} 1\n'
+        '# HELP hits Hits.\n# TYPE hits counter\n'
+        'hits{shard="0",route="/"} 2\nhits{shard="1",route="/"} 2\n')
@@ -0,0 +1,73 @@
+import pytest
+
+from ballot import SCHEMES, Ballot
+from blockchain import Blockchain
+from vote import Vote
+
+from conftest import ELECTION
+
+
+@pytest.fixture(scope='module')
+def keys():
+    """A key pair of every signature scheme."""
+    ballot = Ballot(1)
+    return {scheme: ballot.generate_keys(scheme) for scheme in SCHEMES}
+
+
+def signed(keys, scheme, candidate='alice'):
+    private_key, public_key = keys[scheme]
+    signature = Ballot(1).sign_vote(public_key, private_key, candidate, 1,
+                                    scheme)
+    return Vote(public_key, candidate, signature, 1, scheme)
+
+
+@pytest.mark.parametrize('scheme', SCHEMES)
+def test_votes_are_verified_with_their_scheme(keys, scheme):
+    vote = signed(keys, scheme)
+    assert Ballot.verify_vote(vote)
+    assert Ballot.check_votes([vote]) == [True]
+    forged = Vote(vote.voter, 'mallory', vote.signature, 1, scheme)
+    assert not Ballot.verify_vote(forged)
+
+
+def test_signatures_do_not_verify_with_another_scheme(keys):
+    for scheme, other in (('rsa', 'ed25519'), ('ed25519', 'rsa')):
+        vote = signed(keys, scheme)
+        # Keys and signatures of the other scheme are rejected, not raised
+        vote.scheme = other
+        assert not Ballot.verify_vote(vote)
+    mixed = signed(keys, 'ed25519')
+    mixed.signature = signed(keys, 'rsa').signature
+    assert not Ballot.verify_vote(mixed)
+
+
+def test_ed25519_keys_and_signatures_are_shorter(keys):
+    rsa, ed25519 = signed(keys, 'rsa'), signed(keys, 'ed25519')
+    assert len(ed25519.voter) < len(rsa.voter)
+    assert len(ed25519.signature) < len(rsa.signature)
+
+
+def test_rsa_votes_keep_their_hashed_form(keys):
+    rsa, ed25519 = signed(keys, 'rsa'), signed(keys, 'ed25519')
+    # Blocks signed before other schemes existed keep their hash
+    assert 'scheme' not in rsa.to_ordered_dict()
+    assert ed25519.to_ordered_dict()['scheme'] == 'ed25519'
+    legacy = dict(rsa.__dict__)
+    del legacy['scheme']
+    assert Vote.from_dict(legacy).scheme == 'rsa'
+
+
+@pytest.mark.parametrize('scheme', SCHEMES)
+def test_elections_accept_only_their_scheme(keys, scheme):
+    blockchain = Blockchain('node-1', 1, ELECTION, 'test election',
+                            settings={'scheme': scheme})
+    other = 'rsa' if scheme == 'ed25519' else 'ed25519'
+    rejected = signed(keys, other)
+    assert not blockchain.add_vote(
+        rejected.candidate, rejected.voter, rejected.signature, ELECTION,
+        scheme=other)
+    accepted = signed(keys, scheme)
+    # Votes without a scheme are taken to use the election's scheme
+    assert blockchain.add_vote(
+        accepted.candidate, accepted.voter, accepted.signature, ELECTION)
+    assert blockchain.get_unverified_votes()[0].scheme == scheme
@@ -0,0 +1,125 @@
+import json
+import sqlite3
+
+from block import Block
+from blockchain import Blockchain
+from storage.file_storage import FileStorage
+from storage.sqlite_storage import SQLiteStorage
+from utility.hash_util import hash_block
+from vote import Vote
+
+from conftest import ELECTION, SETTINGS, cast_vote, make_chain
+
+# The tables of a database written before merkle roots, signature schemes
+# and the key dictionary existed
+LEGACY_SCHEMA = """
+CREATE TABLE blocks (
+    height INTEGER PRIMARY KEY,
+    previous_hash TEXT,
+    timestamp,
+    proof TEXT,
+    hash TEXT NOT NULL
+);
+CREATE TABLE votes (
+    height INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    voter TEXT NOT NULL,
+    candidate TEXT NOT NULL,
+    amount NOT NULL,
+    signature TEXT NOT NULL,
+    PRIMARY KEY (height, position)
+);
+CREATE INDEX votes_voter ON votes (voter);
+CREATE TABLE unverified_votes (
+    position INTEGER PRIMARY KEY,
+    voter TEXT NOT NULL,
+    candidate TEXT NOT NULL,
+    amount NOT NULL,
+    signature TEXT NOT NULL
+);
+CREATE TABLE peers (
+    url TEXT PRIMARY KEY
+);
+"""
+
+
+def legacy_chain():
+    """Return a genesis block and two blocks without merkle roots."""
+    chain = [Block(0, 'test election', [], ELECTION, 0)]
+    for index in (1, 2):
+        votes = [Vote('voter-{}-{}'.format(index, i), 'alice',
+                      'sig-{}-{}'.format(index, i), 1) for i in range(3)]
+        votes.append(Vote('MINING', 'node-1', '', 1))
+        chain.append(Block(index, hash_block(chain[-1]), votes, 100 + index,
+                           1000.0 + index))
+    return chain
+
+
+def test_legacy_sqlite_database_is_migrated(workdir):
+    chain = legacy_chain()
+    connection = sqlite3.connect('blockchain-1-{}.db'.format(ELECTION))
+    connection.executescript(LEGACY_SCHEMA)
+    for block in chain:
+        connection.execute(
+            'INSERT INTO blocks VALUES (?, ?, ?, ?, ?)',
+            (block.index, block.previous_hash, block.timestamp,
+             json.dumps(block.proof), hash_block(block)))
+        connection.executemany(
+            'INSERT INTO votes VALUES (?, ?, ?, ?, ?, ?)',
+            [(block.index, position, vt.voter, vt.candidate, vt.amount,
+              vt.signature) for position, vt in enumerate(block.votes)])
+    connection.execute(
+        'INSERT INTO unverified_votes VALUES (0, ?, ?, 1, ?)',
+        ('voter-open', 'bob', 'sig-open'))
+    connection.execute('INSERT INTO peers VALUES (?)', ('http://peer',))
+    connection.commit()
+    connection.close()
+
+    storage = SQLiteStorage(1, ELECTION)
+    loaded, unverified_votes, peer_nodes = storage.load()
+    assert [loaded.hash_at(i) for i in range(len(loaded))] == [
+        hash_block(block) for block in chain]
+    assert [hash_block(block) for block in loaded] == [
+        hash_block(block) for block in chain]
+    assert all(block.merkle_root is None for block in loaded)
+    assert [vt.voter for vt in loaded[1].votes] == [
+        vt.voter for vt in chain[1].votes]
+    assert all(vt.scheme == 'rsa' for vt in loaded[2].votes)
+    assert [(vt.voter, vt.candidate) for vt in unverified_votes] == [
+        ('voter-open', 'bob')]
+    assert peer_nodes == ['http://peer']
+    assert storage.get_results_voters('alice', 3)[2] == [
+        'voter-2-0', 'voter-2-1', 'voter-2-2']
+    # The migrated database is opened like any other from now on
+    assert SQLiteStorage(1, ELECTION).load()[0].hash_at(2) == \
+        hash_block(chain[2])
+
+
+def test_legacy_text_file_is_read(workdir):
+    chain = legacy_chain()
+    with open('blockchain-1-{}.txt'.format(ELECTION), mode='w') as f:
+        f.write(json.dumps([block.to_dict() for block in chain]))
+        f.write('\n')
+        f.write(json.dumps([Vote('voter-open', 'bob', 'sig', 1).__dict__]))
+        f.write('\n')
+        f.write(json.dumps(['http://peer']))
+    loaded, unverified_votes, peer_nodes = FileStorage(1, ELECTION).load()
+    assert [hash_block(block) for block in loaded] == [
+        hash_block(block) for block in chain]
+    assert unverified_votes[0].voter == 'voter-open'
+    assert peer_nodes == ['http://peer']
+
+
+def test_text_file_is_imported_into_sqlite(workdir):
+    stored = make_chain(1)
+    cast_vote(stored, 'alice')
+    stored.mine_block()
+    open_vote = cast_vote(stored, 'bob')
+    imported = Blockchain('node-1', 1, ELECTION, storage='sqlite',
+                          settings=SETTINGS)
+    assert [hash_block(block) for block in imported.chain] == [
+        hash_block(block) for block in stored.chain]
+    assert imported.get_all_results() == stored.get_all_results()
+    assert [vt.signature for vt in imported.get_unverified_votes()] == [
+        open_vote.signature]
+    assert SQLiteStorage.discover(1) == [ELECTION]
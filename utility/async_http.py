@@ -0,0 +1,142 @@
+"""Provides a minimal asyncio HTTP/1.1 client for requests to peers, so
+waiting for peers does not take up a thread."""
+
+import asyncio
+import json
+from urllib.parse import urlsplit
+import zlib
+
+from utility.compression import (
+    ENCODINGS, MAX_BODY_SIZE, BodyTooLarge, decompress)
+
+
+class RequestError(Exception):
+    """Raised if a peer could not be reached or sent no valid answer."""
+
+
+class Response:
+    """The answer of a peer (with the attributes of a requests.Response
+    which are used with peers).
+
+    Attributes:
+        :url: The URL which was requested.
+        :status_code: The HTTP status.
+        :headers: The headers (lower case names).
+        :content: The (decompressed) body.
+    """
+
+    def __init__(self, url, status_code, headers, content):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content.decode('utf-8'))
+
+
+async def read_body(reader, headers, limit=MAX_BODY_SIZE):
+    """Read a body with the framing its headers announce. Raises a
+    BodyTooLarge error before reading more than limit bytes.
+
+    Arguments:
+        :reader: The stream of the connection.
+        :headers: The headers of the message (lower case names).
+        :limit: The largest body which is accepted.
+    """
+    chunks = []
+    total = 0
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                # Skip the trailer
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return b''.join(chunks)
+            total += size
+            if total > limit:
+                raise BodyTooLarge('The body exceeds {} bytes'.format(limit))
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+    if 'content-length' in headers:
+        length = int(headers['content-length'])
+        if length > limit:
+            raise BodyTooLarge('The body exceeds {} bytes'.format(limit))
+        return await reader.readexactly(length)
+    # Without a length the body ends with the connection
+    while True:
+        chunk = await reader.read(65536)
+        if not chunk:
+            return b''.join(chunks)
+        total += len(chunk)
+        if total > limit:
+            raise BodyTooLarge('The body exceeds {} bytes'.format(limit))
+        chunks.append(chunk)
+
+
+async def read_headers(reader):
+    """Read header lines up to the blank line into a dict."""
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            return headers
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+
+async def send(method, url, data, headers):
+    parts = urlsplit(url)
+    if parts.scheme != 'http':
+        raise RequestError('Only http peers are supported: ' + url)
+    reader, writer = await asyncio.open_connection(
+        parts.hostname, parts.port or 80)
+    try:
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        lines = ['{} {} HTTP/1.1'.format(method, path),
+                 'Host: {}'.format(parts.netloc),
+                 'Connection: close',
+                 'Content-Length: {}'.format(len(data))]
+        lines += ['{}: {}'.format(name, value)
+                  for name, value in headers.items()]
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        writer.write(data)
+        await writer.drain()
+        status_line = await reader.readline()
+        status = int(status_line.split()[1])
+        response_headers = await read_headers(reader)
+        content = await read_body(reader, response_headers)
+    finally:
+        writer.close()
+    encoding = response_headers.get('content-encoding', '').lower()
+    if encoding in ENCODINGS:
+        content = decompress(content, encoding, MAX_BODY_SIZE)
+    return Response(url, status, response_headers, content)
+
+
+async def fetch(method, url, data=b'', json_body=None, headers=None,
+                timeout=None):
+    """Send a request and return its Response. Raises a RequestError if
+    the peer did not answer in time or sent no valid answer.
+
+    Arguments:
+        :method: The HTTP method.
+        :url: The full URL.
+        :data: The body as bytes.
+        :json_body: A body which is sent as JSON instead.
+        :headers: Additional request headers.
+        :timeout: How long the whole request may take (seconds).
+    """
+    headers = dict(headers or {})
+    if json_body is not None:
+        data = json.dumps(json_body).encode('utf-8')
+        headers['Content-Type'] = 'application/json'
+    try:
+        return await asyncio.wait_for(
+            send(method, url, data or b'', headers), timeout)
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError,
+            ValueError, IndexError, zlib.error) as error:
+        raise RequestError(str(error)) from error
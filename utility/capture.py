@@ -0,0 +1,81 @@
+"""Records the requests a node serves to a JSONL capture file, which
+benchmarks/replay.py drives against another node."""
+
+import json
+import threading
+from time import perf_counter
+
+# Body fields which are never written to a capture
+REDACTED_FIELDS = ('voter_private_key', 'private_key')
+REDACTED = '<redacted>'
+
+
+def redact(values):
+    """Return a copy of a JSON body with the private keys replaced."""
+    if isinstance(values, dict):
+        return {key: REDACTED if key in REDACTED_FIELDS else redact(value)
+                for key, value in values.items()}
+    if isinstance(values, list):
+        return [redact(value) for value in values]
+    return values
+
+
+class TrafficRecorder:
+    """Writes one JSON line per request to a capture file.
+
+    Every line holds the offset of the request from the start of the
+    capture (seconds), the method, path and query, the route, the body
+    (JSON bodies as 'json' with private keys redacted), the recorded
+    headers, the status and the duration (milliseconds). Other bodies
+    cannot be redacted and may hold a private key, so only their size
+    ('body_size') and content type are recorded.
+
+    Attributes:
+        :path: The capture file.
+        :headers: The names of the request headers which are recorded.
+    """
+
+    def __init__(self, path, headers=()):
+        self.path = path
+        self.headers = tuple(headers)
+        self.__start = perf_counter()
+        self.__lock = threading.Lock()
+        self.__file = open(path, mode='w')
+
+    def record(self, request, response, start):
+        """Write a served request to the capture.
+
+        Arguments:
+            :request: The Flask request.
+            :response: The response which was sent.
+            :start: When serving the request started (perf_counter).
+        """
+        entry = {
+            'offset': round(start - self.__start, 6),
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'route': request.url_rule.rule if request.url_rule else None,
+            'status': response.status_code,
+            'duration_ms': round((perf_counter() - start) * 1000, 3)
+        }
+        headers = {name: request.headers[name] for name in self.headers
+                   if name in request.headers}
+        if headers:
+            entry['headers'] = headers
+        # Compressed bodies were already decompressed by the middleware
+        values = request.get_json(silent=True)
+        if values is not None:
+            entry['json'] = redact(values)
+        else:
+            size = len(request.get_data())
+            if size:
+                entry['body_size'] = size
+                entry['content_type'] = request.content_type
+        line = json.dumps(entry)
+        with self.__lock:
+            self.__file.write(line + '\n')
+            self.__file.flush()
+
+    def close(self):
+        with self.__lock:
+            self.__file.close()
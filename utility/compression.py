@@ -0,0 +1,151 @@
+"""Provides gzip/deflate compression for the payloads sent between nodes."""
+
+import io
+import json
+import zlib
+
+# Bodies smaller than this are sent uncompressed
+MIN_SIZE = 1024
+# The largest request body a node accepts, before and after decompression
+MAX_BODY_SIZE = 16 * 1024 * 1024
+# The zlib window bits of every supported Content-Encoding
+ENCODINGS = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS
+}
+
+
+def compress(body, encoding):
+    """Compress a body with the given Content-Encoding.
+
+    Arguments:
+        :body: The bytes which should be compressed.
+        :encoding: Either 'gzip' or 'deflate'.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, ENCODINGS[encoding])
+    return compressor.compress(body) + compressor.flush()
+
+
+class BodyTooLarge(ValueError):
+    """Raised if a body is (or decompresses to) more than the allowed
+    size."""
+
+
+def decompress(body, encoding, limit=None):
+    """Decompress a body which was sent with the given Content-Encoding.
+    Raises a BodyTooLarge error as soon as the output exceeds the limit, so
+    a small compressed body cannot expand into an arbitrarily large one,
+    and a zlib.error for invalid or truncated bodies.
+
+    Arguments:
+        :body: The compressed bytes.
+        :encoding: Either 'gzip' or 'deflate'.
+        :limit: The largest allowed size of the output (None: unlimited).
+    """
+    decompressor = zlib.decompressobj(ENCODINGS[encoding])
+    if limit is None:
+        data = decompressor.decompress(body) + decompressor.flush()
+    else:
+        # Never more than the room left below the limit is inflated at
+        # once; the input which did not fit stays in unconsumed_tail
+        chunks = []
+        size = 0
+        pending = body
+        while True:
+            chunk = decompressor.decompress(pending, limit + 1 - size)
+            size += len(chunk)
+            if size > limit:
+                raise BodyTooLarge(
+                    'The body decompresses to more than {} bytes'.format(
+                        limit))
+            chunks.append(chunk)
+            pending = decompressor.unconsumed_tail
+            # An empty call drains the output zlib still buffers
+            if decompressor.eof or not (pending or chunk):
+                break
+        data = b''.join(chunks)
+    if not decompressor.eof:
+        raise zlib.error('The compressed body is truncated')
+    return data
+
+
+def choose_encoding(accept_encoding):
+    """Pick the encoding to answer with from an Accept-Encoding header
+    (None if the client accepts neither gzip nor deflate).
+
+    Arguments:
+        :accept_encoding: The value of the Accept-Encoding header.
+    """
+    accepted = []
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0'):
+            continue
+        accepted.append(name.strip().lower())
+    for encoding in ENCODINGS:
+        if encoding in accepted:
+            return encoding
+    return None
+
+
+def json_request(payload, encoding='gzip'):
+    """Return the (data, headers) to POST a JSON payload to another node,
+    compressed if it is large enough to be worth it.
+
+    Arguments:
+        :payload: The data which should be sent.
+        :encoding: The Content-Encoding to compress with.
+    """
+    body = json.dumps(payload).encode()
+    headers = {'Content-Type': 'application/json'}
+    if len(body) >= MIN_SIZE:
+        body = compress(body, encoding)
+        headers['Content-Encoding'] = encoding
+    return body, headers
+
+
+class DecompressingMiddleware:
+    """A WSGI middleware which transparently decompresses request bodies
+    sent with a gzip or deflate Content-Encoding. Bodies larger than
+    max_size (compressed or not) are rejected with 413.
+
+    Attributes:
+        :app: The wrapped WSGI application.
+        :max_size: The largest accepted body in bytes.
+    """
+
+    def __init__(self, app, max_size=MAX_BODY_SIZE):
+        self.app = app
+        self.max_size = max_size
+
+    @staticmethod
+    def reject(start_response, status, message):
+        start_response(status, [('Content-Type', 'application/json')])
+        return [json.dumps({'message': message}).encode()]
+
+    def __call__(self, environ, start_response):
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+            if length < 0:
+                raise ValueError('Negative Content-Length')
+        except ValueError:
+            return self.reject(start_response, '400 BAD REQUEST',
+                               'Invalid Content-Length.')
+        if length > self.max_size:
+            return self.reject(start_response, '413 PAYLOAD TOO LARGE',
+                               'The body is too large.')
+        encoding = environ.get('HTTP_CONTENT_ENCODING', '').strip().lower()
+        if encoding in ENCODINGS:
+            try:
+                body = decompress(environ['wsgi.input'].read(length),
+                                  encoding, self.max_size)
+            except BodyTooLarge:
+                return self.reject(start_response, '413 PAYLOAD TOO LARGE',
+                                   'The body is too large.')
+            except zlib.error:
+                return self.reject(start_response, '400 BAD REQUEST',
+                                   'Invalid compressed body.')
+            environ['wsgi.input'] = io.BytesIO(body)
+            environ['CONTENT_LENGTH'] = str(len(body))
+            del environ['HTTP_CONTENT_ENCODING']
+        return self.app(environ, start_response)
@@ -20,6 +20,9 @@ def hash_block(block):
         :block: The block that should be hashed.
     """
     hashable_block = block.__dict__.copy()
+    # Blocks created before merkle roots were introduced keep their hash
+    if hashable_block.get('merkle_root') is None:
+        hashable_block.pop('merkle_root', None)
     hashable_block['votes'] = [vt.to_ordered_dict()
                                for vt in hashable_block['votes']]
     return hash_string_256(json.dumps(hashable_block, sort_keys=True).encode())
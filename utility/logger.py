@@ -0,0 +1,111 @@
+"""Provides leveled logging with optional JSON output and sampling.
+
+Modules log through get_logger(__name__) with %-style arguments, so the
+message is only formatted if a handler emits it. Structured data is passed
+as extra={'fields': {...}} and high-volume events can be sampled with
+extra={'sample': n}, which lets one record of the same message through for
+every n logged. Nothing is formatted for levels which are disabled.
+"""
+
+import json
+import logging
+import sys
+import threading
+
+# The logger all loggers of the node descend from
+ROOT_LOGGER = 'ballot'
+LOG_FORMATS = ('text', 'json')
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+
+def get_logger(name):
+    """Return the logger of a module.
+
+    Arguments:
+        :name: The name of the module (e.g. __name__).
+    """
+    return logging.getLogger('{}.{}'.format(ROOT_LOGGER, name))
+
+
+class SamplingFilter(logging.Filter):
+    """Lets one out of every n records of a message through, where n is the
+    sample attribute of the record (records without one always pass).
+    Records are counted by their unformatted message."""
+
+    def __init__(self):
+        super().__init__()
+        self.__counts = {}
+        self.__lock = threading.Lock()
+
+    def filter(self, record):
+        sample = getattr(record, 'sample', 1)
+        if sample <= 1:
+            return True
+        key = (record.name, record.msg)
+        with self.__lock:
+            count = self.__counts.get(key, 0)
+            self.__counts[key] = count + 1
+        if count % sample:
+            return False
+        record.sampled = sample
+        return True
+
+
+class TextFormatter(logging.Formatter):
+    """Formats records as text with their fields appended as key=value."""
+
+    def format(self, record):
+        line = super().format(record)
+        fields = dict(getattr(record, 'fields', {}))
+        if getattr(record, 'sampled', None):
+            fields['sampled'] = record.sampled
+        if fields:
+            line += ' ' + ' '.join(
+                '{}={}'.format(key, value) for key, value in fields.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            'time': record.created,
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if getattr(record, 'sampled', None):
+            entry['sampled'] = record.sampled
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure(level='INFO', log_format='text', stream=None):
+    """Set the level and the output format of the node's logs.
+
+    Arguments:
+        :level: The name of the lowest level which is logged.
+        :log_format: One of LOG_FORMATS.
+        :stream: Where the logs are written (default: stderr).
+    """
+    logger = logging.getLogger(ROOT_LOGGER)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    handler = logging.StreamHandler(stream or sys.stderr)
+    # Sampled records are dropped before they are formatted
+    handler.addFilter(SamplingFilter())
+    handler.setFormatter(
+        JsonFormatter() if log_format == 'json' else TextFormatter(
+            TEXT_FORMAT))
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+    # The development server logs every request at INFO
+    logging.getLogger('werkzeug').setLevel(level)
+
+
+configure()
@@ -0,0 +1,82 @@
+"""Provides merkle tree helpers for the votes of a block."""
+
+import json
+
+from utility.hash_util import hash_string_256
+
+
+def hash_vote(vote):
+    """Hashes a single vote into a merkle leaf.
+
+    Arguments:
+        :vote: The vote that should be hashed.
+    """
+    return hash_string_256(json.dumps(
+        [vote.voter, vote.candidate, vote.amount, vote.signature]).encode())
+
+
+def hash_pair(left, right):
+    """Hashes two child nodes into their parent node."""
+    return hash_string_256((left + right).encode())
+
+
+def merkle_levels(votes):
+    """Return all levels of the merkle tree over a list of votes, starting
+    with the leaves. An odd node at the end of a level is paired with
+    itself."""
+    level = [hash_vote(vt) for vt in votes]
+    levels = [level]
+    while len(level) > 1:
+        if len(level) % 2 == 1:
+            level = level + [level[-1]]
+        level = [hash_pair(level[i], level[i + 1])
+                 for i in range(0, len(level), 2)]
+        levels.append(level)
+    return levels
+
+
+def merkle_root(votes):
+    """Return the merkle root of a list of votes (None if it is empty).
+
+    Arguments:
+        :votes: The votes of the block.
+    """
+    if not votes:
+        return None
+    return merkle_levels(votes)[-1][0]
+
+
+def merkle_proof(votes, index):
+    """Return the inclusion proof of a vote: the sibling hashes on the path
+    from its leaf up to the root.
+
+    Arguments:
+        :votes: The votes of the block.
+        :index: The position of the vote in the block.
+    """
+    proof = []
+    for level in merkle_levels(votes)[:-1]:
+        if index % 2 == 1:
+            proof.append({'hash': level[index - 1], 'position': 'left'})
+        else:
+            sibling = index + 1 if index + 1 < len(level) else index
+            proof.append({'hash': level[sibling], 'position': 'right'})
+        index //= 2
+    return proof
+
+
+def verify_merkle_proof(leaf, proof, root):
+    """Check whether an inclusion proof leads from a leaf to the root.
+
+    Arguments:
+        :leaf: The hash of the vote (see hash_vote).
+        :proof: The proof returned by merkle_proof.
+        :root: The merkle root stored in the block.
+    """
+    current = leaf
+    for step in proof:
+        if step['position'] == 'left':
+            current = hash_pair(step['hash'], current)
+        else:
+            current = hash_pair(current, step['hash'])
+    return current == root
@@ -0,0 +1,178 @@
+"""Provides counters, gauges and histograms in the Prometheus text format.
+
+The metrics of a node are defined at the bottom of this module and are
+rendered by the /metrics route.
+"""
+
+from contextlib import contextmanager
+import threading
+from time import perf_counter
+
+# The default histogram buckets (seconds)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   2.5, 5.0, 10.0)
+
+
+def format_labels(names, values, extra=()):
+    """Render a label set as {name="value",...} (empty without labels)."""
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\')
+                         .replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A named metric whose values are kept per label set.
+
+    Attributes:
+        :name: The metric name.
+        :help: The description shown in the exposition.
+        :labels: The names of the labels every value is recorded with.
+    """
+    kind = 'untyped'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labels)
+
+    def samples(self):
+        """Return the (suffix, label values, extra labels, value) samples
+        of the metric."""
+        with self._lock:
+            return [('', key, (), value)
+                    for key, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.help),
+                 '# TYPE {} {}'.format(self.name, self.kind)]
+        for suffix, key, extra, value in self.samples():
+            lines.append('{}{}{} {}'.format(
+                self.name, suffix, format_labels(self.labels, key, extra),
+                format_value(value)))
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    """A value which only goes up."""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """A value which is set to the current state."""
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    """Counts observations in cumulative buckets and keeps their sum."""
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(
+                key, ([0] * len(self.buckets), 0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe how long the wrapped block takes (seconds)."""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start, **labels)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, counts):
+                    samples.append(
+                        ('_bucket', key, (('le', format_value(bound)),),
+                         count))
+                samples.append(('_sum', key, (), total))
+                samples.append(('_count', key, (), counts[-1]))
+        return samples
+
+
+class Registry:
+    """Holds the metrics which are exposed together."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Return all metrics in the Prometheus text format."""
+        return '\n'.join(metric.render() for metric in self.metrics) + '\n'
+
+
+registry = Registry()
+
+REQUEST_DURATION = registry.register(Histogram(
+    'node_request_duration_seconds', 'Time spent answering a request.',
+    ('route', 'method', 'status')))
+POW_DURATION = registry.register(Histogram(
+    'node_proof_of_work_duration_seconds',
+    'Time spent searching a proof of work.', ('election',)))
+POW_ATTEMPTS = registry.register(Counter(
+    'node_proof_of_work_attempts_total',
+    'Proof of work numbers which were tried.', ('election',)))
+SIGNATURE_VERIFICATIONS = registry.register(Counter(
+    'node_signature_verifications_total',
+    'Vote signatures which were verified.', ('scheme', 'valid')))
+SAVE_DURATION = registry.register(Histogram(
+    'node_save_duration_seconds', 'Time spent saving an election.',
+    ('election', 'storage')))
+STORAGE_BYTES = registry.register(Gauge(
+    'node_storage_bytes',
+    'Size of the stored election after the last save.',
+    ('election', 'storage')))
+MEMPOOL_VOTES = registry.register(Gauge(
+    'node_mempool_votes', 'Open votes waiting to be mined.', ('election',)))
+CHAIN_HEIGHT = registry.register(Gauge(
+    'node_chain_height', 'Blocks in the chain.', ('election',)))
+PEER_REQUEST_DURATION = registry.register(Histogram(
+    'node_peer_request_duration_seconds',
+    'Time until a peer answered a request.', ('election', 'path')))
+PEER_REQUEST_FAILURES = registry.register(Counter(
+    'node_peer_request_failures_total',
+    'Requests to peers which got no answer.', ('election', 'path')))
+RELAYS_DROPPED = registry.register(Counter(
+    'node_relays_dropped_total',
+    'Votes and blocks which were not relayed because the relay queue was '
+    'full.', ('election',)))
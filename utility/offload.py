@@ -0,0 +1,52 @@
+"""Runs CPU-heavy work (proof of work, batches of signature checks) in
+worker processes, so it does not hold the GIL of the serving process.
+Without a configured pool the work runs in the calling thread."""
+
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import signal
+
+executor = None
+
+
+def configure(processes):
+    """Start a pool of worker processes (0 runs the work inline).
+
+    Arguments:
+        :processes: The number of worker processes.
+    """
+    global executor
+    shutdown()
+    if processes > 0:
+        # Forking a process which serves requests on threads is unsafe
+        executor = ProcessPoolExecutor(
+            processes, mp_context=multiprocessing.get_context('spawn'),
+            initializer=ignore_signals)
+
+
+def ignore_signals():
+    """Leave SIGINT and SIGTERM to the serving process. Ctrl+C reaches
+    the whole process group, and workers killed by it would break the pool
+    and leak its semaphores; the serving process stops them instead."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+
+def shutdown():
+    """Stop the worker processes (waits for the running work)."""
+    global executor
+    if executor is not None:
+        executor.shutdown(cancel_futures=True)
+        executor = None
+
+
+def run(function, *args):
+    """Run a function in a worker process and wait for its result. The
+    function and its arguments must be picklable.
+
+    Arguments:
+        :function: A module level function or static method.
+    """
+    if executor is None:
+        return function(*args)
+    return executor.submit(function, *args).result()
@@ -0,0 +1,91 @@
+"""Provides on-demand cProfile sessions over live requests."""
+
+import cProfile
+import io
+import pstats
+import threading
+from time import time
+
+
+class RequestProfiler:
+    """Profiles the next requests a node serves, either a number of them or
+    all requests within a time window, and merges their statistics.
+
+    Attributes:
+        :remaining: The number of requests still to profile (None if the
+        session is bounded by time).
+        :deadline: When a time bounded session ends (None otherwise).
+        :profiled: The number of requests profiled in the session.
+    """
+
+    def __init__(self):
+        self.remaining = None
+        self.deadline = None
+        self.profiled = 0
+        self.__stats = None
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+
+    def start(self, requests=None, seconds=None):
+        """Start a new session which replaces the previous one.
+
+        Arguments:
+            :requests: The number of requests to profile.
+            :seconds: The length of the time window to profile.
+        """
+        with self.__lock:
+            self.remaining = requests
+            self.deadline = time() + seconds if seconds is not None else None
+            self.profiled = 0
+            self.__stats = None
+
+    @property
+    def active(self):
+        if self.remaining is not None:
+            return self.remaining > 0
+        return self.deadline is not None and time() < self.deadline
+
+    def begin_request(self):
+        """Start profiling the current request if a session is running."""
+        with self.__lock:
+            if not self.active:
+                return
+            if self.remaining is not None:
+                self.remaining -= 1
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is running in this interpreter
+            return
+        self.__local.profile = profile
+
+    def end_request(self):
+        """Stop profiling the current request and merge its statistics."""
+        profile = getattr(self.__local, 'profile', None)
+        if profile is None:
+            return
+        profile.disable()
+        self.__local.profile = None
+        with self.__lock:
+            if self.__stats is None:
+                self.__stats = pstats.Stats(profile)
+            else:
+                self.__stats.add(profile)
+            self.profiled += 1
+
+    def report(self, sort='cumulative', limit=40):
+        """Return the merged statistics as pstats text (None if nothing was
+        profiled yet).
+
+        Arguments:
+            :sort: The pstats sort key.
+            :limit: The number of functions listed.
+        """
+        with self.__lock:
+            if self.__stats is None:
+                return None
+            output = io.StringIO()
+            self.__stats.stream = output
+            self.__stats.sort_stats(sort).print_stats(limit)
+            return output.getvalue()
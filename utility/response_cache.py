@@ -0,0 +1,59 @@
+"""Provides a cache for serialized JSON responses."""
+
+from collections import OrderedDict
+import json
+import threading
+
+from utility.hash_util import hash_string_256
+from utility.compression import MIN_SIZE, compress
+
+
+# The number of responses kept by default
+CACHE_SIZE = 256
+
+
+class ResponseCache:
+    """Keeps the serialized body of a response together with its ETag until
+    the version of the data behind it changes. Only the latest version of
+    a response is kept, and the least recently used responses are dropped
+    once the cache is full."""
+
+    def __init__(self, capacity=CACHE_SIZE):
+        self.capacity = capacity
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, key, version, build, encoding=None):
+        """Return the (etag, body, encoding) of a response, serializing and
+        compressing it only if the cached one is outdated. Small bodies are
+        returned uncompressed (encoding None).
+
+        Arguments:
+            :key: Identifies the response (e.g. route and election).
+            :version: The version of the data the response is built from.
+            :build: Returns the data of the response if it is not cached.
+            :encoding: The Content-Encoding the client accepts (or None).
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None:
+                self.__entries.move_to_end(key)
+        if entry is None or entry[0] != version:
+            body = json.dumps(build()).encode()
+            etag = hash_string_256(
+                '{}:{}'.format(key, version).encode())[:32]
+            entry = (version, etag, {None: body})
+            with self.__lock:
+                self.__entries[key] = entry
+                self.__entries.move_to_end(key)
+                if len(self.__entries) > self.capacity:
+                    self.__entries.popitem(last=False)
+        bodies = entry[2]
+        if encoding is None or len(bodies[None]) < MIN_SIZE:
+            return entry[1], bodies[None], None
+        if encoding not in bodies:
+            bodies[encoding] = compress(bodies[None], encoding)
+        return entry[1], bodies[encoding], encoding
+
+    def __len__(self):
+        return len(self.__entries)
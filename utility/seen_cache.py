@@ -0,0 +1,37 @@
+"""Provides a bounded cache of the gossip messages a node has seen."""
+
+from collections import OrderedDict
+import threading
+
+
+class SeenCache:
+    """Remembers the digests of the latest votes and blocks a node has
+    handled, so duplicates can be dropped before they are parsed or
+    verified. The oldest digests are forgotten once the cache is full."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.__digests = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def add(self, digest):
+        """Remember a digest. Returns False if it was already known.
+
+        Arguments:
+            :digest: The hash of the vote or block.
+        """
+        with self.__lock:
+            if digest in self.__digests:
+                self.__digests.move_to_end(digest)
+                return False
+            self.__digests[digest] = True
+            if len(self.__digests) > self.capacity:
+                self.__digests.popitem(last=False)
+            return True
+
+    def __contains__(self, digest):
+        with self.__lock:
+            return digest in self.__digests
+
+    def __len__(self):
+        return len(self.__digests)
@@ -0,0 +1,91 @@
+"""Provides span tracing which breaks slow requests down into the time
+spent on their hot paths."""
+
+from collections import deque
+from functools import wraps
+import threading
+from time import perf_counter, time
+
+# The number of slow requests which are kept for inspection
+SLOW_TRACE_HISTORY = 100
+
+
+class Tracer:
+    """Records the spans of the request a thread is serving and keeps the
+    traces of requests which took longer than the threshold.
+
+    Attributes:
+        :threshold: The duration (seconds) from which a request counts as
+        slow (None disables tracing).
+    """
+
+    def __init__(self, threshold=None):
+        self.threshold = threshold
+        self.__slow = deque(maxlen=SLOW_TRACE_HISTORY)
+        self.__local = threading.local()
+
+    def begin(self, name):
+        """Start the trace of a request served by the current thread.
+
+        Arguments:
+            :name: Identifies the request (e.g. method and route).
+        """
+        if self.threshold is None:
+            return
+        self.__local.trace = {'name': name, 'start': perf_counter(),
+                              'spans': {}, 'open': set()}
+
+    def end(self):
+        """Finish the trace of the current thread and return it if the
+        request was slow (None otherwise)."""
+        trace = getattr(self.__local, 'trace', None)
+        self.__local.trace = None
+        if trace is None:
+            return None
+        duration = perf_counter() - trace['start']
+        if self.threshold is None or duration < self.threshold:
+            return None
+        slow = {
+            'request': trace['name'],
+            'finished': time(),
+            'duration_ms': duration * 1000,
+            'spans': [
+                {'name': name, 'calls': calls, 'total_ms': total * 1000}
+                for name, (calls, total) in sorted(
+                    trace['spans'].items(), key=lambda item: -item[1][1])]
+        }
+        self.__slow.append(slow)
+        return slow
+
+    def span(self, name):
+        """Decorate a function so its calls are recorded as spans of the
+        current request.
+
+        Arguments:
+            :name: The name the span is reported under.
+        """
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                trace = getattr(self.__local, 'trace', None)
+                # Nested calls of the same span are counted once
+                if trace is None or name in trace['open']:
+                    return function(*args, **kwargs)
+                trace['open'].add(name)
+                start = perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    calls, total = trace['spans'].get(name, (0, 0))
+                    trace['spans'][name] = (
+                        calls + 1, total + perf_counter() - start)
+                    trace['open'].discard(name)
+            return wrapper
+        return decorator
+
+    def slow_traces(self):
+        """Return the latest slow request traces, newest first."""
+        return list(reversed(self.__slow))
+
+
+tracer = Tracer()
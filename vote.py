@@ -11,19 +11,35 @@ class Vote(Printable):
         :candidate: The candidate of the votes.
         :signature: The signature of the vote.
         :amount: The amount of votes sent.
+        :scheme: The signature scheme of the vote (see ballot.SCHEMES).
     """
 
-    def __init__(self, voter, candidate, signature, amount):
+    def __init__(self, voter, candidate, signature, amount, scheme='rsa'):
         self.voter = voter
         self.candidate = candidate
         self.amount = amount
         self.signature = signature
+        self.scheme = scheme
 
     def to_ordered_dict(self):
         """Converts this vote into a (hashable) OrderedDict."""
-        return OrderedDict([
+        ordered_vote = OrderedDict([
                 ('voter', self.voter),
                 ('candidate', self.candidate),
                 ('amount', self.amount)
             ]
         )
+        # RSA votes leave the scheme out so older blocks keep their hash
+        if self.scheme != 'rsa':
+            ordered_vote['scheme'] = self.scheme
+        return ordered_vote
+
+    @classmethod
+    def from_dict(cls, values):
+        """Rebuild a vote from its dict representation."""
+        return cls(
+            values['voter'],
+            values['candidate'],
+            values['signature'],
+            values['amount'],
+            values.get('scheme', 'rsa'))
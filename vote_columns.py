@@ -0,0 +1,203 @@
+import threading
+
+import numpy as np
+
+# The number of rows the columns start with, they double when full
+INITIAL_CAPACITY = 1024
+# The most buckets a time series may have (limits the memory of a query)
+MAX_BUCKETS = 10000
+
+
+class TooManyBuckets(ValueError):
+    """Raised if a time series would need more than MAX_BUCKETS buckets."""
+
+
+class VoteColumns:
+    """A columnar copy of the confirmed votes of an election (mining
+    rewards excluded) for aggregate queries. Every column is a NumPy array,
+    so results, per-block counts and time series are computed without
+    looping over Vote objects.
+
+    Attributes:
+        :keys: The KeyDictionary the candidate ids refer to.
+        :height: The number of blocks which were appended.
+        :size: The number of votes in the columns.
+    """
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.height = 0
+        self.size = 0
+        self.__columns = {
+            'candidates': np.empty(INITIAL_CAPACITY, dtype=np.int64),
+            'amounts': np.empty(INITIAL_CAPACITY, dtype=np.float64),
+            'heights': np.empty(INITIAL_CAPACITY, dtype=np.int64),
+            'timestamps': np.empty(INITIAL_CAPACITY, dtype=np.float64)
+        }
+        self.__lock = threading.Lock()
+
+    @classmethod
+    def from_chain(cls, chain, keys):
+        """Build the columns from all blocks of a chain.
+
+        Arguments:
+            :chain: The blocks of the election.
+            :keys: The KeyDictionary of the election.
+        """
+        columns = cls(keys)
+        for block in chain:
+            columns.append_block(block)
+        return columns
+
+    def append_block(self, block):
+        """Append the votes of the next block.
+
+        Arguments:
+            :block: The block which was appended to the chain.
+        """
+        votes = [vt for vt in block.votes if vt.voter != 'MINING']
+        with self.__lock:
+            self.__reserve(self.size + len(votes))
+            end = self.size + len(votes)
+            columns = self.__columns
+            columns['candidates'][self.size:end] = [
+                self.keys.intern(vt.candidate) for vt in votes]
+            columns['amounts'][self.size:end] = [vt.amount for vt in votes]
+            columns['heights'][self.size:end] = block.index
+            columns['timestamps'][self.size:end] = block.timestamp
+            self.size = end
+            self.height = block.index + 1
+
+    def truncate(self, height):
+        """Drop the votes of all blocks from the given height on (used
+        when blocks are orphaned by a reorg).
+
+        Arguments:
+            :height: The number of blocks which are kept.
+        """
+        with self.__lock:
+            # Votes are appended block by block, so heights are sorted
+            self.size = int(np.searchsorted(
+                self.__columns['heights'][:self.size], height))
+            self.height = min(self.height, height)
+
+    def __reserve(self, size):
+        capacity = len(self.__columns['candidates'])
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        for name, column in self.__columns.items():
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            self.__columns[name] = grown
+
+    def __snapshot(self):
+        """Return copies of the filled part of the columns and the height,
+        so queries do not race with appended blocks."""
+        with self.__lock:
+            columns = tuple(
+                self.__columns[name][:self.size].copy()
+                for name in ('candidates', 'amounts', 'heights',
+                             'timestamps'))
+            return columns + (self.height,)
+
+    def results(self):
+        """Return the votes received per candidate."""
+        candidates, amounts, _, _, _ = self.__snapshot()
+        totals = np.bincount(candidates, weights=amounts)
+        return {self.keys.key(candidate_id): as_number(totals[candidate_id])
+                for candidate_id in np.unique(candidates)}
+
+    def block_counts(self):
+        """Return the number of votes in every block of the chain."""
+        _, _, heights, _, height = self.__snapshot()
+        return np.bincount(heights, minlength=height).tolist()
+
+    def time_series(self, bucket, candidate=None):
+        """Return the votes cast per time bucket together with the running
+        total. The buckets start with the bucket of the first confirmed
+        vote.
+
+        Arguments:
+            :bucket: The length of a bucket in seconds.
+            :candidate: Only count the votes of this candidate (None counts
+            all votes).
+        """
+        candidates, amounts, _, timestamps, _ = self.__snapshot()
+        if not len(timestamps):
+            return []
+        start, indexes = bucket_indexes(timestamps, bucket)
+        if candidate is not None:
+            # Keep zero weights so every candidate shares the same buckets
+            amounts = np.where(
+                candidates == self.keys.get_id(candidate, -1), amounts, 0)
+        totals = np.bincount(indexes, weights=amounts)
+        cumulative = np.cumsum(totals)
+        return [{'start': float(start + index * bucket),
+                 'votes': as_number(totals[index]),
+                 'cumulative': as_number(cumulative[index])}
+                for index in range(len(totals))]
+
+    def candidate_series(self, bucket):
+        """Return the votes per time bucket of every candidate, using the
+        buckets of time_series.
+
+        Arguments:
+            :bucket: The length of a bucket in seconds.
+        """
+        candidates, amounts, _, timestamps, _ = self.__snapshot()
+        if not len(timestamps):
+            return {}
+        _, indexes = bucket_indexes(timestamps, bucket)
+        candidate_ids, rows = np.unique(candidates, return_inverse=True)
+        # One row per candidate, one column per bucket
+        grid = np.zeros((len(candidate_ids), int(indexes.max()) + 1))
+        np.add.at(grid, (rows, indexes), amounts)
+        return {self.keys.key(candidate_id): [as_number(x) for x in row]
+                for candidate_id, row in zip(candidate_ids, grid)}
+
+
+def analytics(columns, bucket, candidate=None):
+    """Return aggregate statistics of the votes in the columns: the
+    results, the votes per block and the votes per time bucket (overall,
+    of every candidate and optionally of a single candidate).
+
+    Arguments:
+        :columns: The VoteColumns of the election.
+        :bucket: The length of a time bucket in seconds.
+        :candidate: The candidate whose time series is requested.
+    """
+    statistics = {
+        'height': columns.height,
+        'total_votes': columns.size,
+        'results': columns.results(),
+        'block_counts': columns.block_counts(),
+        'turnout': columns.time_series(bucket),
+        'candidates': columns.candidate_series(bucket)
+    }
+    if candidate is not None:
+        statistics['candidate'] = columns.time_series(bucket, candidate)
+    return statistics
+
+
+def bucket_indexes(timestamps, bucket):
+    """Return the start of the first bucket and the bucket index of every
+    timestamp. Raises TooManyBuckets before anything is allocated if the
+    votes span more than MAX_BUCKETS buckets.
+
+    Arguments:
+        :timestamps: The block timestamps of the votes.
+        :bucket: The length of a bucket in seconds.
+    """
+    start = np.floor(timestamps.min() / bucket) * bucket
+    if (timestamps.max() - start) // bucket >= MAX_BUCKETS:
+        raise TooManyBuckets(
+            'The votes span more than {} buckets.'.format(MAX_BUCKETS))
+    return start, ((timestamps - start) // bucket).astype(np.int64)
+
+
+def as_number(value):
+    """Convert a NumPy total into a JSON friendly int or float."""
+    value = float(value)
+    return int(value) if value.is_integer() else value